@@ -13,6 +13,7 @@ setup(
     author="Josef Schneider",
     author_email="josef.schneider@optiver.com.au",
     packages=find_packages(),
+    package_data={"switch_config_render": ["_examples/goldens/*.gz"]},
     install_requires=["svgwrite"],
     extras_require={"test": ["pytest", "pytest-cov"]},
     classifiers=[
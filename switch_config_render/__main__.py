@@ -1,7 +1,6 @@
+import sys
 
-from switch_config_render._examples.high_level_example import render_high_level_example
-from switch_config_render._examples.low_level_example import render_low_level_example
+from switch_config_render.cli import main
 
 if __name__ == "__main__":
-    render_high_level_example()
-    render_low_level_example()
+    sys.exit(main())
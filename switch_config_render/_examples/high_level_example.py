@@ -10,7 +10,11 @@ def get_mux_points():
     return [(1, 0), (0, 2), (4, 2), (3, 0), (1, 0)]
 
 
-def render_high_level_example():
+def get_high_level_example_system():
+    """
+    Gets the `generate_system_svg` keyword arguments of the high level
+    example, which are also part of the regression corpus
+    """
     # `interfaces` is a dict specifying all the front panel (et) and
     # FPGA application (ap) interfaces and their parameters
     #
@@ -196,13 +200,17 @@ def render_high_level_example():
         },
     ]
 
-    # Generate the SVG. `dominant_type` can be used to define an interface type that will override all other types
-    generate_system_svg(
-        "high_level_example.svg",
-        interfaces,
-        connections,
-        fpga_apps,
-        app_shapes,
-        dominant_type="tap",
-        onchip_connections=onchip_connections,
-    )
+    # `dominant_type` can be used to define an interface type that will override all other types
+    return {
+        "interfaces": interfaces,
+        "connections": connections,
+        "fpga_apps": fpga_apps,
+        "app_shapes": app_shapes,
+        "dominant_type": "tap",
+        "onchip_connections": onchip_connections,
+    }
+
+
+def render_high_level_example():
+    # Generate the SVG
+    generate_system_svg("high_level_example.svg", **get_high_level_example_system())
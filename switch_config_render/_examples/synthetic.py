@@ -0,0 +1,74 @@
+from switch_config_render._examples.high_level_example import (
+    get_hexagon_points,
+    get_mux_points,
+)
+
+_TYPES = ["type_a", "type_b", "type_c", "tap"]
+
+
+def get_synthetic_system(port_count, fpga_count=2, ports_per_app=4):
+    """
+    Builds the arguments for `generate_system_svg` for a synthetic switch
+    with `port_count` front panel ports, each cross-connected to its own
+    application port. The application ports are spread evenly over
+    `fpga_count` FPGAs and grouped into apps of `ports_per_app` ports.
+
+    >>> system = get_synthetic_system(8)
+    >>> len(system["interfaces"]), len(system["connections"])
+    (16, 16)
+    >>> sorted(system["fpga_apps"])
+    ['fpga_0', 'fpga_1']
+    """
+    interfaces = {}
+    connections = {}
+    fpga_apps = {"fpga_{}".format(i): {} for i in range(fpga_count)}
+    onchip_connections = []
+
+    ports_per_fpga = -(-port_count // fpga_count)
+    for idx in range(1, port_count + 1):
+        et = "et{}".format(idx)
+        ap = "ap{}".format(idx)
+        data_type = _TYPES[idx % len(_TYPES)]
+        interfaces[et] = {
+            "alias": "front_panel_{}".format(idx),
+            "description": "Front Panel {}".format(idx),
+            "receives": data_type,
+            "drives": data_type,
+        }
+        interfaces[ap] = {
+            "alias": "app_port_{}".format(idx),
+            "description": "App port {}".format(idx),
+            "receives": data_type,
+            "drives": data_type,
+        }
+        connections[ap] = et
+        connections[et] = ap
+
+        fpga_idx = (idx - 1) // ports_per_fpga
+        app_idx = ((idx - 1) % ports_per_fpga) // ports_per_app
+        app_name = "app_{}".format(app_idx)
+        apps = fpga_apps["fpga_{}".format(fpga_idx)]
+        if app_name not in apps:
+            apps[app_name] = {
+                "type": "mux" if app_idx % 2 else "custom",
+                "ports": [],
+            }
+        apps[app_name]["ports"].append(ap)
+
+    for fpga_id, apps in sorted(fpga_apps.items()):
+        if len(apps) > 1:
+            onchip_connections.append(
+                {
+                    "dst": "{}.app_1".format(fpga_id),
+                    "src": "{}.app_0".format(fpga_id),
+                    "desc": "Control",
+                }
+            )
+
+    return {
+        "interfaces": interfaces,
+        "connections": connections,
+        "fpga_apps": {k: v for k, v in fpga_apps.items() if v},
+        "app_shapes": {"custom": get_hexagon_points(), "mux": get_mux_points()},
+        "onchip_connections": onchip_connections,
+    }
@@ -0,0 +1,29 @@
+_PATH_FORMAT = "M%r,%r C%r,%r %r,%r %r,%r"
+
+
+def get_connection_path_data(src_coords, dst_coords):
+    """
+    Computes the path data of many Bezier connections in one go.
+    `src_coords` and `dst_coords` hold the `(anchor, control point)` pairs
+    of the connection endpoints (see `Canvas.add_connection_endpoint`).
+
+    The coordinates of all connections are gathered into rows, and every
+    path is then formatted with a single string operation. This gives the
+    same path data as `Canvas.render_connection` for float coordinates.
+
+    Formatting the coordinates dominates the cost. NumPy was tried for the
+    rows and the formatting, but converting the coordinates into arrays
+    and formatting them with NumPy's string functions is slower than
+    Python's `%` formatting at any size.
+
+    >>> src = [((10.0, 20.0), (10.0, 320.0))]
+    >>> dst = [((500.0, 900.5), (500.0, 600.5))]
+    >>> get_connection_path_data(src, dst)
+    ['M10.0,20.0 C10.0,320.0 500.0,600.5 500.0,900.5']
+    """
+    # Rows of: src anchor, src control point, dst control point, dst anchor
+    rows = [
+        (s[0][0], s[0][1], s[1][0], s[1][1], d[1][0], d[1][1], d[0][0], d[0][1])
+        for s, d in zip(src_coords, dst_coords)
+    ]
+    return [_PATH_FORMAT % row for row in rows]
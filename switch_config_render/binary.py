@@ -0,0 +1,383 @@
+"""
+A compact binary encoding of a `Layout`, for services that keep the layouts
+of many switches ready to serve. Files are read through `mmap` and
+`memoryview`, so opening one costs no parsing and only the records that are
+accessed are decoded.
+
+All values are little endian. The file starts with a header:
+
+    magic "SCRL", u16 version, u16 reserved, f64 width, f64 height
+
+followed by a table of `(u32 offset, u32 count)` entries, one per section:
+
+* string offsets: `count + 1` u32 offsets into the string data
+* string data: the strings, `count` bytes
+* boxes and apps: `u32 name, f64 x, f64 y, f64 width, f64 height`
+* ports: `u32 name, u32 collection, f64 x, f64 y, f64 width, f64 height`
+* connections: `u32 dst, u32 src, u32 kind, u32 types, u32 path,
+  u32 first point, u32 point count`
+* points: `f64 x, f64 y`, the control points of cubic connections and
+  the polyline vertices approximating all other connections (see
+  `switch_config_render.spatial.get_path_polylines`)
+* port index: u32 port record numbers, sorted by port name
+
+Names are indexes into the string table, whose strings are UTF-8 encoded.
+The types of a connection are stored as one entry of the string table
+holding every type as a u32 byte length followed by its UTF-8 encoding.
+Cubic connections are stored as their four control points only; other
+paths also keep their path data.
+
+The layout does not hold the text and shapes of the drawing, so the SVG
+document cannot be rebuilt from it. Keep the SVG next to the layout, for
+example with `switch_config_render.outputs.SvgzSink`.
+"""
+import mmap
+import struct
+
+from switch_config_render.layout import Layout
+from switch_config_render.spatial import get_path_polylines
+from switch_config_render.utils import format_point
+
+MAGIC = b"SCRL"
+VERSION = 2
+
+_NONE = 0xFFFFFFFF
+_HEADER = struct.Struct("<4sHHdd")
+_SECTION = struct.Struct("<II")
+_OFFSET = struct.Struct("<I")
+_RECT = struct.Struct("<I4d")
+_PORT = struct.Struct("<II4d")
+_CONNECTION = struct.Struct("<7I")
+_POINT = struct.Struct("<2d")
+
+(
+    _STRING_OFFSETS,
+    _STRING_DATA,
+    _BOXES,
+    _PORTS,
+    _APPS,
+    _CONNECTIONS,
+    _POINTS,
+    _PORT_INDEX,
+) = range(8)
+_SECTION_COUNT = 8
+
+
+def get_control_points(d):
+    """
+    Gets the control points of the path data `d` of a connection, and
+    whether they describe it exactly, which is the case for the cubic
+    curves of `Canvas.render_connection`
+
+    >>> get_control_points("M1.0,2.0 C1.0,5.0 3.0,5.0 3.0,8.0")
+    ([(1.0, 2.0), (1.0, 5.0), (3.0, 5.0), (3.0, 8.0)], True)
+    >>> get_control_points("M0,0 v10.0 h5.0")
+    ([(0.0, 0.0), (0.0, 10.0), (5.0, 10.0)], False)
+    """
+    tokens = d.replace(",", " ").split()
+    if len(tokens) == 8 and tokens[0][0] == "M" and tokens[2][0] == "C":
+        try:
+            values = [float(token.lstrip("MC")) for token in tokens]
+        except ValueError:
+            values = None
+        if values is not None:
+            points = list(zip(values[::2], values[1::2]))
+            if format_cubic_path(points) == d:
+                return points, True
+
+    polylines = get_path_polylines(d)
+    return [point for polyline in polylines for point in polyline], False
+
+
+def format_cubic_path(points):
+    return "M{} C{} {} {}".format(*[format_point(point) for point in points])
+
+
+def encode_types(types):
+    """
+    Encodes the types of a connection as length-prefixed strings, so that
+    they can hold any character
+
+    >>> encode_types(("type_a", "a\\nb"))
+    b'\\x06\\x00\\x00\\x00type_a\\x03\\x00\\x00\\x00a\\nb'
+    >>> decode_types(encode_types(("type_a", "a\\nb")))
+    ('type_a', 'a\\nb')
+    """
+    encoded = [text.encode("utf-8") for text in types]
+    return b"".join(_OFFSET.pack(len(text)) + text for text in encoded)
+
+
+def decode_types(data):
+    types = []
+    offset = 0
+    while offset < len(data):
+        (length,) = _OFFSET.unpack_from(data, offset)
+        offset += _OFFSET.size
+        types.append(bytes(data[offset : offset + length]).decode("utf-8"))
+        offset += length
+    return tuple(types)
+
+
+class _StringTable(object):
+    __slots__ = ("strings", "indexes")
+
+    def __init__(self):
+        self.strings = []
+        self.indexes = {}
+
+    def add(self, text):
+        if text is None:
+            return _NONE
+        if not isinstance(text, bytes):
+            text = text.encode("utf-8")
+        if text not in self.indexes:
+            self.indexes[text] = len(self.strings)
+            self.strings.append(text)
+        return self.indexes[text]
+
+
+def encode_layout(layout):
+    """Encodes a layout into the binary format and returns the bytes"""
+    strings = _StringTable()
+    sections = [b""] * _SECTION_COUNT
+    counts = [0] * _SECTION_COUNT
+
+    def rects(items):
+        return b"".join(
+            _RECT.pack(strings.add(name), *rect) for name, rect in items.items()
+        )
+
+    sections[_BOXES] = rects(layout.boxes)
+    counts[_BOXES] = len(layout.boxes)
+    sections[_APPS] = rects(layout.apps)
+    counts[_APPS] = len(layout.apps)
+
+    port_names = list(layout.ports)
+    sections[_PORTS] = b"".join(
+        _PORT.pack(strings.add(itf), strings.add(collection_id), *rect)
+        for itf, (collection_id, rect) in layout.ports.items()
+    )
+    counts[_PORTS] = len(port_names)
+    port_index = sorted(
+        range(len(port_names)), key=lambda idx: port_names[idx].encode("utf-8")
+    )
+    sections[_PORT_INDEX] = b"".join(_OFFSET.pack(idx) for idx in port_index)
+    counts[_PORT_INDEX] = len(port_index)
+
+    connections = []
+    points = []
+    for dst, src, kind, types, path in layout.connections:
+        control_points, exact = get_control_points(path)
+        connections.append(
+            _CONNECTION.pack(
+                strings.add(dst),
+                strings.add(src),
+                strings.add(kind),
+                strings.add(None if types is None else encode_types(types)),
+                _NONE if exact else strings.add(path),
+                len(points),
+                len(control_points),
+            )
+        )
+        points += control_points
+    sections[_CONNECTIONS] = b"".join(connections)
+    counts[_CONNECTIONS] = len(connections)
+    sections[_POINTS] = b"".join(_POINT.pack(x, y) for x, y in points)
+    counts[_POINTS] = len(points)
+
+    encoded = strings.strings
+    offsets = [0]
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    sections[_STRING_OFFSETS] = b"".join(_OFFSET.pack(offset) for offset in offsets)
+    counts[_STRING_OFFSETS] = len(encoded)
+    sections[_STRING_DATA] = b"".join(encoded)
+    counts[_STRING_DATA] = len(sections[_STRING_DATA])
+
+    def size(value):
+        return float("nan") if value is None else value
+
+    header = _HEADER.pack(MAGIC, VERSION, 0, size(layout.width), size(layout.height))
+    offset = len(header) + _SECTION.size * _SECTION_COUNT
+    table = []
+    for section, count in zip(sections, counts):
+        table.append(_SECTION.pack(offset, count))
+        offset += len(section)
+    return header + b"".join(table) + b"".join(sections)
+
+
+def write_binary_layout(filename, layout):
+    with open(filename, "wb") as fileobj:
+        fileobj.write(encode_layout(layout))
+
+
+class BinaryLayout(object):
+    """
+    A read-only view of an encoded layout in `buffer`, which can be any
+    object supporting the buffer protocol, such as `bytes` or an `mmap`.
+    Records are decoded when they are accessed and nothing is copied up
+    front, so keeping many layouts open only costs their pages in the OS
+    page cache.
+
+    >>> from switch_config_render.generate_svg import build_system_canvas
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> canvas = build_system_canvas(**get_synthetic_system(16))
+    >>> binary = BinaryLayout(encode_layout(canvas.layout))
+    >>> binary.get_port("et3")
+    ('front_panel_interfaces', (960.0, 150.0, 200.0, 150.0))
+    >>> binary.get_port("et99") is None
+    True
+    >>> binary.to_layout().to_dict() == canvas.layout.to_dict()
+    True
+
+    Fanout buses, bundles and square on-chip connections are stored with
+    their path data and the vertices of their polylines:
+
+    >>> from switch_config_render.spatial import get_path_polylines
+    >>> system = get_synthetic_system(16)
+    >>> system["connections"] = {"ap1": "et1", "ap5": "et1", "ap3": "et3", "ap4": "et4"}
+    >>> for itf in ("et3", "et4", "ap3", "ap4"):
+    ...     system["interfaces"][itf].update(receives="type_a", drives="type_a")
+    >>> canvas = build_system_canvas(fanout_threshold=2, bundle_tolerance=300, **system)
+    >>> binary = BinaryLayout(encode_layout(canvas.layout))
+    >>> connections = list(binary.iter_connections())
+    >>> sorted(set(path.split()[1][0] for _, _, kind, _, path, _ in connections))
+    ['C', 'Q', 'V', 'v']
+    >>> all(points == [point for polyline in get_path_polylines(path) for point in polyline]
+    ...     for _, _, _, _, path, points in connections if path.split()[1][0] != "C")
+    True
+    >>> set(len(points) for _, _, _, _, path, points in connections if path.split()[1][0] == "C")
+    {4}
+    >>> binary.to_layout().to_dict() == canvas.layout.to_dict()
+    True
+    """
+
+    __slots__ = ("buffer", "width", "height", "sections", "_mmap")
+
+    def __init__(self, buffer):
+        self._mmap = None
+        self.buffer = memoryview(buffer)
+        magic, version, _, width, height = _HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("not a binary layout")
+        if version != VERSION:
+            raise ValueError("unsupported binary layout version {}".format(version))
+        # NaN marks a layout without a size
+        self.width = None if width != width else width
+        self.height = None if height != height else height
+        self.sections = [
+            _SECTION.unpack_from(self.buffer, _HEADER.size + idx * _SECTION.size)
+            for idx in range(_SECTION_COUNT)
+        ]
+
+    @classmethod
+    def open(cls, filename):
+        """Maps the file `filename` into memory. Close it with `close`."""
+        with open(filename, "rb") as fileobj:
+            mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        binary = cls(mapped)
+        binary._mmap = mapped
+        return binary
+
+    def close(self):
+        self.buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_bytes(self, idx):
+        """Gets the entry `idx` of the string table, without copying it"""
+        offsets = self.sections[_STRING_OFFSETS][0]
+        data = self.sections[_STRING_DATA][0]
+        start, end = struct.unpack_from("<II", self.buffer, offsets + idx * 4)
+        return self.buffer[data + start : data + end]
+
+    def get_string(self, idx):
+        if idx == _NONE:
+            return None
+        return self.get_bytes(idx).tobytes().decode("utf-8")
+
+    def iter_records(self, section, record):
+        offset, count = self.sections[section]
+        for idx in range(count):
+            yield record.unpack_from(self.buffer, offset + idx * record.size)
+
+    def get_record(self, section, record, idx):
+        return record.unpack_from(self.buffer, self.sections[section][0] + idx * record.size)
+
+    def iter_boxes(self):
+        for values in self.iter_records(_BOXES, _RECT):
+            yield self.get_string(values[0]), values[1:]
+
+    def iter_apps(self):
+        for values in self.iter_records(_APPS, _RECT):
+            yield self.get_string(values[0]), values[1:]
+
+    def iter_ports(self):
+        for values in self.iter_records(_PORTS, _PORT):
+            yield self.get_string(values[0]), self.get_string(values[1]), values[2:]
+
+    def get_port(self, itf):
+        """
+        Looks up the collection and rect of the port `itf` by a binary
+        search, or returns None if the layout has no such port
+        """
+        name = itf.encode("utf-8")
+        low, high = 0, self.sections[_PORT_INDEX][1]
+        while low < high:
+            middle = (low + high) // 2
+            (idx,) = self.get_record(_PORT_INDEX, _OFFSET, middle)
+            values = self.get_record(_PORTS, _PORT, idx)
+            middle_name = self.get_string(values[0]).encode("utf-8")
+            if middle_name < name:
+                low = middle + 1
+            elif middle_name > name:
+                high = middle
+            else:
+                return self.get_string(values[1]), values[2:]
+        return None
+
+    def iter_connections(self):
+        """
+        Yields the `(dst, src, kind, types, path, points)` of every
+        connection, where `points` are its control points
+        """
+        for dst, src, kind, types, path, first, count in self.iter_records(
+            _CONNECTIONS, _CONNECTION
+        ):
+            points = [
+                self.get_record(_POINTS, _POINT, idx) for idx in range(first, first + count)
+            ]
+            types = None if types == _NONE else decode_types(self.get_bytes(types))
+            path = self.get_string(path)
+            if path is None:
+                path = format_cubic_path(points)
+            yield (
+                self.get_string(dst),
+                self.get_string(src),
+                self.get_string(kind),
+                types,
+                path,
+                points,
+            )
+
+    def to_layout(self):
+        """Decodes all the records into a `Layout`"""
+        layout = Layout()
+        layout.width = self.width
+        layout.height = self.height
+        for name, rect in self.iter_boxes():
+            layout.add_box(name, rect)
+        for itf, collection_id, rect in self.iter_ports():
+            layout.add_port(itf, collection_id, rect)
+        for name, rect in self.iter_apps():
+            layout.add_app(name, rect)
+        for dst, src, kind, types, path, _ in self.iter_connections():
+            layout.add_connection(dst, src, kind, types, path)
+        return layout
@@ -0,0 +1,94 @@
+import timeit
+
+# Degradation levels, from full detail to a summary box. Every level keeps
+# the reductions of the levels before it.
+DEGRADATION_NONE = 0
+DEGRADATION_NO_TEXT = 1  # No interface alias and description text
+DEGRADATION_AGGREGATED = 2  # Connections merged into one path per type
+DEGRADATION_SUMMARY = 3  # A single box summarising the system
+
+DEGRADATION_NAMES = ("none", "no_text", "aggregated", "summary")
+
+# The time a render takes per estimated SVG element, measured on synthetic
+# systems and rounded up
+DEFAULT_SECONDS_PER_ELEMENT = 50e-6
+
+
+class RenderBudgetExceeded(Exception):
+    """Raised while rendering once the deadline of a `RenderBudget` has passed"""
+
+
+class RenderBudget(object):
+    """
+    Limits a render to at most `max_elements` SVG elements and/or
+    `deadline` seconds of wall-clock time. Renders that would exceed the
+    budget are degraded level by level (see `DEGRADATION_NAMES`), down to a
+    summary box whose size does not depend on the system. The render time
+    of a level is estimated at `seconds_per_element` per estimated element.
+    Time is measured with `timer`, a function returning seconds.
+
+    The deadline only covers laying out and drawing the system; writing the
+    SVG document out afterwards is not included.
+    """
+
+    __slots__ = ("max_elements", "deadline", "seconds_per_element", "timer")
+
+    def __init__(
+        self,
+        max_elements=None,
+        deadline=None,
+        seconds_per_element=DEFAULT_SECONDS_PER_ELEMENT,
+        timer=timeit.default_timer,
+    ):
+        self.max_elements = max_elements
+        self.deadline = deadline
+        self.seconds_per_element = seconds_per_element
+        self.timer = timer
+
+    def start(self):
+        """Returns the timer value at which a render started now runs out of time"""
+        if self.deadline is None:
+            return None
+        return self.timer() + self.deadline
+
+    def allows(self, element_count):
+        return self.max_elements is None or element_count <= self.max_elements
+
+    def estimate_seconds(self, element_count):
+        return element_count * self.seconds_per_element
+
+
+def estimate_element_count(
+    interfaces, connections, fpga_apps, onchip_connections, degradation
+):
+    """
+    Estimates the number of SVG elements of a render at the given
+    degradation level from the size of the inputs, without laying them out.
+
+    >>> interfaces = {'et1': {'alias': 'a', 'description': 'b'}, 'ap1': {}}
+    >>> fpga_apps = {'fpga': {'app': {'type': 'mux', 'ports': ['ap1']}}}
+    >>> [estimate_element_count(interfaces, {'ap1': 'et1'}, fpga_apps, None, level)
+    ...  for level in range(DEGRADATION_SUMMARY)]
+    [28, 24, 24]
+    """
+    elements = 0
+    for params in interfaces.values():
+        # The interface group, box, name and two connector boxes at most
+        elements += 5
+        if degradation < DEGRADATION_NO_TEXT:
+            elements += 1 + ("alias" in params) + ("description" in params)
+
+    app_ports = 0
+    for apps in fpga_apps.values():
+        elements += 3 * len(apps) + 1
+        for params in apps.values():
+            app_ports += len(params["ports"])
+
+    onchip_count = len(onchip_connections) if onchip_connections else 0
+    if degradation < DEGRADATION_AGGREGATED:
+        elements += len(connections) + app_ports + 2 * onchip_count
+    else:
+        elements += min(len(connections), 1) + len(fpga_apps) + 2 * onchip_count
+
+    # The background, the definitions, the connections group and the legend
+    return elements + 8
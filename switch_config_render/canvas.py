@@ -1,15 +1,105 @@
 import colorsys
+import timeit
+
+from switch_config_render.batch import get_connection_path_data
+from switch_config_render.budget import DEGRADATION_NONE, RenderBudgetExceeded
+from switch_config_render.layout import Layout
+from switch_config_render.template import DEFAULT_TEMPLATE
+from switch_config_render.utils import format_point
+
+# The distance between the bars of fanout buses that overlap horizontally
+_FANOUT_LANE_SPACING = 20
+
+
+def get_arrowhead_commands(tip, direction):
+    """
+    Gets the path commands of a filled arrowhead pointing vertically at
+    `tip`: downwards if `direction` is positive, upwards otherwise. The
+    arrowhead has the proportions of the arrowhead markers on a connection
+    with a stroke width of 6.
+
+    >>> get_arrowhead_commands((100, 50), 1)
+    ['M88,26', 'L112,26', 'L100,50', 'Z']
+    """
+    base_y = tip[1] - 24 if direction > 0 else tip[1] + 24
+    return [
+        "M" + format_point((tip[0] - 12, base_y)),
+        "L" + format_point((tip[0] + 12, base_y)),
+        "L" + format_point(tip),
+        "Z",
+    ]
+
+
+def get_palette_colour(idx):
+    """
+    Gets the colour for the `idx`-th connection type. Colours cycle through
+    `Canvas.HUES`, lowering the saturation on every cycle.
+
+    >>> get_palette_colour(0)
+    '#F20C0C'
+    >>> get_palette_colour(len(Canvas.HUES))
+    '#D82626'
+    """
+    hue_idx = idx % len(Canvas.HUES)
+    saturation = 0.9
+    for _ in range(idx // len(Canvas.HUES)):
+        saturation -= 0.2
+        if saturation <= 0.0:
+            saturation = 1.0
+
+    rgb = colorsys.hls_to_rgb(Canvas.HUES[hue_idx], 0.5, saturation)
+    rgb_255 = tuple(int(255 * v) for v in rgb)
+    return "#{:02X}{:02X}{:02X}".format(*rgb_255)
 
 
 class Canvas(object):
     # An exquisite, hand-picked selection of colours that are easy to
     # distinguish. Scanning linearly yields a lot of green
     # Note: not colour-vision deficiency optimised
-    HUES = [0.0, 0.091, 0.15, 0.305, 0.475, 0.563, 0.68, 0.764, 0.883]
+    HUES = (0.0, 0.091, 0.15, 0.305, 0.475, 0.563, 0.68, 0.764, 0.883)
 
-    def __init__(self, drawing):
+    __slots__ = (
+        "drawing",
+        "x_connect_src_endpoints",
+        "x_connect_dst_endpoints",
+        "ap_src_coords",
+        "ap_dst_coords",
+        "onchip_src_coords",
+        "onchip_dst_coords",
+        "ap_coords",
+        "connections",
+        "layout",
+        "end_marker",
+        "start_marker",
+        "connection_colours",
+        "element_groups",
+        "degradation",
+        "deadline",
+        "timer",
+        "content_hash",
+        "template",
+        "fanout_bars",
+    )
+
+    def __init__(
+        self,
+        drawing,
+        degradation=DEGRADATION_NONE,
+        deadline=None,
+        template=None,
+        timer=None,
+    ):
         self.drawing = drawing
 
+        # How much detail to leave out, see `switch_config_render.budget`,
+        # and the value of `timer` after which rendering is abandoned
+        self.degradation = degradation
+        self.deadline = deadline
+        self.timer = timer or timeit.default_timer
+
+        # The digest of the inputs embedded in the document, if any
+        self.content_hash = None
+
         self.x_connect_src_endpoints = {}
         self.x_connect_dst_endpoints = {}
         self.ap_src_coords = {}
@@ -19,38 +109,44 @@ class Canvas(object):
 
         self.ap_coords = {}
         self.connections = None
+        self.layout = Layout()
 
-        # Create the arrowhead markers
-        self.end_marker = drawing.marker(insert=(5, 3), size=(6, 6), orient="auto")
-        self.end_marker.add(
-            drawing.path(["M1,1", "L1,5", "L5,3", "L1,1"], fill="black")
-        )
-        self.start_marker = drawing.marker(insert=(1, 3), size=(6, 6), orient="auto")
-        self.start_marker.add(
-            drawing.path(["M1,3", "L5,5", "L5,1", "L1,3"], fill="black")
-        )
-        drawing.defs.add(self.end_marker)
-        drawing.defs.add(self.start_marker)
+        # Maps the ids of the top level and connection SVG elements onto the
+        # logical group they belong to, e.g. "front_panel" or "legend"
+        self.element_groups = {}
+
+        # The arrowhead markers and other shared definitions
+        template = template or DEFAULT_TEMPLATE
+        self.template = template
+        self.end_marker = template.end_marker
+        self.start_marker = template.start_marker
+        template.add_defs(drawing)
+        self.element_groups[id(drawing.defs)] = "defs"
 
         self.connection_colours = {}
-        self.hue_idx = 0
-        self.saturation = 0.9
 
-    def get_colour_for_types(self, types):
-        if types in self.connection_colours:
-            return self.connection_colours[types]
+        # The x extents and lanes of the fanout bars drawn so far, per base
+        # height of the bars
+        self.fanout_bars = {}
 
-        rgb = colorsys.hls_to_rgb(Canvas.HUES[self.hue_idx], 0.5, self.saturation)
-        rgb_255 = tuple(int(255 * v) for v in rgb)
+    def add(self, element, group, parent=None):
+        """
+        Adds `element` to `parent`, or to the top level of the drawing, and
+        records the logical `group` it belongs to (see
+        `switch_config_render.stats`)
+        """
+        self.element_groups[id(element)] = group
+        return (parent or self.drawing).add(element)
 
-        self.hue_idx += 1
-        if self.hue_idx >= len(Canvas.HUES):
-            self.hue_idx = 0
-            self.saturation -= 0.2
-            if self.saturation <= 0.0:
-                self.saturation = 1.0
+    def check_deadline(self):
+        if self.deadline is not None and self.timer() > self.deadline:
+            raise RenderBudgetExceeded()
 
-        self.connection_colours[types] = "#{:02X}{:02X}{:02X}".format(*rgb_255)
+    def get_colour_for_types(self, types):
+        if types not in self.connection_colours:
+            self.connection_colours[types] = get_palette_colour(
+                len(self.connection_colours)
+            )
         return self.connection_colours[types]
 
     def get_connections_svg_group(self):
@@ -59,36 +155,267 @@ class Canvas(object):
             self.connections = self.drawing.add(self.drawing.g(id="connections"))
         return self.connections
 
-    def render_connection(self, dst, src, bidir, onchip, types=None, nodir=False):
-        conn_grp = self.get_connections_svg_group()
-
+    def get_connection_coords(self, dst, src, bidir, onchip):
         dst_endpoints = self.ap_dst_coords if onchip else self.x_connect_dst_endpoints
         src_endpoints = self.ap_src_coords if onchip else self.x_connect_src_endpoints
 
-        dst_coords = dst_endpoints[dst]
-        src_coords = src_endpoints[src]
-
         # Src coords are slightly to the left, while dst coords are slightly to the right of the connection point.
         # If the connection is bidirectional we want the src coords to be slightly to the right so that the direction
         # of other connections that are sourced from this endpoint are easy to tell apart
         if bidir:
-            src_coords = dst_endpoints[src]
+            return dst_endpoints[src], dst_endpoints[dst]
+        return src_endpoints[src], dst_endpoints[dst]
 
-        line = conn_grp.add(
+    def render_connection(
+        self, dst, src, bidir, onchip, types=None, nodir=False, group=None
+    ):
+        src_coords, dst_coords = self.get_connection_coords(dst, src, bidir, onchip)
+        commands = [
+            "M" + format_point(src_coords[0]),
+            "C" + format_point(src_coords[1]),
+            format_point(dst_coords[1]),
+            format_point(dst_coords[0]),
+        ]
+        return self.add_connection_path(
+            dst, src, " ".join(commands), bidir, onchip, types, nodir, group
+        )
+
+    def render_aggregated_connections(self, connections, onchip, group=None):
+        """
+        Renders the connections, given as `(dst, src, bidir, types)` tuples,
+        as one path without arrowheads per distinct `types`. Used for renders
+        that have to be degraded to stay within their budget.
+        """
+        by_types = {}
+        for dst, src, bidir, types in connections:
+            by_types.setdefault(types, []).append((dst, src, bidir))
+
+        conn_grp = self.get_connections_svg_group()
+        if group is None:
+            group = "app_links" if onchip else "cross_connects"
+        for types, type_connections in by_types.items():
+            self.check_deadline()
+            coords = [
+                self.get_connection_coords(dst, src, bidir, onchip)
+                for dst, src, bidir in type_connections
+            ]
+            path_data = get_connection_path_data(
+                [src for src, _ in coords], [dst for _, dst in coords]
+            )
+            for (dst, src, _), d in zip(type_connections, path_data):
+                self.layout.add_connection(
+                    dst, src, "app_link" if onchip else "cross_connect", types, d
+                )
+            self.add(
+                self.drawing.path(
+                    " ".join(path_data),
+                    fill="none",
+                    stroke=self.get_colour_for_types(types) if types else "black",
+                    stroke_width=4 if onchip else 6,
+                ),
+                group,
+                conn_grp,
+            )
+
+    def add_connection_path(self, dst, src, d, bidir, onchip, types, nodir, group):
+        self.check_deadline()
+        conn_grp = self.get_connections_svg_group()
+        self.layout.add_connection(
+            dst, src, "app_link" if onchip else "cross_connect", types, d
+        )
+        if group is None:
+            group = "app_links" if onchip else "cross_connects"
+        line = self.add(
             self.drawing.path(
-                ["M" + src_coords[0], "C" + src_coords[1]] + dst_coords[::-1],
+                d,
                 fill="none",
                 stroke=self.get_colour_for_types(types) if types else "black",
                 stroke_width=4 if onchip else 6,
-            )
+            ),
+            group,
+            conn_grp,
         )
         if not nodir:
             if bidir:
                 line.set_markers((self.start_marker, None, self.end_marker))
             else:
                 line.set_markers((None, None, self.end_marker))
+        return line
+
+    def render_fanout(self, src, dsts, types=None):
+        """
+        Renders the connections from the `src` endpoint to every endpoint in
+        `dsts` as a single bus: a trunk from the source to a horizontal bar,
+        with a short branch from the bar to each destination. Arrowheads are
+        drawn as one additional path, so the bus costs two SVG elements
+        regardless of the number of destinations. The bars of buses that
+        overlap horizontally are staggered into lanes, so that they can be
+        told apart.
+
+        >>> from switch_config_render.generate_svg import build_system_canvas
+        >>> from switch_config_render._examples.synthetic import get_synthetic_system
+        >>> system = get_synthetic_system(8)
+        >>> system["connections"] = {"ap1": "et1", "ap5": "et1", "ap2": "et2", "ap6": "et2"}
+        >>> canvas = build_system_canvas(fanout_threshold=2, **system)
+        >>> sorted((src, path.split()[1]) for _, src, _, _, path in canvas.layout.connections
+        ...        if path.split()[1].startswith("V"))
+        [('et1', 'V640.0'), ('et1', 'V640.0'), ('et2', 'V660.0'), ('et2', 'V660.0')]
+        """
+        conn_grp = self.get_connections_svg_group()
+        colour = self.get_colour_for_types(types) if types else "black"
+
+        src_anchor, src_control = self.x_connect_src_endpoints[src]
+        dst_endpoints = [self.x_connect_dst_endpoints[dst] for dst in dsts]
+
+        # The bar runs halfway between the source and destination control
+        # points, which keeps it clear of the interface boxes
+        dst_control_y = sum(control[1] for _, control in dst_endpoints) / float(
+            len(dst_endpoints)
+        )
+        bar_y = (src_control[1] + dst_control_y) / 2.0
+        bar_xs = [src_anchor[0]] + [anchor[0] for anchor, _ in dst_endpoints]
+
+        # Take the first lane that is free across the x extent of the bar,
+        # moving towards the destinations with every lane
+        bars = self.fanout_bars.setdefault(bar_y, [])
+        taken = set(
+            lane
+            for min_x, max_x, lane in bars
+            if min_x <= max(bar_xs) and min(bar_xs) <= max_x
+        )
+        lane = 0
+        while lane in taken:
+            lane += 1
+        bars.append((min(bar_xs), max(bar_xs), lane))
+        direction = 1 if dst_control_y >= src_control[1] else -1
+        bar_y += direction * lane * _FANOUT_LANE_SPACING
+
+        commands = [
+            "M" + format_point(src_anchor),
+            "V" + str(bar_y),
+            "M" + format_point((min(bar_xs), bar_y)),
+            "H" + str(max(bar_xs)),
+        ]
+        arrows = []
+        for dst, (anchor, _) in zip(dsts, dst_endpoints):
+            commands += ["M" + format_point((anchor[0], bar_y)), "V" + str(anchor[1])]
+            self.layout.add_connection(
+                dst,
+                src,
+                "cross_connect",
+                types,
+                "M{} V{} H{} V{}".format(
+                    format_point(src_anchor), bar_y, anchor[0], anchor[1]
+                ),
+            )
 
-    def render_square_connection(self, dst, src, desc, lower_y_coord):
+            arrows += get_arrowhead_commands(anchor, 1 if anchor[1] > bar_y else -1)
+
+        self.add(
+            self.drawing.path(commands, fill="none", stroke=colour, stroke_width=6),
+            "cross_connects",
+            conn_grp,
+        )
+        self.add(
+            self.drawing.path(arrows, fill=colour, stroke="none"),
+            "cross_connects",
+            conn_grp,
+        )
+
+    def render_bundle(self, connections, types=None):
+        """
+        Renders cross-connects of the same `types` that run between similar
+        x-ranges along a shared corridor. `connections` is a list of
+        `(dst, src, bidir)` tuples. Every connection leads from its source
+        into the corridor and out of it to its destination, and the whole
+        bundle is drawn as one path plus one path holding the arrowheads.
+
+        >>> from switch_config_render.generate_svg import build_system_canvas
+        >>> from switch_config_render._examples.synthetic import get_synthetic_system
+        >>> system = get_synthetic_system(8)
+        >>> system["connections"] = {"ap1": "et1", "ap2": "et2"}
+        >>> for itf in ("et1", "et2", "ap1", "ap2"):
+        ...     system["interfaces"][itf].update(receives="type_a", drives="type_a")
+        >>> canvas = build_system_canvas(bundle_tolerance=300, **system)
+        >>> for _, _, _, _, path in canvas.layout.connections[:2]:
+        ...     print(path)
+        M510.0,300.0 Q510.0,600.0 640.0,600.0 C640.0,620.0 470.0,620.0 470.0,640.0 Q340.0,640.0 340.0,940.0
+        M770.0,300.0 Q770.0,600.0 640.0,600.0 C640.0,620.0 470.0,620.0 470.0,640.0 Q600.0,640.0 600.0,940.0
+        """
+        conn_grp = self.get_connections_svg_group()
+        colour = self.get_colour_for_types(types) if types else "black"
+
+        ends = []
+        for dst, src, bidir in connections:
+            src_endpoints = (
+                self.x_connect_dst_endpoints if bidir else self.x_connect_src_endpoints
+            )
+            ends.append(
+                (dst, src, bidir, src_endpoints[src], self.x_connect_dst_endpoints[dst])
+            )
+
+        # The corridor runs between the averaged control points of both ends
+        count = float(len(ends))
+        corridor_entry = (
+            sum(src[0][0] for _, _, _, src, _ in ends) / count,
+            sum(src[1][1] for _, _, _, src, _ in ends) / count,
+        )
+        corridor_exit = (
+            sum(dst[0][0] for _, _, _, _, dst in ends) / count,
+            sum(dst[1][1] for _, _, _, _, dst in ends) / count,
+        )
+        mid_y = (corridor_entry[1] + corridor_exit[1]) / 2.0
+        corridor = "C{} {} {}".format(
+            format_point((corridor_entry[0], mid_y)),
+            format_point((corridor_exit[0], mid_y)),
+            format_point(corridor_exit),
+        )
+
+        commands = ["M" + format_point(corridor_entry), corridor]
+        arrows = []
+        for dst, src, bidir, (src_anchor, _), (dst_anchor, _) in ends:
+            lead_in = [
+                "M" + format_point(src_anchor),
+                "Q" + format_point((src_anchor[0], corridor_entry[1])),
+                format_point(corridor_entry),
+            ]
+            lead_out = [
+                "M" + format_point(corridor_exit),
+                "Q" + format_point((dst_anchor[0], corridor_exit[1])),
+                format_point(dst_anchor),
+            ]
+            commands += lead_in + lead_out
+            self.layout.add_connection(
+                dst,
+                src,
+                "cross_connect",
+                types,
+                " ".join(lead_in + [corridor] + lead_out[1:]),
+            )
+
+            arrows += get_arrowhead_commands(
+                dst_anchor, dst_anchor[1] - corridor_exit[1]
+            )
+            if bidir:
+                arrows += get_arrowhead_commands(
+                    src_anchor, src_anchor[1] - corridor_entry[1]
+                )
+
+        self.add(
+            self.drawing.path(commands, fill="none", stroke=colour, stroke_width=6),
+            "cross_connects",
+            conn_grp,
+        )
+        self.add(
+            self.drawing.path(arrows, fill=colour, stroke="none"),
+            "cross_connects",
+            conn_grp,
+        )
+
+    def render_square_connection(
+        self, dst, src, desc, lower_y_coord, group="onchip_links"
+    ):
+        self.check_deadline()
         conn_grp = self.get_connections_svg_group()
         arc_radius = 50
 
@@ -104,20 +431,24 @@ class Canvas(object):
             left_coords = dst_coords
             right_coords = src_coords
 
-        line = conn_grp.add(
+        commands = [
+            "M{},{}".format(*left_coords),
+            "v" + str(lower_y_coord - left_coords[1] - arc_radius),
+            "a{r},{r} 0 0 0 {r},{r}".format(r=arc_radius),
+            "h" + str(right_coords[0] - left_coords[0] - 2 * arc_radius),
+            "a{r},{r} 0 0 0 {r},-{r}".format(r=arc_radius),
+            "L{},{}".format(*right_coords),
+        ]
+        self.layout.add_connection(dst, src, "onchip", None, " ".join(commands))
+        line = self.add(
             self.drawing.path(
-                [
-                    "M{},{}".format(*left_coords),
-                    "v" + str(lower_y_coord - left_coords[1] - arc_radius),
-                    "a{r},{r} 0 0 0 {r},{r}".format(r=arc_radius),
-                    "h" + str(right_coords[0] - left_coords[0] - 2 * arc_radius),
-                    "a{r},{r} 0 0 0 {r},-{r}".format(r=arc_radius),
-                    "L{},{}".format(*right_coords),
-                ],
+                commands,
                 fill="none",
                 stroke="black",
                 stroke_width=4,
-            )
+            ),
+            group,
+            conn_grp,
         )
 
         desc_coords = (left_coords[0] + 40, lower_y_coord - 10)
@@ -127,70 +458,74 @@ class Canvas(object):
         else:
             line.set_markers((self.start_marker, None, None))
 
-        conn_grp.add(
+        self.add(
             self.drawing.text(
                 str(desc),
                 insert=desc_coords,
                 font_size=20,
                 fill="black",
                 style="font-family:monospace",
-            )
+            ),
+            group,
+            conn_grp,
         )
 
     def add_connection_endpoint(
         self, endpoint_name, endpoint_type, lower_mid, upper_mid
     ):
+        # Connections start or end at the anchor point and leave it towards
+        # the control point: (anchor, control point)
         def bezier_coords(coords, x_offset=0, y_offset=0):
-            return "{},{}".format(str(coords[0] + x_offset), str(coords[1] + y_offset))
+            return (coords[0] + x_offset, coords[1] + y_offset)
 
         if endpoint_type == "et_itf":
-            self.x_connect_src_endpoints[endpoint_name] = [
+            self.x_connect_src_endpoints[endpoint_name] = (
                 bezier_coords(lower_mid, x_offset=-30),
                 bezier_coords(lower_mid, x_offset=-30, y_offset=300),
-            ]
-            self.x_connect_dst_endpoints[endpoint_name] = [
+            )
+            self.x_connect_dst_endpoints[endpoint_name] = (
                 bezier_coords(lower_mid, x_offset=30),
                 bezier_coords(lower_mid, x_offset=30, y_offset=300),
-            ]
+            )
         elif endpoint_type == "ap_itf":
-            self.x_connect_src_endpoints[endpoint_name] = [
+            self.x_connect_src_endpoints[endpoint_name] = (
                 bezier_coords(upper_mid, x_offset=-30),
                 bezier_coords(upper_mid, x_offset=-30, y_offset=-300),
-            ]
-            self.x_connect_dst_endpoints[endpoint_name] = [
+            )
+            self.x_connect_dst_endpoints[endpoint_name] = (
                 bezier_coords(upper_mid, x_offset=30),
                 bezier_coords(upper_mid, x_offset=30, y_offset=-300),
-            ]
-            self.ap_src_coords[endpoint_name] = [
+            )
+            self.ap_src_coords[endpoint_name] = (
                 bezier_coords(lower_mid, x_offset=30),
                 bezier_coords(lower_mid, x_offset=30, y_offset=120),
-            ]
-            self.ap_dst_coords[endpoint_name] = [
+            )
+            self.ap_dst_coords[endpoint_name] = (
                 bezier_coords(lower_mid, x_offset=-30),
                 bezier_coords(lower_mid, x_offset=-30, y_offset=120),
-            ]
-            self.onchip_src_coords[endpoint_name] = [lower_mid[0] + 30, lower_mid[1]]
-            self.onchip_dst_coords[endpoint_name] = [lower_mid[0] - 30, lower_mid[1]]
+            )
+            self.onchip_src_coords[endpoint_name] = (lower_mid[0] + 30, lower_mid[1])
+            self.onchip_dst_coords[endpoint_name] = (lower_mid[0] - 30, lower_mid[1])
             self.ap_coords[endpoint_name] = lower_mid
         elif endpoint_type == "app":
-            self.ap_src_coords[endpoint_name] = [
+            self.ap_src_coords[endpoint_name] = (
                 bezier_coords(upper_mid, x_offset=-30),
                 bezier_coords(upper_mid, x_offset=-30, y_offset=-120),
-            ]
-            self.ap_dst_coords[endpoint_name] = [
+            )
+            self.ap_dst_coords[endpoint_name] = (
                 bezier_coords(upper_mid, x_offset=30),
                 bezier_coords(upper_mid, x_offset=30, y_offset=-120),
-            ]
-            self.onchip_src_coords[endpoint_name] = [lower_mid[0] - 30, lower_mid[1]]
-            self.onchip_dst_coords[endpoint_name] = [lower_mid[0] + 30, lower_mid[1]]
+            )
+            self.onchip_src_coords[endpoint_name] = (lower_mid[0] - 30, lower_mid[1])
+            self.onchip_dst_coords[endpoint_name] = (lower_mid[0] + 30, lower_mid[1])
         else:
             assert False, 'Unkown endpoint type "{}"'.format(endpoint_type)
 
     def render_legend(self, x_offset, y_offset, legend_width):
         inter_line_gap = 40
         inter_item_spacing = 20
-        legend = self.drawing.add(
-            self.drawing.g(id="legend", fill="black", stroke_width=6)
+        legend = self.add(
+            self.drawing.g(id="legend", fill="black", stroke_width=6), "legend"
         )
         y = y_offset
         for connection_types, connection_colour in self.connection_colours.items():
@@ -212,3 +547,5 @@ class Canvas(object):
                 y += inter_line_gap
 
             y += inter_item_spacing
+
+        return legend
@@ -0,0 +1,263 @@
+import argparse
+import io
+import json
+import os
+import sys
+import timeit
+
+from switch_config_render.fabric import generate_fabric_svg
+from switch_config_render.generate_svg import (
+    generate_system_svg,
+    generate_system_svg_stream,
+)
+from switch_config_render.loader import iter_switch_configs, record_to_kwargs
+from switch_config_render.regression import TIER_BUDGETS, run_regression
+from switch_config_render.scene import LiveScene, run_scene_events
+
+
+def run_job(job, app_shapes=None):
+    """
+    Renders a single worker job and returns its JSON result. A job holds a
+    `config` record in the config dump format (see
+    `switch_config_render.loader`) and either an `output` filename or
+    `"inline": true` to return the SVG document in the result. An optional
+    `id` is copied to the result.
+    """
+    result = {"id": job.get("id")} if isinstance(job, dict) else {"id": None}
+    start = timeit.default_timer()
+    try:
+        if not isinstance(job, dict) or "config" not in job:
+            raise ValueError('missing field "config"')
+        if not job.get("inline") and not job.get("output"):
+            raise ValueError('either "output" or "inline" is required')
+
+        stream = io.StringIO()
+        generate_system_svg_stream(stream, **record_to_kwargs(job["config"], app_shapes))
+        svg = stream.getvalue()
+
+        if job.get("inline"):
+            result["svg"] = svg
+        else:
+            with io.open(job["output"], "w", encoding="utf-8") as fileobj:
+                fileobj.write(svg)
+            result["output"] = job["output"]
+
+        result["status"] = "ok"
+        result["bytes"] = len(svg.encode("utf-8"))
+    except Exception as e:
+        # A bad job must never take the worker down with it
+        result["status"] = "error"
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+
+    result["elapsed_ms"] = round((timeit.default_timer() - start) * 1000.0, 3)
+    return result
+
+
+def run_worker(instream, outstream, app_shapes=None):
+    """
+    Reads one JSON job per line from `instream` until it is closed and
+    writes one JSON result line per job to `outstream`. Results are flushed
+    as soon as each job is done, so a worker can be kept running and fed
+    jobs one at a time.
+
+    >>> import io
+    >>> config = {"interfaces": {"et1": {}, "et2": {}}, "connections": {"et1": "et2"},
+    ...           "fpga_apps": {}, "app_shapes": {}}
+    >>> bad_config = dict(config, fpga_apps={"fpga": {"app": {"type": "mux", "ports": []}}},
+    ...                   app_shapes={"mux": [[0, 0], [1, 1]]})
+    >>> jobs = io.StringIO(json.dumps({"id": 1, "config": bad_config, "inline": True})
+    ...                    + "\\n" + json.dumps({"id": 2, "config": config, "inline": True})
+    ...                    + "\\n\\n{not json\\n")
+    >>> results = io.StringIO()
+    >>> run_worker(jobs, results)
+    >>> [(r["id"], r["status"], "svg" in r) for r in map(json.loads, results.getvalue().splitlines())]
+    [(1, 'error', False), (2, 'ok', True), (None, 'error', False)]
+    """
+    for line in iter(instream.readline, ""):
+        if not line.strip():
+            continue
+
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            result = {"id": None, "status": "error", "error": "invalid JSON: {}".format(e)}
+        else:
+            result = run_job(job, app_shapes)
+
+        outstream.write(json.dumps(result, sort_keys=True) + "\n")
+        outstream.flush()
+
+
+def load_app_shapes(filename):
+    """Loads the app shapes JSON file `filename`, if one was given"""
+    if not filename:
+        return None
+    with open(filename) as fileobj:
+        return json.load(fileobj)
+
+
+def run_examples():
+    from switch_config_render._examples.high_level_example import render_high_level_example
+    from switch_config_render._examples.low_level_example import render_low_level_example
+
+    render_high_level_example()
+    render_low_level_example()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m switch_config_render",
+        description="Render FPGA-based network switch configurations as SVG",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser(
+        "examples",
+        help="render the bundled examples into the current directory (default)",
+    )
+
+    worker = subparsers.add_parser(
+        "worker",
+        help="render JSON jobs read line by line from stdin, writing one JSON "
+        "result line per job to stdout",
+    )
+    worker.add_argument(
+        "--app-shapes",
+        metavar="FILE",
+        help="JSON file with the app shapes used by jobs that define none",
+    )
+
+    live = subparsers.add_parser(
+        "live",
+        help="render a config and then apply JSON change events read line by "
+        "line, writing the SVG patches of every event to stdout",
+    )
+    live.add_argument("config", help="JSON file with a config dump record")
+    live.add_argument(
+        "--events",
+        metavar="FILE",
+        help="read the events from this file or FIFO instead of stdin",
+    )
+    live.add_argument(
+        "--app-shapes",
+        metavar="FILE",
+        help="JSON file with the app shapes, if the config defines none",
+    )
+
+    fabric = subparsers.add_parser(
+        "fabric",
+        help="render the switches of a config dump and the links between "
+        "them as one fabric diagram",
+    )
+    fabric.add_argument("dump", help="JSON Lines config dump")
+    fabric.add_argument("output", help="SVG file to write")
+    fabric.add_argument(
+        "--links",
+        metavar="FILE",
+        help="JSON file with the list of links between the switches",
+    )
+    fabric.add_argument(
+        "--expand",
+        metavar="NAME",
+        action="append",
+        default=[],
+        help="draw this switch in full detail, may be repeated",
+    )
+    fabric.add_argument(
+        "--app-shapes",
+        metavar="FILE",
+        help="JSON file with the app shapes used by records that define none",
+    )
+
+    profile = subparsers.add_parser(
+        "profile",
+        help="render a config under the profiler and report its hot spots",
+    )
+    profile.add_argument("config", help="JSON file with a config dump record")
+    profile.add_argument(
+        "--output",
+        metavar="PREFIX",
+        help="write <PREFIX>.svg, <PREFIX>.pstats, <PREFIX>.collapsed and "
+        "<PREFIX>.profile.txt (default: the config filename without extension)",
+    )
+    profile.add_argument(
+        "--app-shapes",
+        metavar="FILE",
+        help="JSON file with the app shapes, if the config defines none",
+    )
+
+    regression = subparsers.add_parser(
+        "regression",
+        help="compare renders of the regression corpus with the goldens and "
+        "check their time and memory budgets",
+    )
+    regression.add_argument(
+        "--update", action="store_true", help="rewrite the goldens instead"
+    )
+    regression.add_argument(
+        "--tier",
+        action="append",
+        choices=sorted(TIER_BUDGETS),
+        help="only check the cases of this tier, may be repeated",
+    )
+    regression.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="factor applied to the time and memory budgets (default: 1.0)",
+    )
+    regression.add_argument(
+        "--skip-budgets", action="store_true", help="do not check the budgets"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        app_shapes = load_app_shapes(args.app_shapes)
+        run_worker(sys.stdin, sys.stdout, app_shapes)
+    elif args.command == "live":
+        app_shapes = load_app_shapes(args.app_shapes)
+        with open(args.config) as fileobj:
+            scene = LiveScene(**record_to_kwargs(json.load(fileobj), app_shapes))
+
+        sys.stdout.write(json.dumps({"svg": scene.svg_text()}) + "\n")
+        sys.stdout.flush()
+        if args.events:
+            with io.open(args.events, encoding="utf-8") as events:
+                run_scene_events(scene, events, sys.stdout)
+        else:
+            run_scene_events(scene, sys.stdin, sys.stdout)
+    elif args.command == "fabric":
+        app_shapes = load_app_shapes(args.app_shapes)
+        links = []
+        if args.links:
+            with open(args.links) as fileobj:
+                links = json.load(fileobj)
+        errors = []
+        with open(args.dump, "rb") as dump:
+            switches = (
+                (config.name, config.kwargs)
+                for config in iter_switch_configs(dump, app_shapes, errors)
+            )
+            generate_fabric_svg(args.output, switches, links, expanded=args.expand)
+        for error in errors:
+            sys.stderr.write("{}: skipped {}\n".format(args.dump, error))
+        return 1 if errors else 0
+    elif args.command == "profile":
+        app_shapes = load_app_shapes(args.app_shapes)
+        with open(args.config) as fileobj:
+            kwargs = record_to_kwargs(json.load(fileobj), app_shapes)
+        prefix = args.output or os.path.splitext(args.config)[0]
+        result = generate_system_svg(prefix + ".svg", profile=True, **kwargs)
+        sys.stdout.write(result.profile.format_report())
+    elif args.command == "regression":
+        failures = run_regression(
+            update=args.update,
+            tiers=args.tier,
+            check_budgets=not (args.update or args.skip_budgets),
+            tolerance=args.tolerance,
+        )
+        return 1 if failures else 0
+    else:
+        run_examples()
+    return 0
@@ -0,0 +1,95 @@
+import hashlib
+import io
+import json
+import xml.etree.ElementTree as etree
+
+# Bump whenever a change to the renderer changes the output for the same
+# inputs, so that content hashes of older renders no longer match
+RENDER_VERSION = 1
+
+
+def get_content_hash(system, options=None):
+    """
+    Gets the SHA-256 hex digest of a system, given as a dict of
+    `build_system_canvas` keyword arguments, and of the `options` that
+    affect its rendering. The digest only depends on the contents of the
+    arguments, not on the order of dict keys, so equal inputs always hash
+    the same, and `RENDER_VERSION` is included so that renderer changes
+    invalidate earlier digests.
+
+    >>> digest = get_content_hash({'connections': {'et1': 'et2', 'et2': 'et1'}})
+    >>> digest == get_content_hash({'connections': {'et2': 'et1', 'et1': 'et2'}})
+    True
+    >>> digest == get_content_hash({'connections': {'et1': 'et2'}})
+    False
+    >>> len(digest)
+    64
+    """
+    canonical = json.dumps(
+        [RENDER_VERSION, system, options or {}],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def add_content_hash_metadata(drawing, content_hash):
+    """
+    Embeds `content_hash` in the metadata of the drawing, as
+    `<metadata><content-hash algorithm="sha256">...</content-hash></metadata>`
+    """
+    element = etree.Element("content-hash", algorithm="sha256")
+    element.text = content_hash
+    drawing.set_metadata(element)
+
+
+def read_content_hash(svg_text):
+    """
+    Reads the content hash embedded by `add_content_hash_metadata` from an
+    SVG document, or returns None if it has none. The document is parsed
+    incrementally, up to its first element that is not metadata, as the
+    metadata precedes all drawn elements.
+
+    >>> from switch_config_render.generate_svg import build_system_canvas
+    >>> from switch_config_render.template import DocumentTemplate
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> system = get_synthetic_system(16)
+    >>> reordered = dict(system, connections=dict(reversed(list(system["connections"].items()))))
+    >>> canvas = build_system_canvas(content_hash=True, **system)
+    >>> svg_text = canvas.drawing.tostring()
+    >>> svg_text == build_system_canvas(content_hash=True, **reordered).drawing.tostring()
+    True
+    >>> read_content_hash(svg_text) == canvas.content_hash
+    True
+    >>> read_content_hash(build_system_canvas(**system).drawing.tostring()) is None
+    True
+
+    The document template and the layout options are part of the hash, as
+    they change the document:
+
+    >>> styled = DocumentTemplate(style="text { font-family: monospace }")
+    >>> hashes = set(
+    ...     build_system_canvas(content_hash=True, **dict(system, **options)).content_hash
+    ...     for options in ({}, {"front_panel_rows": 2}, {"max_row_width": 2000},
+    ...                     {"fpga_rows": 2}, {"template": styled})
+    ... )
+    >>> len(hashes)
+    5
+    """
+    if isinstance(svg_text, bytes):
+        stream = io.BytesIO(svg_text)
+    else:
+        stream = io.BytesIO(svg_text.encode("utf-8"))
+    depth = 0
+    for event, element in etree.iterparse(stream, events=("start", "end")):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            depth += 1
+            # Stop at the first child of the root that is not metadata
+            if depth == 2 and tag != "metadata":
+                return None
+        elif tag == "content-hash" and element.get("algorithm") == "sha256":
+            return element.text
+        else:
+            depth -= 1
+    return None
@@ -0,0 +1,432 @@
+"""
+Draws a fabric of many switches in one diagram. Every switch is drawn as a
+tile: a summary of its ports, apps and connection types by default, or its
+full rendering, scaled down, for the switches selected for expansion. Only
+the expanded switches are laid out in full, so the cost of a fabric render
+grows with the number of switches, not with their size.
+"""
+import math
+
+from switch_config_render.canvas import get_palette_colour
+from switch_config_render.generate_svg import (
+    _COLLECTION_SPACING,
+    _LEGEND_WIDTH,
+    build_system_canvas,
+)
+from switch_config_render.summary import summarize_system
+from switch_config_render.template import DEFAULT_TEMPLATE, XML_HEADER
+from switch_config_render.utils import format_point, get_connection_types
+
+_TILE_WIDTH = 1600
+_TILE_LINE_HEIGHT = 50
+_TILE_SPACING = 300
+_FABRIC_MARGIN = 100
+_MAX_TILE_TYPE_LINES = 4
+
+
+class SwitchTile(object):
+    """
+    A switch of the fabric. `summary` is its `SystemSummary`, `canvas` its
+    full rendering if it is expanded, and `link_interfaces` the params of
+    the interfaces used by inter-switch links. `rect` is set once the tile
+    is placed.
+    """
+
+    __slots__ = ("name", "summary", "canvas", "link_interfaces", "rect", "scale")
+
+    def __init__(self, name, summary, canvas, link_interfaces):
+        self.name = name
+        self.summary = summary
+        self.canvas = canvas
+        self.link_interfaces = link_interfaces
+        self.rect = None
+        self.scale = 1
+
+    def get_size(self, detail_scale):
+        if self.canvas is not None:
+            width, height = get_detail_size(self.canvas.layout)
+            return (width * detail_scale, height * detail_scale)
+        lines = 4 + min(len(self.summary.connection_types), _MAX_TILE_TYPE_LINES + 1)
+        return (_TILE_WIDTH, (lines + 1) * _TILE_LINE_HEIGHT)
+
+    def get_lines(self):
+        summary = self.summary
+        lines = [
+            "{} front panel, {} app ports".format(
+                summary.front_panel_ports, summary.app_ports
+            ),
+            "{} FPGAs with {} apps".format(summary.fpgas, summary.apps),
+            "{} connections".format(summary.connections),
+        ]
+        type_counts = sorted(
+            summary.connection_types.items(), key=lambda item: (-item[1], item[0])
+        )
+        for types, count in type_counts[:_MAX_TILE_TYPE_LINES]:
+            lines.append("  {}: {}".format(" & ".join(types) or "untyped", count))
+        if len(type_counts) > _MAX_TILE_TYPE_LINES:
+            lines.append(
+                "  ... {} more types".format(len(type_counts) - _MAX_TILE_TYPE_LINES)
+            )
+        return lines
+
+    def get_anchor(self, itf, towards):
+        """
+        Gets the point where a link to `itf` attaches: the middle of the
+        port if the switch is expanded, otherwise the point of the tile
+        border that faces `towards`
+        """
+        x, y, width, height = self.rect
+        if self.canvas is not None and itf in self.canvas.layout.ports:
+            port_x, port_y, port_width, port_height = self.canvas.layout.ports[itf][1]
+            return (
+                x + (port_x + port_width / 2.0) * self.scale,
+                y + (port_y + port_height / 2.0) * self.scale,
+            )
+
+        middle = (x + width / 2.0, y + height / 2.0)
+        dx = towards[0] - middle[0]
+        dy = towards[1] - middle[1]
+        if dx == 0 and dy == 0:
+            return middle
+        # Walk from the middle towards the other end until the border is hit
+        t = min(
+            width / 2.0 / abs(dx) if dx else float("inf"),
+            height / 2.0 / abs(dy) if dy else float("inf"),
+        )
+        return (middle[0] + dx * t, middle[1] + dy * t)
+
+
+def get_detail_size(layout):
+    """
+    Gets the size of an expanded switch, which leaves out the space of its
+    legend, as the fabric has a single legend
+    """
+    return (layout.width - _LEGEND_WIDTH, layout.height)
+
+
+def get_legend_height(connection_colours):
+    # The line and one line of text per type of every legend item, see
+    # `Canvas.render_legend`
+    return sum(40 * (1 + len(types)) + 20 for types in connection_colours)
+
+
+def prefix_element_ids(elements, prefix):
+    """
+    Prefixes the ids of the `elements` and of all elements within them, so
+    that they stay unique once several switches are drawn in one document
+    """
+    stack = list(elements)
+    while stack:
+        element = stack.pop()
+        # Prebuilt template elements are shared and have no ids
+        if not hasattr(element, "attribs"):
+            continue
+        if "id" in element.attribs:
+            element.attribs["id"] = prefix + element.attribs["id"]
+        stack += element.elements
+
+
+def get_link_types(link, tiles, dominant_type=None):
+    src_params = tiles[link["src"]].link_interfaces.get(link.get("src_itf"), {})
+    dst_params = tiles[link["dst"]].link_interfaces.get(link.get("dst_itf"), {})
+    # Interface names are only unique within a switch
+    itfs = {"dst": dst_params, "src": src_params}
+    return get_connection_types(
+        itfs, "dst", "src", bidir=link.get("bidir", False), dominant_type=dominant_type
+    )
+
+
+def place_tiles(tiles, detail_scale, max_row_width):
+    """
+    Places the tiles left to right in rows of at most `max_row_width`,
+    returning the size of the fabric
+    """
+    x = y = _FABRIC_MARGIN
+    row_height = 0
+    width = 0
+    for tile in tiles:
+        tile_width, tile_height = tile.get_size(detail_scale)
+        if x > _FABRIC_MARGIN and x + tile_width > _FABRIC_MARGIN + max_row_width:
+            x = _FABRIC_MARGIN
+            y += row_height + _TILE_SPACING
+            row_height = 0
+        tile.rect = (x, y, tile_width, tile_height)
+        if tile.canvas is not None:
+            tile.scale = detail_scale
+        x += tile_width + _TILE_SPACING
+        width = max(width, x - _TILE_SPACING)
+        row_height = max(row_height, tile_height)
+    return width + _FABRIC_MARGIN, y + row_height + _FABRIC_MARGIN
+
+
+def build_fabric_canvas(
+    switches,
+    links,
+    expanded=(),
+    detail_scale=0.25,
+    max_row_width=None,
+    dominant_type=None,
+    template=None,
+):
+    """
+    Draws a fabric of switches and the links between them.
+
+    `switches` is an iterable of `(name, kwargs)` pairs, where `kwargs` are
+    the `build_system_canvas` arguments of the switch, such as the `name`
+    and `kwargs` of the `SwitchConfig`s of a config dump. It is consumed
+    once, and only the expanded switches are kept in memory. `links` is a
+    list of dicts with the `src` and `dst` switch names and optionally the
+    `src_itf` and `dst_itf` interfaces and `bidir`. The types of a link
+    are those of its interfaces, as for connections within a switch.
+
+    The switches named in `expanded` are drawn in full at `detail_scale`,
+    all others as a summary computed in one pass over the switch. Links
+    between the same tiles, or ports of expanded switches, are drawn as one
+    line labelled with their number, with their number per types as its
+    title. Tiles are placed in rows of at most `max_row_width`, by default
+    about as wide as the fabric is high.
+
+    The element ids of expanded switches are prefixed with `<name>.`. All
+    switches and links share one palette, so a type has the same colour
+    everywhere, and a single legend right of the tiles lists all types.
+
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> switches = [("leaf{}".format(i), get_synthetic_system(8)) for i in range(4)]
+    >>> links = [{"src": "leaf0", "src_itf": "et1", "dst": "leaf1", "dst_itf": "et1"},
+    ...          {"src": "leaf0", "src_itf": "et2", "dst": "leaf1", "dst_itf": "et2"},
+    ...          {"src": "leaf2", "src_itf": "et1", "dst": "leaf3", "dst_itf": "et1"}]
+    >>> canvas = build_fabric_canvas(switches, links, expanded=["leaf3"])
+    >>> sorted(canvas.layout.boxes)
+    ['leaf0', 'leaf1', 'leaf2', 'leaf3']
+    >>> [(dst, src, types) for dst, src, _, types, _ in canvas.layout.connections]
+    [('leaf1', 'leaf0', ('type_b', 'type_c')), ('leaf3/et1', 'leaf2', ('type_b',))]
+
+    Expanding several switches keeps the ids unique and the colours
+    consistent:
+
+    >>> import re
+    >>> switches = [("leaf{}".format(i), get_synthetic_system(8)) for i in range(4)]
+    >>> svg = build_fabric_canvas(switches, links, expanded=["leaf0", "leaf3"]).drawing.tostring()
+    >>> ids = re.findall(r' id="([^"]*)"', svg)
+    >>> len(ids) == len(set(ids)), ids.count("legend"), "leaf0.et1" in ids
+    (True, 1, True)
+    >>> len(set(re.findall(r'stroke="(#[0-9A-F]{6})"', svg)))
+    4
+    """
+    template = template or DEFAULT_TEMPLATE
+    expanded = set(expanded)
+
+    link_itfs = {}
+    for link in links:
+        for end in ("src", "dst"):
+            link_itfs.setdefault(link[end], set()).add(link.get(end + "_itf"))
+
+    # All switches and links share one palette
+    connection_colours = {}
+    tiles = []
+    by_name = {}
+    for name, kwargs in switches:
+        summary = summarize_system(
+            kwargs["interfaces"],
+            kwargs["connections"],
+            kwargs["fpga_apps"],
+            kwargs.get("dominant_type"),
+        )
+        interfaces = kwargs["interfaces"]
+        link_interfaces = {
+            itf: interfaces[itf] for itf in link_itfs.get(name, ()) if itf in interfaces
+        }
+        canvas = None
+        if name in expanded:
+            canvas = build_system_canvas(
+                template=template, connection_colours=connection_colours, **kwargs
+            )
+            prefix_element_ids(canvas.drawing.elements[1:], name + ".")
+        tile = SwitchTile(name, summary, canvas, link_interfaces)
+        tiles.append(tile)
+        by_name[name] = tile
+
+    for link in links:
+        for end in ("src", "dst"):
+            if link[end] not in by_name:
+                raise ValueError("unknown switch {}".format(link[end]))
+
+    if max_row_width is None:
+        area = sum(w * h for w, h in (tile.get_size(detail_scale) for tile in tiles))
+        widest = max([tile.get_size(detail_scale)[0] for tile in tiles] or [0])
+        max_row_width = max(math.sqrt(area) * 1.5, widest)
+    width, height = place_tiles(tiles, detail_scale, max_row_width)
+
+    # The types of the links are only known once they are aggregated, so
+    # the size of the legend is only known then
+    aggregated = {}
+    for link in links:
+        src_tile = by_name[link["src"]]
+        dst_tile = by_name[link["dst"]]
+        src_itf = link.get("src_itf")
+        dst_itf = link.get("dst_itf")
+        src_key = src_tile.name
+        if src_tile.canvas is not None and src_itf in src_tile.canvas.layout.ports:
+            src_key += "/" + src_itf
+        dst_key = dst_tile.name
+        if dst_tile.canvas is not None and dst_itf in dst_tile.canvas.layout.ports:
+            dst_key += "/" + dst_itf
+        types = get_link_types(link, by_name, dominant_type)
+        _, type_counts = aggregated.setdefault((dst_key, src_key), (link, {}))
+        type_counts[types] = type_counts.get(types, 0) + 1
+
+    # Links of several types are drawn in black, like untyped ones
+    link_types = {}
+    for key, (_, type_counts) in sorted(aggregated.items()):
+        types = tuple(sorted(set(t for types in type_counts for t in types)))
+        link_types[key] = types
+        if len(type_counts) == 1 and types and types not in connection_colours:
+            connection_colours[types] = get_palette_colour(len(connection_colours))
+
+    legend_x = width
+    if connection_colours:
+        width += _LEGEND_WIDTH + _COLLECTION_SPACING
+        height = max(height, 2 * _FABRIC_MARGIN + get_legend_height(connection_colours))
+
+    canvas = template.new_canvas(width, height, fill="white")
+    canvas.connection_colours = connection_colours
+    drawing = canvas.drawing
+    for tile in tiles:
+        draw_tile(canvas, tile)
+
+    links_grp = canvas.add(drawing.g(id="fabric_links"), "fabric_links")
+    for (dst_key, src_key), (link, type_counts) in sorted(aggregated.items()):
+        src_tile = by_name[link["src"]]
+        dst_tile = by_name[link["dst"]]
+        src_rect = src_tile.rect
+        dst_rect = dst_tile.rect
+        src_middle = (src_rect[0] + src_rect[2] / 2.0, src_rect[1] + src_rect[3] / 2.0)
+        dst_middle = (dst_rect[0] + dst_rect[2] / 2.0, dst_rect[1] + dst_rect[3] / 2.0)
+        start = src_tile.get_anchor(link.get("src_itf"), dst_middle)
+        end = dst_tile.get_anchor(link.get("dst_itf"), src_middle)
+
+        types = link_types[(dst_key, src_key)]
+        stroke = "black"
+        if len(type_counts) == 1 and types:
+            stroke = connection_colours[types]
+        count = sum(type_counts.values())
+
+        d = "M{} L{}".format(format_point(start), format_point(end))
+        canvas.layout.add_connection(dst_key, src_key, "interswitch", types, d)
+        line = links_grp.add(
+            drawing.path(
+                d,
+                fill="none",
+                stroke=stroke,
+                stroke_width=min(6 + 2 * (count - 1), 30),
+            )
+        )
+        line.set_desc(
+            title=", ".join(
+                "{} {}".format(type_count, " & ".join(link_types) or "untyped")
+                for link_types, type_count in sorted(type_counts.items())
+            )
+        )
+        if link.get("bidir"):
+            line.set_markers((canvas.start_marker, None, canvas.end_marker))
+        else:
+            line.set_markers((None, None, canvas.end_marker))
+        if count > 1:
+            links_grp.add(
+                drawing.text(
+                    str(count),
+                    insert=((start[0] + end[0]) / 2.0, (start[1] + end[1]) / 2.0 - 20),
+                    text_anchor="middle",
+                    fill="black",
+                    font_size=40,
+                )
+            )
+
+    if connection_colours:
+        canvas.render_legend(
+            legend_x + _COLLECTION_SPACING, _FABRIC_MARGIN, _LEGEND_WIDTH
+        )
+    return canvas
+
+
+def draw_tile(canvas, tile):
+    drawing = canvas.drawing
+    x, y, width, height = tile.rect
+    canvas.layout.add_box(tile.name, tile.rect)
+    group = "switch:" + tile.name
+
+    if tile.canvas is not None:
+        layout = tile.canvas.layout
+        detail_width, detail_height = get_detail_size(layout)
+        nested = canvas.add(
+            drawing.svg(
+                insert=(x, y),
+                size=(width, height),
+                viewBox="0 0 {} {}".format(detail_width, detail_height),
+                id=tile.name,
+            ),
+            group,
+        )
+        # The markers are shared with the fabric, as both use the same
+        # template, and the legend is replaced by the one of the fabric
+        for element in tile.canvas.drawing.elements[1:]:
+            if tile.canvas.element_groups.get(id(element)) != "legend":
+                nested.add(element)
+        nested.add(
+            drawing.rect(
+                insert=(0, 0),
+                size=(detail_width, detail_height),
+                fill="none",
+                stroke="black",
+                stroke_width=20,
+            )
+        )
+
+        def scaled(rect):
+            return (x + rect[0] * tile.scale, y + rect[1] * tile.scale,
+                    rect[2] * tile.scale, rect[3] * tile.scale)
+
+        for itf, (collection_id, rect) in layout.ports.items():
+            canvas.layout.add_port(
+                tile.name + "/" + itf, tile.name + "/" + collection_id, scaled(rect)
+            )
+        for app, rect in layout.apps.items():
+            canvas.layout.add_app(tile.name + "/" + app, scaled(rect))
+        return
+
+    box = canvas.add(drawing.g(id=tile.name, fill="black"), group)
+    box.add(
+        drawing.rect(
+            insert=(x, y),
+            size=(width, height),
+            fill="white",
+            stroke="black",
+            stroke_width=6,
+        )
+    )
+    box.add(
+        drawing.text(
+            tile.name,
+            insert=(x + 40, y + _TILE_LINE_HEIGHT + 10),
+            font_weight="bold",
+            font_size=40,
+        )
+    )
+    line_y = y + 2 * _TILE_LINE_HEIGHT + 10
+    for line in tile.get_lines():
+        box.add(
+            drawing.text(
+                line,
+                insert=(x + 40, line_y),
+                style="font-family:monospace",
+                font_size=30,
+            )
+        )
+        line_y += _TILE_LINE_HEIGHT
+
+
+def generate_fabric_svg(filename, *args, **kwargs):
+    """Renders a fabric to the SVG file `filename`, see `build_fabric_canvas`"""
+    canvas = build_fabric_canvas(*args, **kwargs)
+    with open(filename, "w") as fileobj:
+        fileobj.write(XML_HEADER + canvas.drawing.tostring())
@@ -1,12 +1,28 @@
+import collections
 import copy
-import svgwrite
+import os
 
 from switch_config_render.utils import (
     get_sorted_itfs,
     get_average_itf_idx,
     get_connection_types,
+    get_corridor_bundles,
+)
+from switch_config_render.budget import (
+    DEGRADATION_NONE,
+    DEGRADATION_NO_TEXT,
+    DEGRADATION_AGGREGATED,
+    DEGRADATION_SUMMARY,
+    RenderBudgetExceeded,
+    estimate_element_count,
 )
 from switch_config_render.canvas import Canvas
+from switch_config_render.placement import PlacementPlan, get_shape_bounds
+from switch_config_render.profiling import RenderProfile
+from switch_config_render.digest import add_content_hash_metadata, get_content_hash
+from switch_config_render.stats import collect_render_stats, count_elements
+from switch_config_render.summary import summarize_system
+from switch_config_render.template import DEFAULT_TEMPLATE, XML_HEADER
 
 _INTERFACE_WIDTH = 200
 _INTERFACE_HEIGHT = 150
@@ -14,25 +30,139 @@ _INTERFACE_H_CLEARANCE = 30
 _INTERFACE_H_END_CLEARANCE = 80
 _INTERFACE_V_CLEARANCE = 50
 _INTERFACE_SPACE = _INTERFACE_WIDTH + 2 * _INTERFACE_H_CLEARANCE
+_INTERFACE_ROW_SPACE = 250
+_APP_ROW_SPACE = 300
 _COLLECTION_SPACING = 100
 _LEGEND_WIDTH = 400
 _ONCHIP_CONNECTION_CLEARANCE = 50
 
 
+def get_row_count(interface_count, max_width):
+    """
+    Gets the number of rows an interface box needs to be at most
+    `max_width` wide, or as narrow as possible
+
+    >>> get_row_count(256, 8000)
+    9
+    >>> get_row_count(4, 100)
+    4
+    """
+    per_row = (max_width - 2 * _INTERFACE_H_END_CLEARANCE) // _INTERFACE_SPACE
+    per_row = max(int(per_row), 1)
+    return max(-(-interface_count // per_row), 1)
+
+
+def get_interface_text(canvas, itf, params, middle_x, y, front_panel):
+    """
+    Gets the group with the alias and description text of an interface
+    whose box is centred on `middle_x`. The description goes above front
+    panel interfaces and below FPGA interfaces.
+    """
+    descs = canvas.drawing.g(id=itf + "_desc", fill="black")
+
+    if "alias" in params:
+        alias = "({})".format(params["alias"])
+        descs.add(
+            canvas.drawing.text(
+                alias,
+                insert=(middle_x, y + 150),
+                alignment_baseline="middle",
+                text_anchor="middle",
+                style="font-family:monospace",
+                font_size=15,
+            )
+        )
+
+    if "description" in params:
+        desc = params["description"]
+        if front_panel:
+            descs.add(
+                canvas.drawing.text(
+                    desc,
+                    insert=(middle_x, y + 40),
+                    alignment_baseline="middle",
+                    text_anchor="middle",
+                    style="font-family:monospace",
+                    font_size=15,
+                )
+            )
+        else:
+            descs.add(
+                canvas.drawing.text(
+                    desc,
+                    insert=(middle_x, y + 180),
+                    alignment_baseline="middle",
+                    text_anchor="middle",
+                    style="font-family:monospace",
+                    font_size=15,
+                )
+            )
+
+    return descs
+
+
 class InterfaceCollection(object):
-    def __init__(self, id, interface_count, num_portless_apps, front_panel, height):
+    """
+    A box of interfaces. The collections are slotted, and `itf_params`
+    keeps references to the caller's interface params rather than copies,
+    so that many laid out collections can be held at once. A laid out 512
+    port switch, including its SVG document, stays within 16kB per port:
+
+    >>> try:
+    ...     import tracemalloc
+    ... except ImportError:  # Python 2
+    ...     tracemalloc = None
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> system = get_synthetic_system(512)
+    >>> per_port = 0
+    >>> if tracemalloc is not None:
+    ...     tracemalloc.start()
+    ...     before = tracemalloc.get_traced_memory()[0]
+    ...     canvas = build_system_canvas(**system)
+    ...     per_port = (tracemalloc.get_traced_memory()[0] - before) / 512.0
+    ...     tracemalloc.stop()
+    >>> per_port < 16 * 1024
+    True
+    """
+
+    __slots__ = (
+        "id",
+        "name",
+        "front_panel",
+        "width",
+        "height",
+        "x",
+        "y",
+        "itf_idx",
+        "itf_params",
+        "rows",
+        "row_length",
+    )
+
+    def __init__(self, id, interface_count, num_portless_apps, front_panel, height, rows=1):
         self.id = id
         self.name = id.replace("_", " ").title()
         self.front_panel = front_panel
-        self.width = (interface_count + num_portless_apps) * _INTERFACE_SPACE + 2 * _INTERFACE_H_END_CLEARANCE
-        self.height = height
+
+        # The interfaces wrap onto `rows` rows, each of which is one row spacing lower
+        slot_count = interface_count + num_portless_apps
+        self.row_length = slot_count
+        if rows > 1 and slot_count > 0:
+            self.row_length = -(-slot_count // rows)
+            rows = -(-slot_count // self.row_length)
+        self.rows = max(rows, 1) if slot_count > 0 else 1
+
+        self.width = self.row_length * _INTERFACE_SPACE + 2 * _INTERFACE_H_END_CLEARANCE
+        self.height = height + (self.rows - 1) * _INTERFACE_ROW_SPACE
         self.x = None
         self.y = None
         self.itf_idx = 0
         self.itf_params = {}
 
     def render_box(self, canvas, x, y):
-        box = canvas.drawing.add(canvas.drawing.g(id="box_" + self.id, fill="white"))
+        box = canvas.add(
+            canvas.drawing.g(id="box_" + self.id, fill="white"), self.get_group_name()
+        )
         box.add(
             canvas.drawing.rect(
                 insert=(x, y),
@@ -67,20 +197,33 @@ class InterfaceCollection(object):
 
         self.x = x
         self.y = y
+        canvas.layout.add_box(self.id, (x, y, self.width, self.height))
+
+    def get_group_name(self):
+        return "front_panel" if self.front_panel else "fpga:" + self.id
+
+    def get_slot(self):
+        """Gets the column and row of the next interface"""
+        if self.rows == 1:
+            return self.itf_idx, 0
+        return self.itf_idx % self.row_length, self.itf_idx // self.row_length
 
     def get_current_x(self):
-        return self.x + (self.itf_idx * _INTERFACE_SPACE)\
+        column, _ = self.get_slot()
+        return self.x + (column * _INTERFACE_SPACE)\
             + _INTERFACE_H_END_CLEARANCE + _INTERFACE_H_CLEARANCE + _INTERFACE_WIDTH / 2
 
     def render_next_interface(self, canvas, itf, params):
-        x = self.x + (self.itf_idx * _INTERFACE_SPACE) + _INTERFACE_H_END_CLEARANCE
-        y = self.y
+        canvas.check_deadline()
+        column, row = self.get_slot()
+        x = self.x + (column * _INTERFACE_SPACE) + _INTERFACE_H_END_CLEARANCE
+        y = self.y + row * _INTERFACE_ROW_SPACE
         if self.front_panel:
             y += 50
 
         middle_x = x + _INTERFACE_H_CLEARANCE + _INTERFACE_WIDTH / 2
 
-        shapes = canvas.drawing.add(canvas.drawing.g(id=itf, fill="white"))
+        shapes = canvas.add(canvas.drawing.g(id=itf, fill="white"), self.get_group_name())
 
         shapes.add(
             canvas.drawing.rect(
@@ -98,6 +241,11 @@ class InterfaceCollection(object):
         canvas.add_connection_endpoint(
             itf, "et_itf" if self.front_panel else "ap_itf", lower_mid, upper_mid
         )
+        canvas.layout.add_port(
+            itf,
+            self.id,
+            (x + _INTERFACE_H_CLEARANCE, y + _INTERFACE_V_CLEARANCE, _INTERFACE_WIDTH, _INTERFACE_HEIGHT),
+        )
         self.itf_params[itf] = params
 
         # Make the front panel interface ports look like RJ-45 connectors
@@ -136,46 +284,13 @@ class InterfaceCollection(object):
             )
         )
 
-        descs = canvas.drawing.add(canvas.drawing.g(id=itf + "_desc", fill="black"))
-
-        if "alias" in params:
-            alias = "({})".format(params["alias"])
-            descs.add(
-                canvas.drawing.text(
-                    alias,
-                    insert=(middle_x, y + 150),
-                    alignment_baseline="middle",
-                    text_anchor="middle",
-                    style="font-family:monospace",
-                    font_size=15,
-                )
+        # Alias and description text is the first detail to go on oversized renders
+        if canvas.degradation < DEGRADATION_NO_TEXT:
+            canvas.add(
+                get_interface_text(canvas, itf, params, middle_x, y, self.front_panel),
+                self.get_group_name(),
             )
 
-        if "description" in params:
-            desc = params["description"]
-            if self.front_panel:
-                descs.add(
-                    canvas.drawing.text(
-                        desc,
-                        insert=(middle_x, y + 40),
-                        alignment_baseline="middle",
-                        text_anchor="middle",
-                        style="font-family:monospace",
-                        font_size=15,
-                    )
-                )
-            else:
-                descs.add(
-                    canvas.drawing.text(
-                        desc,
-                        insert=(middle_x, y + 180),
-                        alignment_baseline="middle",
-                        text_anchor="middle",
-                        style="font-family:monospace",
-                        font_size=15,
-                    )
-                )
-
         self.itf_idx += 1
 
     def render_blank_interface(self):
@@ -183,17 +298,51 @@ class InterfaceCollection(object):
 
 
 class FrontPanelPorts(InterfaceCollection):
-    def __init__(self, interface_count):
+    __slots__ = ()
+
+    def __init__(self, interface_count, rows=1):
         super(FrontPanelPorts, self).__init__(
-            "front_panel_interfaces", interface_count, 0, True, 300
+            "front_panel_interfaces", interface_count, 0, True, 300, rows
         )
 
 
+def get_app_link(port, app_name, itf_params):
+    """
+    Gets the `(dst, src, bidir, nodir)` of the link between an app and one
+    of its ports, from the `receives` and `drives` params of the port. A
+    port that only drives is the source of its link.
+
+    >>> get_app_link("ap1", "fpga.app", {"drives": "type_a"})
+    ('fpga.app', 'ap1', False, False)
+    >>> get_app_link("ap1", "fpga.app", {})
+    ('ap1', 'fpga.app', False, True)
+    """
+    receives = bool(itf_params.get("receives"))
+    drives = bool(itf_params.get("drives"))
+    if drives and not receives:
+        return app_name, port, False, False
+    return port, app_name, receives and drives, not receives and not drives
+
+
 class FPGAPorts(InterfaceCollection):
     APP_Y_OFFSET = (
         400
     )  # Indicates how far down apps are drawn from the top border of the FPGA box
 
+    __slots__ = (
+        "fpga_id",
+        "app_shapes",
+        "fpga_apps",
+        "ap_interfaces",
+        "apps_ports",
+        "onchip_connections",
+        "onchip_endpoints",
+        "portless_apps",
+        "onchip_conn_clearance",
+        "shape_bounds",
+        "placement",
+    )
+
     def __init__(
         self,
         id,
@@ -202,97 +351,152 @@ class FPGAPorts(InterfaceCollection):
         app_shapes,
         onchip_connections=None,
         onchip_conn_clearance=_ONCHIP_CONNECTION_CLEARANCE,
+        shape_bounds=None,
+        rows=1,
+        max_row_width=None,
     ):
         self.fpga_id = id
         self.app_shapes = app_shapes
+        self.shape_bounds = shape_bounds or get_shape_bounds(app_shapes)
         self.fpga_apps = fpga_apps
         self.ap_interfaces = ap_interfaces
         self.apps_ports = {}
-        self.onchip_connections = []
-        self.onchip_endpoints = set()
-        self.portless_apps = set()
         self.onchip_conn_clearance = onchip_conn_clearance
 
+        fpga_onchip_connections = []
+        onchip_endpoints = set()
+
         # The height of the FPGA box is determined by the number of on-chip connections belonging only to this FPGA
         height = 750
         if onchip_connections:
+            ap_interface_set = set(ap_interfaces)
             for conn in onchip_connections:
                 dst = conn["dst"]
                 src = conn["src"]
-                if (dst in ap_interfaces or dst.startswith(id)) and (
-                    src in ap_interfaces or src.startswith(id)
+                if (dst in ap_interface_set or dst.startswith(id)) and (
+                    src in ap_interface_set or src.startswith(id)
                 ):
-                    self.onchip_endpoints.add(dst)
-                    self.onchip_endpoints.add(src)
-                    self.onchip_connections.append(conn)
+                    onchip_endpoints.add(dst)
+                    onchip_endpoints.add(src)
+                    fpga_onchip_connections.append(conn)
                     height += self.onchip_conn_clearance
 
-        for app, params in self.fpga_apps.items():
-            if len(set(params["ports"]) - self.onchip_endpoints) == 0:
-                self.portless_apps.add(app)
+        self.onchip_connections = tuple(fpga_onchip_connections)
+        self.onchip_endpoints = frozenset(onchip_endpoints)
+        self.placement = PlacementPlan(fpga_apps, self.onchip_endpoints)
+        self.portless_apps = frozenset(
+            app.name for app in self.placement.apps if app.portless
+        )
 
-        super(FPGAPorts, self).__init__(id, len(ap_interfaces), len(self.portless_apps), False, height)
+        if max_row_width:
+            slot_count = len(ap_interfaces) + len(self.portless_apps)
+            rows = max(rows, get_row_count(slot_count, max_row_width))
+        super(FPGAPorts, self).__init__(
+            id, len(ap_interfaces), len(self.portless_apps), False, height, rows
+        )
+        self.height += (self.rows - 1) * _APP_ROW_SPACE
+
+    def get_app_y(self, row=0):
+        """Gets the y coordinate of the top of the apps of a row, below all the interface rows"""
+        return (
+            self.y
+            + FPGAPorts.APP_Y_OFFSET
+            + (self.rows - 1) * _INTERFACE_ROW_SPACE
+            + row * _APP_ROW_SPACE
+        )
 
     def render_fpga_internals(
         self, canvas, x, y, interfaces, itf_prefix="ap"
     ):
         self.render_box(canvas, x, y)
 
-        sorted_apps = []
-        for app, params in self.fpga_apps.items():
-            if len(params["ports"]) == 0:
-                sorted_apps.append((app, 0))
-            else:
-                avg_itf = get_average_itf_idx(params["ports"], itf_prefix)
-                sorted_apps.append((app, avg_itf))
-        sorted_apps = [app for app, _ in sorted(sorted_apps, key=lambda info: info[1])]
-
-        for app in sorted_apps:
-            params = self.fpga_apps[app]
-
-            app_ports = set(params["ports"])
-            self.apps_ports[app] = set(app_ports)
+        placement = self.placement
+        if itf_prefix != "ap":
+            placement = PlacementPlan(self.fpga_apps, self.onchip_endpoints, itf_prefix)
 
-            onchip_app_ports = app_ports.intersection(self.onchip_endpoints)
-            app_ports -= onchip_app_ports
+        for app in placement.apps:
+            # A port listed twice is only linked to its app once
+            self.apps_ports[app.name] = tuple(
+                collections.OrderedDict.fromkeys(app.params["ports"])
+            )
 
-            for itf in get_sorted_itfs(onchip_app_ports, itf_prefix):
+            for itf in app.onchip_ports:
                 self.render_next_interface(canvas, itf, interfaces[itf])
 
-            for itf in get_sorted_itfs(app_ports, itf_prefix):
+            # If the ports wrap onto the next row, the app is drawn in the
+            # row of its first port and centered on the ports in that row
+            column, row = self.get_slot()
+            row_ports = app.ports
+            if self.rows > 1:
+                row_ports = app.ports[: self.row_length - column]
+
+            for itf in app.ports:
                 self.render_next_interface(canvas, itf, interfaces[itf])
 
-            portless_app_x = None
-            if app in self.portless_apps:
-                portless_app_x = self.get_current_x()
+            if app.portless:
+                center_x = self.get_current_x()
                 self.render_blank_interface()
+            else:
+                # The ports are drawn left to right, so they span from the first to the last one
+                min_x = canvas.ap_coords[row_ports[0]][0]
+                max_x = canvas.ap_coords[row_ports[-1]][0]
+                center_x = min_x + (max_x - min_x) / 2.0
+
+            self.draw_app(
+                canvas,
+                app.name,
+                app.params["type"],
+                80,
+                app.ports,
+                center_x=center_x,
+                row=row,
+            )
 
-            self.draw_app(canvas, app, params["type"], 80, app_ports, portless_app_x)
-
-    def draw_app(self, canvas, name, app_type, size_factor, ports, portless_app_x=None):
-        app = canvas.drawing.add(
+    def draw_app(
+        self,
+        canvas,
+        name,
+        app_type,
+        size_factor,
+        ports,
+        portless_app_x=None,
+        center_x=None,
+        row=0,
+    ):
+        """
+        Draws the app centered on `center_x`, or on `portless_app_x`, or
+        else on the middle of its already drawn `ports`. Apps of interfaces
+        that wrapped onto later rows are drawn in later rows too.
+        """
+        canvas.check_deadline()
+        endpoint_name = "{}.{}".format(self.fpga_id, name) if self.fpga_id else name
+        app = canvas.add(
             canvas.drawing.g(
                 id="app_" + self.id + "_" + name, fill="white", font_size=50
-            )
+            ),
+            "app:" + endpoint_name,
         )
 
         points = self.app_shapes[app_type]
-        width = max([x for x, _ in points]) * size_factor
-        height = max([y for _, y in points]) * size_factor
-
-        itf_x_coords = [portless_app_x]
-        if not portless_app_x:
+        app_y = self.get_app_y(row)
+        width, height = self.shape_bounds[app_type]
+        width *= size_factor
+        height *= size_factor
+
+        if center_x is None:
+            center_x = portless_app_x
+        if not center_x:
             # Determine the placement of the app by selecting the mid-point of all the connected ports
             itf_coords = [canvas.ap_coords[itf] for itf in ports if itf in canvas.ap_coords]
             itf_x_coords = [x for x, _ in itf_coords]
+            center_x = min(itf_x_coords) + (max(itf_x_coords) - min(itf_x_coords)) / 2.0
 
-        x_offset = min(itf_x_coords) + (max(itf_x_coords) - min(itf_x_coords)) / 2.0
-        x_offset -= width / 2.0
+        x_offset = center_x - width / 2.0
 
         abs_points = [
             (
                 x * size_factor + x_offset,
-                y * size_factor + self.y + FPGAPorts.APP_Y_OFFSET,
+                y * size_factor + app_y,
             )
             for x, y in points
         ]
@@ -303,7 +507,7 @@ class FPGAPorts(InterfaceCollection):
         app.add(canvas.drawing.path(path, fill="none", stroke_width=6, stroke="black"))
 
         x_middle = x_offset + width / 2.0
-        y_middle = self.y + FPGAPorts.APP_Y_OFFSET + height / 2.0
+        y_middle = app_y + height / 2.0
         app.add(
             canvas.drawing.text(
                 name,
@@ -315,92 +519,471 @@ class FPGAPorts(InterfaceCollection):
             )
         )
 
-        app_upper_coords = (x_middle, (self.y + FPGAPorts.APP_Y_OFFSET))
-        app_lower_coords = (x_middle, (self.y + FPGAPorts.APP_Y_OFFSET) + height)
+        app_upper_coords = (x_middle, app_y)
+        app_lower_coords = (x_middle, app_y + height)
 
-        endpoint_name = "{}.{}".format(self.fpga_id, name) if self.fpga_id else name
         canvas.add_connection_endpoint(
             endpoint_name, "app", app_lower_coords, app_upper_coords
         )
+        canvas.layout.add_app(
+            endpoint_name, (x_offset, app_y, width, height)
+        )
 
     def draw_apps_connections(self, canvas):
+        """
+        Links every port of the apps to its app, once per port
+
+        >>> from switch_config_render._examples.synthetic import get_synthetic_system
+        >>> system = get_synthetic_system(8)
+        >>> system["fpga_apps"]["fpga_0"]["app_0"]["ports"] += ["ap1", "ap2"]
+        >>> canvas = build_system_canvas(**system)
+        >>> sorted(dst for dst, _, kind, _, _ in canvas.layout.connections if kind == "app_link")
+        ['ap1', 'ap2', 'ap3', 'ap4', 'ap5', 'ap6', 'ap7', 'ap8']
+        """
+        app_connections = []
         for name, ports in self.apps_ports.items():
             app_name = "{}.{}".format(self.fpga_id, name) if self.fpga_id else name
             for port in ports:
-                receives = False
-                drives = False
-                dst = port
-                src = app_name
-
-                if (
-                    "receives" in self.itf_params[port]
-                    and self.itf_params[port]["receives"]
-                ):
-                    receives = True
+                app_connections.append(
+                    get_app_link(port, app_name, self.itf_params[port])
+                )
 
-                if (
-                    "drives" in self.itf_params[port]
-                    and self.itf_params[port]["drives"]
-                ):
-                    drives = True
-                    if receives:
-                        bidir = True
-                    else:
-                        dst = app_name
-                        src = port
-
-                bidir = receives and drives
-                nodir = not receives and not drives
+        if canvas.degradation >= DEGRADATION_AGGREGATED:
+            canvas.render_aggregated_connections(
+                [(dst, src, bidir, None) for dst, src, bidir, _ in app_connections],
+                onchip=True,
+                group="app_links:" + self.id,
+            )
+        else:
+            for dst, src, bidir, nodir in app_connections:
                 canvas.render_connection(
-                    dst, src, bidir=bidir, onchip=True, nodir=nodir
+                    dst,
+                    src,
+                    bidir=bidir,
+                    onchip=True,
+                    nodir=nodir,
+                    group="app_links:" + self.id,
                 )
 
-        connection_lower_y = self.y + 700
+        connection_lower_y = (
+            self.y + 700 + (self.rows - 1) * (_INTERFACE_ROW_SPACE + _APP_ROW_SPACE)
+        )
         for conn in self.onchip_connections:
             canvas.render_square_connection(
-                conn["dst"], conn["src"], conn["desc"], connection_lower_y
+                conn["dst"],
+                conn["src"],
+                conn["desc"],
+                connection_lower_y,
+                group="onchip_links:" + self.id,
             )
             connection_lower_y += self.onchip_conn_clearance
 
 
+class RenderResult(object):
+    """
+    Describes a completed render. `stats` holds the `RenderStats` of the
+    document if they were requested, and None otherwise. `degradation` is
+    the degradation level the render had to use to stay within its budget,
+    see `switch_config_render.budget`. `content_hash` is the content hash
+    embedded in the document, if one was requested. `profile` holds the
+    `RenderProfile` of the render if it was profiled.
+    """
+
+    __slots__ = ("stats", "degradation", "content_hash", "profile")
+
+    def __init__(
+        self, stats=None, degradation=DEGRADATION_NONE, content_hash=None, profile=None
+    ):
+        self.stats = stats
+        self.degradation = degradation
+        self.content_hash = content_hash
+        self.profile = profile
+
+
 def generate_system_svg(filename, *args, **kwargs):
+    """
+    Renders the system to the SVG file `filename`, see
+    `generate_system_svg_stream`. If `stats` is set, the render statistics
+    are also written as JSON to `<filename without extension>.stats.json`.
+    If `profile` is set, the profile is written next to it as well (see
+    `RenderProfile.write`).
+    """
     with open(filename, "w") as fileobj:
-        generate_system_svg_stream(fileobj, *args, **kwargs)
+        result = generate_system_svg_stream(fileobj, *args, **kwargs)
+    if result.stats is not None:
+        result.stats.write_json(os.path.splitext(filename)[0] + ".stats.json")
+    if result.profile is not None:
+        result.profile.write(os.path.splitext(filename)[0])
+    return result
+
+
+def generate_system_svg_stream(stream, *args, **kwargs):
+    """
+    Renders the system to `stream` and returns a `RenderResult`. See
+    `build_system_canvas` for the arguments. If `stats` is set, the result
+    holds the element counts and serialised sizes of every logical group of
+    the document (see `switch_config_render.stats`). If `profile` is set,
+    the render and serialisation are profiled and the result holds the
+    `RenderProfile` (see `switch_config_render.profiling`).
+    """
+    if kwargs.pop("profile", False):
+        with RenderProfile() as profile:
+            result = generate_system_svg_stream(stream, *args, **kwargs)
+        result.profile = profile
+        return result
+
+    stats = kwargs.pop("stats", False)
+    budget = kwargs.pop("budget", None)
+
+    degradation = DEGRADATION_NONE
+    if budget is None:
+        canvas = build_system_canvas(*args, **kwargs)
+    else:
+        canvas = build_budgeted_canvas(budget, *args, **kwargs)
+        degradation = canvas.degradation
+
+    if not stats:
+        canvas.drawing.write(stream)
+        return RenderResult(
+            degradation=degradation, content_hash=canvas.content_hash
+        )
+
+    document = XML_HEADER + canvas.drawing.tostring()
+    stream.write(document)
+    return RenderResult(
+        stats=collect_render_stats(canvas, document),
+        degradation=degradation,
+        content_hash=canvas.content_hash,
+    )
+
+
+def build_budgeted_canvas(
+    budget,
+    interfaces,
+    connections,
+    fpga_apps,
+    app_shapes,
+    dominant_type=None,
+    onchip_connections=None,
+    **kwargs
+):
+    """
+    Like `build_system_canvas`, but stays within the element count and
+    deadline of the `RenderBudget`. Each degradation level is tried in turn,
+    skipping the levels that are estimated or turn out to need too many
+    elements, or that are estimated to take longer than the time left. Every
+    level that is tried gets its own time slice: the time left, less the
+    estimated time of the next level, so that a level that overruns still
+    leaves time for the next one. If no level fits, a summary of the system
+    is drawn instead. `canvas.degradation` holds the level used. Only the
+    layout and drawing count towards the deadline, not serialising the
+    document afterwards.
+
+    >>> from switch_config_render.budget import RenderBudget
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> system = get_synthetic_system(64)
+    >>> [build_budgeted_canvas(RenderBudget(max_elements), **system).degradation
+    ...  for max_elements in (None, 1000, 710, 100)]
+    [0, 1, 2, 3]
+    >>> build_budgeted_canvas(RenderBudget(deadline=0), **system).degradation
+    3
+
+    The starting level is chosen by the deadline. At 1ms per element, the
+    estimated 1278 elements of the full render take longer than a second,
+    but the 894 without text do not; at 1.25ms per element, only the 705
+    elements of the aggregated connections fit. A clock that stands still
+    keeps the actual render time out of it:
+
+    >>> def clock():
+    ...     return 0.0
+    >>> [build_budgeted_canvas(
+    ...      RenderBudget(deadline=1.0, seconds_per_element=spe, timer=clock),
+    ...      **system).degradation for spe in (0.001, 0.00125)]
+    [1, 2]
+    """
+    deadline = budget.start()
+    estimates = [
+        estimate_element_count(
+            interfaces, connections, fpga_apps, onchip_connections, degradation
+        )
+        for degradation in range(DEGRADATION_SUMMARY)
+    ] + [0]
+    for degradation in range(DEGRADATION_SUMMARY):
+        if not budget.allows(estimates[degradation]):
+            continue
+
+        level_deadline = None
+        if deadline is not None:
+            remaining = deadline - budget.timer()
+            if budget.estimate_seconds(estimates[degradation]) > remaining:
+                continue
+            level_deadline = deadline - budget.estimate_seconds(
+                estimates[degradation + 1]
+            )
+
+        try:
+            canvas = build_system_canvas(
+                interfaces,
+                connections,
+                fpga_apps,
+                app_shapes,
+                dominant_type=dominant_type,
+                onchip_connections=onchip_connections,
+                degradation=degradation,
+                deadline=level_deadline,
+                timer=budget.timer,
+                **kwargs
+            )
+        except RenderBudgetExceeded:
+            continue
+
+        if budget.allows(count_elements(canvas.drawing)):
+            return canvas
+
+    return build_summary_canvas(
+        interfaces,
+        connections,
+        fpga_apps,
+        dominant_type,
+        template=kwargs.get("template"),
+    )
+
+
+def build_summary_canvas(
+    interfaces,
+    connections,
+    fpga_apps,
+    dominant_type=None,
+    max_type_lines=20,
+    template=None,
+):
+    """
+    Draws a single box summarising the system, listing the number of
+    interfaces, FPGAs, apps and connections per connection type. At most
+    `max_type_lines` connection types are listed, so that the size of the
+    drawing does not depend on the size of the system.
+    """
+    summary = summarize_system(interfaces, connections, fpga_apps, dominant_type)
+
+    lines = [
+        "Too large to render in full",
+        "{} front panel interfaces, {} application interfaces".format(
+            summary.front_panel_ports, summary.app_ports
+        ),
+        "{} FPGAs with {} apps".format(summary.fpgas, summary.apps),
+        "{} connections".format(summary.connections),
+    ]
+    type_counts = sorted(
+        summary.connection_types.items(), key=lambda item: (-item[1], item[0])
+    )
+    for types, count in type_counts[:max_type_lines]:
+        lines.append("  {}: {}".format(" & ".join(types) or "untyped", count))
+    if len(type_counts) > max_type_lines:
+        lines.append("  ... {} more types".format(len(type_counts) - max_type_lines))
 
+    line_height = 50
+    width = 2000
+    height = 2 * _COLLECTION_SPACING + line_height * (len(lines) + 1)
 
-def generate_system_svg_stream(
-    stream,
+    canvas = (template or DEFAULT_TEMPLATE).new_canvas(
+        width, height, degradation=DEGRADATION_SUMMARY, fill="white"
+    )
+    drawing = canvas.drawing
+
+    box_size = (width - 2 * _COLLECTION_SPACING, height - 2 * _COLLECTION_SPACING)
+    box = canvas.add(drawing.g(id="summary", fill="black"), "summary")
+    box.add(
+        drawing.rect(
+            insert=(_COLLECTION_SPACING, _COLLECTION_SPACING),
+            size=box_size,
+            fill="white",
+            stroke="black",
+            stroke_width=6,
+        )
+    )
+    canvas.layout.add_box("summary", (_COLLECTION_SPACING, _COLLECTION_SPACING) + box_size)
+
+    y = _COLLECTION_SPACING + line_height
+    for line in lines:
+        box.add(
+            drawing.text(
+                line,
+                insert=(_COLLECTION_SPACING + 40, y),
+                style="font-family:monospace",
+                font_size=30,
+            )
+        )
+        y += line_height
+
+    return canvas
+
+
+def build_system_canvas(
     interfaces,
     connections,
     fpga_apps,
     app_shapes,
     dominant_type=None,
     onchip_connections=None,
+    fanout_threshold=None,
+    bundle_tolerance=None,
+    degradation=DEGRADATION_NONE,
+    deadline=None,
+    timer=None,
+    template=None,
+    content_hash=False,
+    front_panel_rows=1,
+    max_row_width=None,
+    fpga_rows=1,
+    connection_colours=None,
 ):
-    fpp = FrontPanelPorts(len(get_sorted_itfs(interfaces, "et")))
+    """
+    Lays out and draws the whole system, returning the `Canvas`. The SVG
+    document is available as `canvas.drawing` and the computed geometry as
+    `canvas.layout`.
+
+    The arguments are only read, and all render state is owned by the
+    returned canvas, so systems can be rendered concurrently from several
+    threads (see `switch_config_render.parallel`).
+
+    If `fanout_threshold` is set, unidirectional connections of the same
+    types that share a source are drawn as a single bus as soon as the
+    source drives at least `fanout_threshold` destinations. As every
+    destination has exactly one source, only shared sources can fan out.
+
+    If `bundle_tolerance` is set, the remaining cross-connects of the same
+    types whose sources and destinations lie within `bundle_tolerance` of
+    each other along the x axis are bundled along a shared corridor.
+
+    `degradation` leaves out detail as described in
+    `switch_config_render.budget`; from `DEGRADATION_AGGREGATED` on, fan-out
+    and bundling are not used. If `timer`, by default
+    `timeit.default_timer`, passes `deadline`, rendering is abandoned by
+    raising `RenderBudgetExceeded`.
+
+    The markers and background are taken from the `DocumentTemplate`
+    `template`, or from `DEFAULT_TEMPLATE` if it is not set. Its
+    fingerprint is part of the content hash.
+
+    The front panel interfaces wrap onto `front_panel_rows` rows and the
+    interfaces of every FPGA onto `fpga_rows` rows. If `max_row_width` is
+    set, the front panel and every FPGA get as many more rows as they need
+    to be at most that wide, and the FPGAs wrap onto as many lines of boxes
+    as needed to stay within it too. This keeps the aspect ratio of
+    switches with many interfaces in check.
+
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> canvas = build_system_canvas(
+    ...     max_row_width=8000, **get_synthetic_system(256, fpga_count=8))
+    >>> canvas.layout.width <= 8000 + 2 * _COLLECTION_SPACING + _LEGEND_WIDTH
+    True
+
+    Connection types are coloured from the dict `connection_colours` if it
+    is given, which gets the colours of new types added, so that several
+    renders can share a palette. Unlike the other arguments it is modified,
+    so it must not be shared between threads.
+
+    The output only depends on the contents of the inputs, not on the order
+    of their dict keys. If `content_hash` is set, a SHA-256 digest of the
+    inputs and the options that affect the output is embedded in the SVG
+    metadata and stored in `canvas.content_hash` (see
+    `switch_config_render.digest`).
+    """
+    if degradation >= DEGRADATION_AGGREGATED:
+        fanout_threshold = bundle_tolerance = None
+
+    template = template or DEFAULT_TEMPLATE
+    digest = None
+    if content_hash:
+        digest = get_content_hash(
+            {
+                "interfaces": interfaces,
+                "connections": connections,
+                "fpga_apps": fpga_apps,
+                "app_shapes": app_shapes,
+                "onchip_connections": onchip_connections or [],
+            },
+            {
+                "dominant_type": dominant_type,
+                "fanout_threshold": fanout_threshold,
+                "bundle_tolerance": bundle_tolerance,
+                "degradation": degradation,
+                "front_panel_rows": front_panel_rows,
+                "max_row_width": max_row_width,
+                "fpga_rows": fpga_rows,
+                "template": template.fingerprint,
+                "connection_colours": sorted((connection_colours or {}).items()),
+            },
+        )
+
+    front_panel_itfs = get_sorted_itfs(interfaces, "et")
+    if max_row_width:
+        front_panel_rows = max(
+            front_panel_rows, get_row_count(len(front_panel_itfs), max_row_width)
+        )
+    fpp = FrontPanelPorts(len(front_panel_itfs), rows=front_panel_rows)
+    shape_bounds = get_shape_bounds(app_shapes)
+
+    # The caller's inputs are never modified, so the same inputs can be
+    # rendered from several threads at once
+    onchip_connections = list(onchip_connections or [])
 
     fpga_ids = []
     fpgas = {}
-    for fpga_id, apps in fpga_apps.items():
-        ap_interfaces = sum([app["ports"] for app in apps.values()], [])
+    for fpga_id, apps in sorted(fpga_apps.items()):
+        ap_interfaces = [itf for app in apps.values() for itf in app["ports"]]
         fpgas[fpga_id] = FPGAPorts(
-            fpga_id, ap_interfaces, apps, app_shapes, onchip_connections
+            fpga_id,
+            ap_interfaces,
+            apps,
+            app_shapes,
+            onchip_connections,
+            shape_bounds=shape_bounds,
+            rows=fpga_rows,
+            max_row_width=max_row_width,
         )
 
-        # Remove the onchip connections within this FPGA
-        for conn in fpgas[fpga_id].onchip_connections:
-            onchip_connections.remove(conn)
+        # Leave only the connections that are not within this FPGA
+        fpga_conn_ids = set(id(conn) for conn in fpgas[fpga_id].onchip_connections)
+        onchip_connections = [
+            conn for conn in onchip_connections if id(conn) not in fpga_conn_ids
+        ]
 
         avg_itf = get_average_itf_idx(ap_interfaces, "ap")
         fpga_ids.append((fpga_id, avg_itf))
 
-    fpga_ids = [fpga_id for fpga_id, _ in sorted(fpga_ids, key=lambda info: info[1])]
+    fpga_ids = [
+        fpga_id for fpga_id, _ in sorted(fpga_ids, key=lambda info: (info[1], info[0]))
+    ]
 
-    fpgas_width = _COLLECTION_SPACING
-    fpgas_height = 0
-    for fpga_box in fpgas.values():
-        fpgas_width += fpga_box.width + _COLLECTION_SPACING
-        fpgas_height = max(fpgas_height, fpga_box.height)
+    # The FPGAs are drawn left to right, on several lines of boxes if they
+    # would be wider than `max_row_width` on one
+    fpga_lines = []
+    line_width = 0
+    for fpga_id in fpga_ids:
+        width = fpgas[fpga_id].width
+        if not fpga_lines or (
+            max_row_width
+            and line_width + _COLLECTION_SPACING + width > max_row_width
+        ):
+            fpga_lines.append([fpga_id])
+            line_width = width
+        else:
+            fpga_lines[-1].append(fpga_id)
+            line_width += _COLLECTION_SPACING + width
+
+    line_widths = [
+        _COLLECTION_SPACING
+        + sum(fpgas[fpga_id].width + _COLLECTION_SPACING for fpga_id in line)
+        for line in fpga_lines
+    ]
+    line_heights = [
+        max(fpgas[fpga_id].height for fpga_id in line) for line in fpga_lines
+    ]
+    fpgas_width = max(line_widths or [_COLLECTION_SPACING])
+    fpgas_height = sum(line_heights)
+    if fpga_lines:
+        fpgas_height += (len(fpga_lines) - 1) * _COLLECTION_SPACING
 
     # Center the boxes with respect to each other
     fpp_x = _COLLECTION_SPACING
@@ -430,65 +1013,97 @@ def generate_system_svg_stream(
         else:
             drawing_height += _COLLECTION_SPACING / 2
 
-    drawing = svgwrite.Drawing(
-        debug=True,
-        size=(
-            "{}mm".format(str(drawing_width / 10)),
-            "{}mm".format(str(drawing_height / 10)),
-        ),
-        viewBox=("0 0 {} {}".format(drawing_width, drawing_height)),
+    canvas = template.new_canvas(
+        drawing_width,
+        drawing_height,
+        degradation=degradation,
+        deadline=deadline,
+        timer=timer,
         fill="white",
     )
-
-    drawing.add(
-        drawing.rect(
-            insert=(0, 0), size=("100%", "100%"), rx=None, ry=None, fill="white"
-        )
-    )
-    canvas = Canvas(drawing)
+    if connection_colours is not None:
+        canvas.connection_colours = connection_colours
+    if digest is not None:
+        canvas.content_hash = digest
+        add_content_hash_metadata(canvas.drawing, digest)
 
     # Render all the front panel interfaces
     fpp.render_box(canvas, fpp_x, _COLLECTION_SPACING / 2.0)
-    for itf in get_sorted_itfs(interfaces, "et"):
+    for itf in front_panel_itfs:
         fpp.render_next_interface(canvas, itf, interfaces[itf])
 
     # Render all the FPGAs, their interfaces and their apps
-    for fpga_id in fpga_ids:
-        fpgas[fpga_id].render_fpga_internals(
-            canvas, fpgas_x, fpgas_y, interfaces
-        )
-        fpgas_x += fpgas[fpga_id].width + _COLLECTION_SPACING
+    for line, line_width, line_height in zip(fpga_lines, line_widths, line_heights):
+        line_x = fpgas_x
+        if line_width < fpgas_width:
+            line_x += (fpgas_width - line_width) / 2.0
+        for fpga_id in line:
+            fpgas[fpga_id].render_fpga_internals(
+                canvas, line_x, fpgas_y, interfaces
+            )
+            line_x += fpgas[fpga_id].width + _COLLECTION_SPACING
+        fpgas_y += line_height + _COLLECTION_SPACING
 
-    # Render the connections
+    # Render the connections. They are visited in sorted order, so that the
+    # output only depends on the contents of the inputs, not on their order
     singledir_connections = copy.deepcopy(connections)
     bidir_connections = {}
-    for dst, src in connections.items():
+    for dst, src in sorted(connections.items()):
         if src in singledir_connections and singledir_connections[src] == dst:
             bidir_connections[dst] = src
             del singledir_connections[dst]
             del singledir_connections[src]
 
+    cross_connects = []
     for endp1, endp2 in bidir_connections.items():
-        canvas.render_connection(
-            endp1,
-            endp2,
-            bidir=True,
-            onchip=False,
-            types=get_connection_types(
-                interfaces, endp1, endp2, bidir=True, dominant_type=dominant_type
-            ),
+        types = get_connection_types(
+            interfaces, endp1, endp2, bidir=True, dominant_type=dominant_type
         )
+        cross_connects.append((endp1, endp2, True, types))
 
-    for dst, src in singledir_connections.items():
-        canvas.render_connection(
-            dst,
-            src,
-            bidir=False,
-            onchip=False,
-            types=get_connection_types(
-                interfaces, dst, src, bidir=False, dominant_type=dominant_type
-            ),
+    fanouts = {}
+    for dst, src in sorted(singledir_connections.items()):
+        types = get_connection_types(
+            interfaces, dst, src, bidir=False, dominant_type=dominant_type
         )
+        fanouts.setdefault((src, types), []).append(dst)
+
+    fanout_buses = []
+    for (src, types), dsts in fanouts.items():
+        if fanout_threshold and len(dsts) >= fanout_threshold:
+            fanout_buses.append((src, dsts, types))
+        else:
+            cross_connects += [(dst, src, False, types) for dst in dsts]
+
+    bundles = []
+    if bundle_tolerance:
+        bundle_candidates = []
+        for dst, src, bidir, types in cross_connects:
+            src_coords, dst_coords = canvas.get_connection_coords(
+                dst, src, bidir, onchip=False
+            )
+            bundle_candidates.append(
+                (types, src_coords[0][0], dst_coords[0][0], (dst, src, bidir, types))
+            )
+
+        cross_connects = []
+        for bundle in get_corridor_bundles(bundle_candidates, bundle_tolerance):
+            if len(bundle) == 1:
+                cross_connects += bundle
+            else:
+                bundles.append(bundle)
+
+    if degradation >= DEGRADATION_AGGREGATED:
+        canvas.render_aggregated_connections(cross_connects, onchip=False)
+    else:
+        for dst, src, bidir, types in cross_connects:
+            canvas.render_connection(dst, src, bidir=bidir, onchip=False, types=types)
+
+    for src, dsts, types in fanout_buses:
+        canvas.render_fanout(src, dsts, types=types)
+
+    for bundle in bundles:
+        canvas.render_bundle([conn[:3] for conn in bundle], types=bundle[0][3])
 
     for fpga_id in fpga_ids:
         fpgas[fpga_id].draw_apps_connections(canvas)
@@ -496,9 +1111,13 @@ def generate_system_svg_stream(
     if onchip_connections:
         for conn in onchip_connections:
             canvas.render_square_connection(
-                conn["dst"], conn["src"], conn["desc"], inter_chip_connection_lower_y
+                conn["dst"],
+                conn["src"],
+                conn["desc"],
+                inter_chip_connection_lower_y,
+                group="interchip_links",
             )
             inter_chip_connection_lower_y += _ONCHIP_CONNECTION_CLEARANCE
 
     canvas.render_legend(boxes_width, _COLLECTION_SPACING, _LEGEND_WIDTH)
-    canvas.drawing.write(stream)
+    return canvas
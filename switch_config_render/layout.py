@@ -0,0 +1,72 @@
+class Layout(object):
+    """
+    Records the geometry of everything placed on a `Canvas`, so that output
+    formats other than SVG can be produced without recomputing the layout.
+
+    Rectangles are stored as `(x, y, width, height)` tuples in SVG user
+    units.
+    """
+
+    __slots__ = ("width", "height", "boxes", "ports", "apps", "connections")
+
+    def __init__(self):
+        self.width = None
+        self.height = None
+        self.boxes = {}
+        self.ports = {}
+        self.apps = {}
+        self.connections = []
+
+    def add_box(self, box_id, rect):
+        self.boxes[box_id] = rect
+
+    def add_port(self, itf, collection_id, rect):
+        self.ports[itf] = (collection_id, rect)
+
+    def add_app(self, endpoint_name, rect):
+        self.apps[endpoint_name] = rect
+
+    def add_connection(self, dst, src, kind, types, path):
+        self.connections.append((dst, src, kind, types, path))
+
+    def to_dict(self):
+        """
+        Returns a JSON serialisable description of the layout
+
+        >>> layout = Layout()
+        >>> layout.width, layout.height = 100, 50
+        >>> layout.add_port("et1", "front_panel_interfaces", (10, 10, 20, 20))
+        >>> layout.to_dict()["ports"]
+        [{'id': 'et1', 'collection': 'front_panel_interfaces', 'x': 10, 'y': 10, 'width': 20, 'height': 20}]
+        """
+
+        def rect_dict(rect):
+            x, y, width, height = rect
+            return {"x": x, "y": y, "width": width, "height": height}
+
+        def with_id(item_id, extra, rect):
+            item = {"id": item_id}
+            item.update(extra)
+            item.update(rect_dict(rect))
+            return item
+
+        return {
+            "width": self.width,
+            "height": self.height,
+            "boxes": [with_id(k, {}, v) for k, v in self.boxes.items()],
+            "ports": [
+                with_id(k, {"collection": coll}, rect)
+                for k, (coll, rect) in self.ports.items()
+            ],
+            "apps": [with_id(k, {}, v) for k, v in self.apps.items()],
+            "connections": [
+                {
+                    "dst": dst,
+                    "src": src,
+                    "kind": kind,
+                    "types": list(types) if types else [],
+                    "path": path,
+                }
+                for dst, src, kind, types, path in self.connections
+            ],
+        }
@@ -0,0 +1,258 @@
+import json
+import os
+
+from switch_config_render.generate_svg import generate_system_svg
+
+_REQUIRED_FIELDS = ("interfaces", "connections", "fpga_apps")
+
+
+class ConfigRecordError(ValueError):
+    """
+    Raised for a record of a config dump that cannot be rendered. `lineno`
+    is the 1-based line number and `offset` the byte offset of the start of
+    the offending line within the dump.
+    """
+
+    def __init__(self, message, lineno, offset):
+        super(ConfigRecordError, self).__init__(
+            "line {} (offset {}): {}".format(lineno, offset, message)
+        )
+        self.lineno = lineno
+        self.offset = offset
+
+
+class SwitchConfig(object):
+    """
+    A single switch record read from a config dump. `kwargs` holds the
+    keyword arguments for `generate_system_svg_stream`.
+    """
+
+    __slots__ = ("name", "lineno", "offset", "kwargs")
+
+    def __init__(self, name, lineno, offset, kwargs):
+        self.name = name
+        self.lineno = lineno
+        self.offset = offset
+        self.kwargs = kwargs
+
+
+def record_to_kwargs(record, app_shapes=None):
+    """
+    Maps a decoded config record onto the keyword arguments expected by
+    `generate_system_svg_stream`. `app_shapes` is used for records that
+    do not define their own shapes.
+
+    >>> kwargs = record_to_kwargs(
+    ...     {"interfaces": {}, "connections": {}, "fpga_apps": {}},
+    ...     app_shapes={"mux": [[1, 0], [0, 2], [4, 2], [3, 0], [1, 0]]})
+    >>> sorted(kwargs)
+    ['app_shapes', 'connections', 'dominant_type', 'fpga_apps', 'interfaces', 'onchip_connections']
+
+    >>> record_to_kwargs({"interfaces": {}})
+    Traceback (most recent call last):
+    ...
+    ValueError: missing field "connections"
+
+    >>> record_to_kwargs({"interfaces": {}, "connections": {}, "fpga_apps": {"fpga": 3}}, {})
+    Traceback (most recent call last):
+    ...
+    ValueError: apps of FPGA "fpga" are not a JSON object
+
+    Values of the wrong type are rejected here rather than failing the
+    render:
+
+    >>> record = {"interfaces": {"ap1": {}, "et1": {}},
+    ...           "connections": {"et1": ["ap1"]}, "fpga_apps": {}}
+    >>> record_to_kwargs(record, {})
+    Traceback (most recent call last):
+    ...
+    ValueError: unknown interface "['ap1']"
+    >>> record["connections"] = {"et1": "ap1"}
+    >>> record["fpga_apps"] = {"fpga": {"app": {"type": ["mux"], "ports": ["ap1"]}}}
+    >>> record_to_kwargs(record, {"mux": []})
+    Traceback (most recent call last):
+    ...
+    ValueError: unknown shape for app "app"
+    >>> record["fpga_apps"] = {"fpga": {"app": {"type": "mux", "ports": ["et1"]}}}
+    >>> record_to_kwargs(record, {"mux": []})
+    Traceback (most recent call last):
+    ...
+    ValueError: app "app" is bound to the non-app interface "et1"
+    >>> record["fpga_apps"] = {"fpga": {"app": {"type": "mux", "ports": ["ap1"]}}}
+    >>> record["onchip_connections"] = [{"dst": 3, "src": "ap1", "desc": "x"}]
+    >>> record_to_kwargs(record, {"mux": []})
+    Traceback (most recent call last):
+    ...
+    ValueError: unknown on-chip endpoint "3"
+    >>> record["onchip_connections"] = [{"dst": "fpga.app", "src": "ap1", "desc": "x"}]
+    >>> record_to_kwargs(record, {"mux": []})["onchip_connections"]
+    [{'dst': 'fpga.app', 'src': 'ap1', 'desc': 'x'}]
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not a JSON object")
+
+    for field in _REQUIRED_FIELDS:
+        if field not in record:
+            raise ValueError('missing field "{}"'.format(field))
+        if not isinstance(record[field], dict):
+            raise ValueError('field "{}" is not a JSON object'.format(field))
+
+    shapes = record.get("app_shapes", app_shapes)
+    if not isinstance(shapes, dict):
+        raise ValueError('missing field "app_shapes"')
+
+    interfaces = record["interfaces"]
+    for itf, params in interfaces.items():
+        if not isinstance(params, dict):
+            raise ValueError('interface "{}" is not a JSON object'.format(itf))
+
+    # Endpoints that on-chip connections can refer to: the app ports, which
+    # are drawn on their FPGA, and the apps themselves
+    onchip_endpoints = set()
+    for fpga, apps in record["fpga_apps"].items():
+        if not isinstance(apps, dict):
+            raise ValueError('apps of FPGA "{}" are not a JSON object'.format(fpga))
+        for app, params in apps.items():
+            if not isinstance(params, dict):
+                raise ValueError('app "{}" is not a JSON object'.format(app))
+            app_type = params.get("type")
+            if not isinstance(app_type, str) or app_type not in shapes:
+                raise ValueError('unknown shape for app "{}"'.format(app))
+            if not isinstance(params.get("ports"), list):
+                raise ValueError('ports of app "{}" are not a JSON array'.format(app))
+            for port in params["ports"]:
+                if not isinstance(port, str) or port not in interfaces:
+                    raise ValueError('unknown interface "{}"'.format(port))
+                if not port.startswith("ap"):
+                    raise ValueError(
+                        'app "{}" is bound to the non-app interface "{}"'.format(
+                            app, port
+                        )
+                    )
+                onchip_endpoints.add(port)
+            onchip_endpoints.add("{}.{}".format(fpga, app))
+
+    for dst, src in record["connections"].items():
+        for itf in (dst, src):
+            if not isinstance(itf, str) or itf not in interfaces:
+                raise ValueError('unknown interface "{}"'.format(itf))
+
+    onchip_connections = record.get("onchip_connections")
+    if onchip_connections is not None:
+        if not isinstance(onchip_connections, list):
+            raise ValueError('field "onchip_connections" is not a JSON array')
+        for conn in onchip_connections:
+            if not isinstance(conn, dict):
+                raise ValueError("on-chip connection is not a JSON object")
+            if not isinstance(conn.get("desc"), str):
+                raise ValueError("on-chip connection has no description")
+            for endpoint in (conn.get("dst"), conn.get("src")):
+                if not isinstance(endpoint, str) or endpoint not in onchip_endpoints:
+                    raise ValueError('unknown on-chip endpoint "{}"'.format(endpoint))
+
+    return {
+        "interfaces": record["interfaces"],
+        "connections": record["connections"],
+        "fpga_apps": record["fpga_apps"],
+        "app_shapes": shapes,
+        "dominant_type": record.get("dominant_type"),
+        "onchip_connections": onchip_connections,
+    }
+
+
+def iter_switch_configs(fileobj, app_shapes=None, errors=None):
+    """
+    Lazily reads a JSON Lines config dump opened in binary mode, yielding
+    one `SwitchConfig` per valid record. Only a single record is held in
+    memory at a time.
+
+    Malformed records are skipped. If `errors` is a list, a
+    `ConfigRecordError` is appended to it for every skipped record.
+
+    >>> import io
+    >>> dump = io.BytesIO(
+    ...     b'{"name": "sw1", "interfaces": {}, "connections": {}, "fpga_apps": {}}\\n'
+    ...     b'not json\\n'
+    ...     b'\\n'
+    ...     b'{"interfaces": {}, "connections": {}, "fpga_apps": {}}\\n')
+    >>> errors = []
+    >>> [(c.name, c.lineno, c.offset) for c in iter_switch_configs(dump, {}, errors)]
+    [('sw1', 1, 0), ('line_4', 4, 80)]
+    >>> [str(e) for e in errors]
+    ['line 2 (offset 70): invalid JSON']
+    """
+    offset = 0
+    for lineno, line in enumerate(iter(fileobj.readline, b""), 1):
+        line_offset = offset
+        offset += len(line)
+
+        if not line.strip():
+            continue
+
+        try:
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                raise ValueError("invalid JSON")
+            kwargs = record_to_kwargs(record, app_shapes)
+        except Exception as e:
+            if errors is not None:
+                errors.append(ConfigRecordError(str(e), lineno, line_offset))
+            continue
+
+        name = record.get("name", "line_{}".format(lineno))
+        yield SwitchConfig(name, lineno, line_offset, kwargs)
+
+
+def is_safe_name(name):
+    """
+    Checks that a record name can be used as a filename within the output
+    directory
+
+    >>> [is_safe_name(name) for name in ["sw1", "a/b", "..", "../sw1", ""]]
+    [True, False, False, False, False]
+    """
+    separators = [sep for sep in ("/", "\\", os.sep, os.altsep) if sep]
+    return (
+        bool(name)
+        and ".." not in name
+        and not any(sep in name for sep in separators)
+    )
+
+
+def render_config_dump(fileobj, output_dir, app_shapes=None, errors=None):
+    """
+    Renders every switch of a JSON Lines config dump to
+    `<output_dir>/<name>.svg`, one record at a time. Returns the list of
+    written filenames. Malformed records are reported through `errors` (see
+    `iter_switch_configs`), as are records whose name is not a plain
+    filename and records that fail to render or be written.
+    """
+    filenames = []
+    for config in iter_switch_configs(fileobj, app_shapes, errors):
+        if not isinstance(config.name, str) or not is_safe_name(config.name):
+            if errors is not None:
+                errors.append(
+                    ConfigRecordError(
+                        "invalid name {!r}".format(config.name),
+                        config.lineno,
+                        config.offset,
+                    )
+                )
+            continue
+
+        filename = os.path.join(output_dir, "{}.svg".format(config.name))
+        try:
+            generate_system_svg(filename, **config.kwargs)
+        except Exception as e:
+            if errors is not None:
+                errors.append(
+                    ConfigRecordError(
+                        "render failed: {!r}".format(e), config.lineno, config.offset
+                    )
+                )
+            if os.path.exists(filename):
+                os.remove(filename)
+            continue
+        filenames.append(filename)
+    return filenames
@@ -0,0 +1,354 @@
+import gzip
+import json
+import math
+import os
+
+import svgwrite
+
+from switch_config_render.binary import encode_layout
+from switch_config_render.generate_svg import build_system_canvas
+from switch_config_render.spatial import (
+    DEFAULT_CELL_SIZE,
+    build_spatial_index,
+    get_element_bounds,
+    get_rects_bounds,
+)
+from switch_config_render.template import XML_HEADER
+
+FRONT_PANEL_FRAGMENT = "front_panel"
+INTERCHIP_FRAGMENT = "interchip_links"
+
+try:
+    from html import escape
+except ImportError:  # Python 2
+    from cgi import escape
+
+
+class RenderedSystem(object):
+    """
+    The result of a single layout pass, shared by all the output sinks. The
+    SVG document is only serialised once, the first time it is requested.
+    """
+
+    __slots__ = ("canvas", "layout", "_svg_text", "_spatial_indexes")
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.layout = canvas.layout
+        self._svg_text = None
+        self._spatial_indexes = {}
+
+    def svg_text(self):
+        if self._svg_text is None:
+            self._svg_text = XML_HEADER + self.canvas.drawing.tostring()
+        return self._svg_text
+
+    def spatial_index(self, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Gets the `SpatialIndex` of the layout (see
+        `switch_config_render.spatial`), building it on first use
+        """
+        if cell_size not in self._spatial_indexes:
+            self._spatial_indexes[cell_size] = build_spatial_index(
+                self.layout, cell_size
+            )
+        return self._spatial_indexes[cell_size]
+
+
+class SvgSink(object):
+    """Writes the SVG document to a text stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, rendered):
+        self.stream.write(rendered.svg_text())
+
+
+class SvgzSink(object):
+    """Writes the gzip compressed SVG document to a binary stream"""
+
+    def __init__(self, stream, compresslevel=9):
+        self.stream = stream
+        self.compresslevel = compresslevel
+
+    def write(self, rendered):
+        # A fixed mtime keeps the output identical for identical input
+        with gzip.GzipFile(
+            fileobj=self.stream, mode="wb", compresslevel=self.compresslevel, mtime=0
+        ) as gz:
+            gz.write(rendered.svg_text().encode("utf-8"))
+
+
+class HitMapJsonSink(object):
+    """
+    Writes the port, app and connection coordinates as JSON to a text
+    stream, e.g. to create click targets on top of the SVG
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, rendered):
+        json.dump(rendered.layout.to_dict(), self.stream, sort_keys=True)
+
+
+class SpatialIndexJsonSink(object):
+    """
+    Writes the spatial index of the layout as JSON to a text stream, so
+    that a viewer can hit-test the SVG without parsing it. Load it with
+    `SpatialIndex.from_dict`.
+    """
+
+    def __init__(self, stream, cell_size=DEFAULT_CELL_SIZE):
+        self.stream = stream
+        self.cell_size = cell_size
+
+    def write(self, rendered):
+        json.dump(
+            rendered.spatial_index(self.cell_size).to_dict(),
+            self.stream,
+            sort_keys=True,
+        )
+
+
+class BinaryLayoutSink(object):
+    """
+    Writes the layout in the binary format of `switch_config_render.binary`
+    to a binary stream
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, rendered):
+        self.stream.write(encode_layout(rendered.layout))
+
+
+class HtmlImageMapSink(object):
+    """
+    Writes an HTML page to a text stream that shows the SVG found at
+    `image_src` with an image map over every port and app. `scale` converts
+    SVG user units to image pixels.
+    """
+
+    def __init__(self, stream, image_src, scale=0.1, map_name="switch"):
+        self.stream = stream
+        self.image_src = image_src
+        self.scale = scale
+        self.map_name = map_name
+
+    def write(self, rendered):
+        layout = rendered.layout
+
+        def area(name, rect):
+            x, y, width, height = [v * self.scale for v in rect]
+            return '<area shape="rect" coords="{},{},{},{}" alt="{n}" title="{n}" href="#{n}">'.format(
+                int(x), int(y), int(x + width), int(y + height), n=escape(name, True)
+            )
+
+        areas = [area(itf, rect) for itf, (_, rect) in layout.ports.items()]
+        areas += [area(app, rect) for app, rect in layout.apps.items()]
+
+        self.stream.write(
+            "<!DOCTYPE html>\n<html>\n<body>\n"
+            '<img src="{}" width="{}" height="{}" usemap="#{}">\n'
+            '<map name="{}">\n{}\n</map>\n'
+            "</body>\n</html>\n".format(
+                escape(self.image_src, True),
+                int(layout.width * self.scale),
+                int(layout.height * self.scale),
+                escape(self.map_name, True),
+                escape(self.map_name, True),
+                "\n".join(areas),
+            )
+        )
+
+
+def get_fragment_id(group, fpga_ids):
+    """
+    Gets the fragment of a split render that the elements of the logical
+    `group` (see `switch_config_render.stats`) belong to: one of the
+    `fpga_ids`, `INTERCHIP_FRAGMENT` or `FRONT_PANEL_FRAGMENT`
+
+    >>> get_fragment_id("app:fpga_0.app_1", ["fpga_0", "fpga_1"])
+    'fpga_0'
+    >>> get_fragment_id("onchip_links:fpga_1", ["fpga_0", "fpga_1"])
+    'fpga_1'
+    >>> get_fragment_id("legend", ["fpga_0", "fpga_1"])
+    'front_panel'
+    """
+    kind, _, name = group.partition(":")
+    if kind == "interchip_links":
+        return INTERCHIP_FRAGMENT
+    if kind in ("fpga", "app_links", "onchip_links") and name in fpga_ids:
+        return name
+    if kind == "app":
+        # App endpoints are named "<fpga>.<app>", where FPGA ids may contain dots
+        owners = [fpga_id for fpga_id in fpga_ids if name.startswith(fpga_id + ".")]
+        if owners:
+            return max(owners, key=len)
+    return FRONT_PANEL_FRAGMENT
+
+
+class SplitSvgSink(object):
+    """
+    Writes the document as separate SVG fragments to `output_dir`, so that
+    a viewer can load them on demand:
+
+    * `<name>.front_panel.svg`: the front panel, the cross-connects and the
+      legend
+    * `<name>.<fpga>.svg`: an FPGA box with its apps, app links and on-chip
+      links
+    * `<name>.interchip_links.svg`: the on-chip links between FPGAs, if any
+
+    Every fragment uses the coordinates of the whole document, so the
+    fragments line up when they are stacked, and its view box is the
+    bounding box of its elements, including their strokes, arrowheads and
+    an estimate of their text. `<name>.manifest.json` lists the file,
+    position and size of every fragment, in drawing order.
+
+    >>> import shutil, tempfile
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> output_dir = tempfile.mkdtemp()
+    >>> _ = generate_system_outputs([SplitSvgSink(output_dir)], **get_synthetic_system(8))
+    >>> with open(os.path.join(output_dir, "switch.manifest.json")) as fileobj:
+    ...     [fragment["file"] for fragment in json.load(fileobj)["fragments"]]
+    ['switch.front_panel.svg', 'switch.fpga_0.svg', 'switch.fpga_1.svg']
+
+    The front panel fragment reaches down to the ends of the cross-connects
+    and right to the legend, and the inter-chip links only cover the space
+    below the apps they link:
+
+    >>> system = get_synthetic_system(8)
+    >>> system["onchip_connections"] = [{"dst": "fpga_1.app_0", "src": "fpga_0.app_0", "desc": "x"}]
+    >>> rendered = generate_system_outputs([SplitSvgSink(output_dir)], **system)
+    >>> rendered.layout.boxes["fpga_0"], rendered.layout.boxes["fpga_1"]
+    ((100, 1170.0, 1200, 750), (1400, 1170.0, 1200, 750))
+    >>> with open(os.path.join(output_dir, "switch.manifest.json")) as fileobj:
+    ...     for fragment in json.load(fileobj)["fragments"]:
+    ...         print("{id}: {x} {y} {width} {height}".format(**fragment))
+    front_panel: 304 47 2599 1209
+    fpga_0: 97 1167 1206 756
+    fpga_1: 1397 1167 1206 756
+    interchip_links: 646 1786 1408 208
+    >>> shutil.rmtree(output_dir)
+    """
+
+    def __init__(self, output_dir, name="switch"):
+        self.output_dir = output_dir
+        self.name = name
+
+    def get_fragment_rect(self, elements):
+        """
+        Gets the bounds of the elements of a fragment, rounded outwards to
+        whole units
+        """
+        x, y, width, height = get_rects_bounds(
+            get_element_bounds(element) for element in elements
+        )
+        min_x, min_y = int(math.floor(x)), int(math.floor(y))
+        return (
+            min_x,
+            min_y,
+            int(math.ceil(x + width)) - min_x,
+            int(math.ceil(y + height)) - min_y,
+        )
+
+    def write(self, rendered):
+        canvas = rendered.canvas
+        fpga_ids = [
+            box_id
+            for box_id in rendered.layout.boxes
+            if "fpga:" + box_id in canvas.element_groups.values()
+        ]
+
+        # The top level elements and connections of every fragment
+        fragment_ids = []
+        fragments = {}
+
+        def add(element, group, connection):
+            fragment_id = get_fragment_id(group, fpga_ids)
+            if fragment_id not in fragments:
+                fragment_ids.append(fragment_id)
+                fragments[fragment_id] = ([], [])
+            fragments[fragment_id][connection].append(element)
+
+        for element in canvas.drawing.elements:
+            if element is canvas.connections:
+                for connection in element.elements:
+                    add(connection, canvas.element_groups[id(connection)], True)
+            elif element.elementname not in ("defs", "metadata"):
+                group = canvas.element_groups.get(id(element), "other")
+                if group != "background":
+                    add(element, group, False)
+
+        manifest = {
+            "width": rendered.layout.width,
+            "height": rendered.layout.height,
+            "content_hash": canvas.content_hash,
+            "fragments": [],
+        }
+        for fragment_id in fragment_ids:
+            elements, connections = fragments[fragment_id]
+            x, y, width, height = self.get_fragment_rect(elements + connections)
+            drawing = svgwrite.Drawing(
+                debug=True,
+                size=("{}mm".format(str(width / 10)), "{}mm".format(str(height / 10))),
+                viewBox=("{} {} {} {}".format(x, y, width, height)),
+                fill="white",
+            )
+            canvas.template.add_defs(drawing)
+
+            for element in elements:
+                drawing.add(element)
+            if connections:
+                connections_group = drawing.add(drawing.g(id="connections"))
+                for connection in connections:
+                    connections_group.add(connection)
+
+            filename = "{}.{}.svg".format(self.name, fragment_id)
+            with open(os.path.join(self.output_dir, filename), "w") as fileobj:
+                drawing.write(fileobj)
+
+            manifest["fragments"].append(
+                {
+                    "id": fragment_id,
+                    "file": filename,
+                    "x": x,
+                    "y": y,
+                    "width": width,
+                    "height": height,
+                }
+            )
+
+        manifest_filename = os.path.join(
+            self.output_dir, "{}.manifest.json".format(self.name)
+        )
+        with open(manifest_filename, "w") as fileobj:
+            json.dump(manifest, fileobj, indent=2, sort_keys=True)
+
+
+def generate_system_outputs(sinks, *args, **kwargs):
+    """
+    Computes the system layout once and writes it to every sink in `sinks`,
+    e.g. `[SvgSink(svg_file), HitMapJsonSink(json_file)]`. The remaining
+    arguments are the same as for `generate_system_svg_stream`.
+
+    >>> import io
+    >>> svg, hitmap = io.StringIO(), io.StringIO()
+    >>> interfaces = {"et1": {}, "ap1": {}}
+    >>> fpga_apps = {"fpga": {"app": {"type": "box", "ports": ["ap1"]}}}
+    >>> shapes = {"box": [(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)]}
+    >>> rendered = generate_system_outputs(
+    ...     [SvgSink(svg), HitMapJsonSink(hitmap)],
+    ...     interfaces, {"ap1": "et1"}, fpga_apps, shapes)
+    >>> svg.getvalue() == rendered.svg_text()
+    True
+    >>> sorted(port["id"] for port in json.loads(hitmap.getvalue())["ports"])
+    ['ap1', 'et1']
+    """
+    rendered = RenderedSystem(build_system_canvas(*args, **kwargs))
+    for sink in sinks:
+        sink.write(rendered)
+    return rendered
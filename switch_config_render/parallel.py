@@ -0,0 +1,41 @@
+import io
+
+from switch_config_render.generate_svg import generate_system_svg_stream
+
+
+def render_system_svg(system):
+    """
+    Renders a system given as a dict of `generate_system_svg_stream`
+    keyword arguments and returns the SVG document as a string
+    """
+    stream = io.StringIO()
+    generate_system_svg_stream(stream, **system)
+    return stream.getvalue()
+
+
+def render_systems_concurrently(systems, max_workers=None):
+    """
+    Renders every system in `systems`, each a dict of
+    `generate_system_svg_stream` keyword arguments, on a pool of
+    `max_workers` threads and returns the SVG documents in input order.
+
+    Rendering is re-entrant: the inputs are never modified and each render
+    owns all of its state, so the same input dicts may also be shared
+    between concurrent renders. The output of a render does not depend on
+    what else is being rendered at the same time:
+
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> systems = [get_synthetic_system(n, fpga_count=1 + n % 3) for n in range(4, 36)]
+    >>> systems += systems
+    >>> serial = [render_system_svg(system) for system in systems]
+    >>> render_systems_concurrently(systems, max_workers=8) == serial
+    True
+
+    Rendering holds the GIL for most of its time, so threads mainly help
+    services that already serve requests from a thread pool. Use a process
+    pool to spread large batches over several cores.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(render_system_svg, systems))
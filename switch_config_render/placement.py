@@ -0,0 +1,75 @@
+from switch_config_render.utils import get_average_itf_idx, get_sorted_itfs
+
+
+def get_shape_bounds(app_shapes):
+    """
+    Gets the `(width, height)` of every app shape, as the largest x and y
+    coordinates of its vertices. Compute these once per `app_shapes` and
+    share them between all the FPGAs of a render.
+
+    >>> get_shape_bounds({"mux": [(1, 0), (0, 2), (4, 2), (3, 0), (1, 0)]})
+    {'mux': (4, 2)}
+    """
+    return {
+        shape: (max([x for x, _ in points]), max([y for _, y in points]))
+        for shape, points in app_shapes.items()
+    }
+
+
+class AppPlacement(object):
+    """
+    Where an app goes on its FPGA: `onchip_ports` and `ports` are the app's
+    interfaces with and without on-chip connections, in the order they are
+    drawn. Apps without ports of their own are `portless` and get a blank
+    interface slot instead.
+    """
+
+    __slots__ = ("name", "params", "onchip_ports", "ports", "portless")
+
+    def __init__(self, name, params, onchip_ports, ports, portless):
+        self.name = name
+        self.params = params
+        self.onchip_ports = onchip_ports
+        self.ports = ports
+        self.portless = portless
+
+
+class PlacementPlan(object):
+    """
+    The order in which the apps of one FPGA and their interfaces are drawn.
+    Apps are ordered by the average index of their interfaces, so that they
+    sit close to them, with ties broken by name. The plan is computed in
+    one pass over the apps, once per FPGA and render, and is shared by
+    everything that draws the FPGA in that render.
+
+    >>> plan = PlacementPlan(
+    ...     {"b": {"ports": ["ap3", "ap1"]}, "a": {"ports": ["ap2"]}, "c": {"ports": []}},
+    ...     onchip_endpoints=frozenset(["ap3"]))
+    >>> [(app.name, app.onchip_ports, app.ports) for app in plan.apps]
+    [('c', (), ()), ('a', (), ('ap2',)), ('b', ('ap3',), ('ap1',))]
+    """
+
+    __slots__ = ("apps",)
+
+    def __init__(self, fpga_apps, onchip_endpoints, itf_prefix="ap"):
+        apps = []
+        for name, params in fpga_apps.items():
+            avg_itf = 0
+            if params["ports"]:
+                avg_itf = get_average_itf_idx(params["ports"], itf_prefix)
+
+            ports = set(params["ports"])
+            onchip_ports = ports.intersection(onchip_endpoints)
+            ports -= onchip_ports
+
+            placement = AppPlacement(
+                name,
+                params,
+                tuple(get_sorted_itfs(onchip_ports, itf_prefix)),
+                tuple(get_sorted_itfs(ports, itf_prefix)),
+                not ports,
+            )
+            apps.append((avg_itf, name, placement))
+
+        apps.sort(key=lambda info: info[:2])
+        self.apps = tuple(placement for _, _, placement in apps)
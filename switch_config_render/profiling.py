@@ -0,0 +1,211 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+
+# The functions whose share of the render time is reported, as the label
+# and the functions counted for it, given as a part of the path of their
+# module and the function name. Only calls from outside the functions of a
+# label are counted, so no time is counted twice for a label when one of
+# its functions calls another, but labels overlap: interfaces include the
+# svgwrite elements they create.
+HOT_SPOTS = (
+    (
+        "interfaces",
+        ((os.path.join("switch_config_render", "generate_svg.py"), "render_next_interface"),),
+    ),
+    ("apps", ((os.path.join("switch_config_render", "generate_svg.py"), "draw_app"),)),
+    (
+        "connections",
+        tuple(
+            (os.path.join("switch_config_render", "canvas.py"), function)
+            for function in (
+                "render_connection",
+                "add_connection_path",
+                "render_aggregated_connections",
+                "render_fanout",
+                "render_bundle",
+                "render_square_connection",
+            )
+        ),
+    ),
+    (
+        "connection types",
+        ((os.path.join("switch_config_render", "utils.py"), "get_connection_types"),),
+    ),
+    ("legend", ((os.path.join("switch_config_render", "canvas.py"), "render_legend"),)),
+    (
+        "svgwrite elements",
+        ((os.path.join("svgwrite", "elementfactory.py"), "__call__"),),
+    ),
+    (
+        "serialization",
+        (
+            (os.path.join("svgwrite", "base.py"), "tostring"),
+            (os.path.join("svgwrite", "drawing.py"), "get_xml"),
+            (os.path.join("xml", "etree", "ElementTree.py"), "tostring"),
+        ),
+    ),
+)
+
+DEFAULT_SAMPLE_INTERVAL = 0.001
+
+
+def get_frame_label(frame):
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return "{}:{}".format(module, code.co_name)
+
+
+class RenderProfile(object):
+    """
+    Profiles the code run within a `with` block, with cProfile and with a
+    sampling profiler running in a separate thread. Use it around a render:
+
+        with RenderProfile() as profile:
+            generate_system_svg_stream(stream, ...)
+        profile.write("slow_switch")
+
+    The cProfile statistics attribute time to every function, while the
+    samples record whole call stacks, in the collapsed format read by
+    flame graph tools. `interval` is the time in seconds between samples.
+
+    The fanout bus, the bundle and the 8 app links below are counted once
+    each as connections, although app links call `add_connection_path`
+    from `render_connection`:
+
+    >>> from switch_config_render.generate_svg import build_system_canvas
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> system = get_synthetic_system(8)
+    >>> system["connections"] = {"ap1": "et1", "ap5": "et1", "ap3": "et3", "ap4": "et4"}
+    >>> for itf in ("et3", "et4", "ap3", "ap4"):
+    ...     system["interfaces"][itf].update(receives="type_a", drives="type_a")
+    >>> with RenderProfile() as profile:
+    ...     canvas = build_system_canvas(fanout_threshold=2, bundle_tolerance=300, **system)
+    ...     canvas.drawing.write(io.StringIO())
+    >>> hot_spots = dict((label, (calls, seconds)) for label, calls, seconds in profile.get_hot_spots())
+    >>> hot_spots["connections"][0], hot_spots["serialization"][0]
+    (10, 1)
+    >>> all(0 < seconds <= profile.stats.total_tt for _, seconds in hot_spots.values())
+    True
+    """
+
+    __slots__ = (
+        "interval",
+        "profiler",
+        "stats",
+        "stacks",
+        "_thread_id",
+        "_root",
+        "_sampler",
+        "_done",
+    )
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.profiler = cProfile.Profile()
+        self.stats = None
+        self.stacks = {}
+        self._thread_id = None
+        self._root = None
+        self._sampler = None
+        self._done = threading.Event()
+
+    def __enter__(self):
+        self._thread_id = threading.current_thread().ident
+        # Stacks are recorded from the block that is profiled down
+        self._root = sys._getframe(1)
+        self._done.clear()
+        self._sampler = threading.Thread(target=self._sample)
+        self._sampler.daemon = True
+        self._sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self._done.set()
+        self._sampler.join()
+        self._root = None
+        self.stats = pstats.Stats(self.profiler, stream=io.StringIO())
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and frame is not self._root:
+                stack.append(get_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def get_hot_spots(self):
+        """
+        Gets the `(label, calls, cumulative seconds)` of every label of
+        `HOT_SPOTS`, in the same order. Only the calls of its functions from
+        other functions are counted for a label, so that recursive and
+        nested calls are only counted once.
+        """
+        def matches(func, functions):
+            filename, _, name = func
+            return any(name == function and path in filename for path, function in functions)
+
+        hot_spots = []
+        for label, functions in HOT_SPOTS:
+            calls = 0
+            seconds = 0.0
+            for func, (_, _, _, _, callers) in self.stats.stats.items():
+                if not matches(func, functions):
+                    continue
+                for caller, caller_stat in callers.items():
+                    if not matches(caller, functions):
+                        calls += caller_stat[0]
+                        seconds += caller_stat[3]
+            hot_spots.append((label, calls, seconds))
+        return hot_spots
+
+    def format_report(self, limit=20):
+        """
+        Formats the hot spots and the `limit` functions with the most time
+        spent in themselves as text
+        """
+        total = self.stats.total_tt or 1.0
+        lines = ["Render took {:.3f}s".format(self.stats.total_tt), "", "Hot spots:"]
+        for label, calls, seconds in self.get_hot_spots():
+            lines.append(
+                "  {:<24} {:>9} calls {:>9.3f}s {:>6.1%}".format(
+                    label, calls, seconds, seconds / total
+                )
+            )
+
+        lines += ["", "Functions by own time:"]
+        entries = sorted(
+            self.stats.stats.items(), key=lambda item: item[1][2], reverse=True
+        )
+        for (filename, lineno, name), stat in entries[:limit]:
+            lines.append(
+                "  {:>9.3f}s {:>9} calls  {}:{}({})".format(
+                    stat[2], stat[1], os.path.basename(filename), lineno, name
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_collapsed(self, filename):
+        """Writes the sampled stacks as `frame;frame;... count` lines"""
+        with io.open(filename, "w", encoding="utf-8") as fileobj:
+            for stack, count in sorted(self.stacks.items()):
+                fileobj.write(u"{} {}\n".format(stack, count))
+
+    def write(self, prefix):
+        """
+        Writes `<prefix>.pstats` for `pstats` and profile viewers, the
+        sampled stacks to `<prefix>.collapsed` and the report to
+        `<prefix>.profile.txt`
+        """
+        self.stats.dump_stats(prefix + ".pstats")
+        self.write_collapsed(prefix + ".collapsed")
+        with io.open(prefix + ".profile.txt", "w", encoding="utf-8") as fileobj:
+            fileobj.write(self.format_report())
@@ -0,0 +1,327 @@
+"""
+Renders a corpus of example and synthetic systems and compares them with
+golden files, and checks the wall time and peak memory of every render
+against the budget of its tier:
+
+    python -m switch_config_render regression
+    python -m switch_config_render regression --update
+
+Goldens hold the normalised SVG document and layout of every case, so that
+they do not depend on the Python version or on float formatting. Layout
+differences are reported per port, app, box and connection.
+"""
+import difflib
+import gc
+import gzip
+import io
+import json
+import os
+import re
+import sys
+import timeit
+
+from switch_config_render._examples.high_level_example import (
+    get_high_level_example_system,
+)
+from switch_config_render._examples.synthetic import get_synthetic_system
+from switch_config_render.generate_svg import build_system_canvas
+from switch_config_render.template import XML_HEADER
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "_examples", "goldens")
+
+# The wall time in seconds and peak traced memory in MiB a render of each
+# tier may take, before the tolerance factor is applied
+TIER_BUDGETS = {
+    "small": (0.5, 8),
+    "medium": (2.0, 24),
+    "large": (6.0, 96),
+}
+
+_NUMBER = re.compile(r"-?\d+\.\d+")
+_MAX_REPORTED_LINES = 20
+
+
+class RegressionCase(object):
+    """
+    A system of the corpus. `get_system` returns its render arguments.
+    `path_commands` are the path commands that must start the second
+    segment of at least one connection, to check that the case exercises
+    e.g. fanout buses (`V`) and bundles (`Q`).
+    """
+
+    __slots__ = ("name", "tier", "get_system", "path_commands")
+
+    def __init__(self, name, tier, get_system, path_commands=()):
+        self.name = name
+        self.tier = tier
+        self.get_system = get_system
+        self.path_commands = path_commands
+
+
+def get_bundled_system(port_count=256, fpga_count=4, stride=32, fanout=4):
+    """
+    Builds a synthetic system where every `stride` ports, a tap port also
+    drives the app ports of the next `fanout - 1` ports of its type, which
+    are then fanout buses. Ports of the same type are four ports apart, so
+    a bundle tolerance above that distance bundles the cross-connects.
+
+    >>> system = get_bundled_system(64, stride=32)
+    >>> sorted((dst, src) for dst, src in system["connections"].items() if src == "et4")
+    [('ap12', 'et4'), ('ap16', 'et4'), ('ap4', 'et4'), ('ap8', 'et4')]
+    """
+    system = get_synthetic_system(port_count, fpga_count=fpga_count)
+    for base in range(4, port_count + 1, stride):
+        for step in range(1, fanout):
+            system["connections"]["ap{}".format(base + 4 * step)] = "et{}".format(base)
+    return system
+
+
+def get_corpus():
+    return [
+        RegressionCase("high_level_example", "small", get_high_level_example_system),
+        RegressionCase("synthetic_64", "small", lambda: get_synthetic_system(64)),
+        RegressionCase(
+            "synthetic_256_bundled",
+            "medium",
+            lambda: dict(
+                get_bundled_system(), fanout_threshold=3, bundle_tolerance=1200
+            ),
+            path_commands=("C", "Q", "V"),
+        ),
+        RegressionCase(
+            "synthetic_1024", "large", lambda: get_synthetic_system(1024, fpga_count=8)
+        ),
+    ]
+
+
+def round_number(match):
+    text = "{:.2f}".format(float(match.group(0))).rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def normalize_svg(svg_text):
+    """
+    Rounds all decimal numbers to two decimals and puts every element on a
+    line of its own
+
+    >>> print(normalize_svg('<g><path d="M1.004,2.5 L3.0,-0.001"/></g>'))
+    <g>
+    <path d="M1,2.5 L3,0"/>
+    </g>
+    """
+    return re.sub(r">\s*<", ">\n<", _NUMBER.sub(round_number, svg_text))
+
+
+def normalize_layout(layout):
+    return _NUMBER.sub(
+        round_number, json.dumps(layout.to_dict(), indent=1, sort_keys=True)
+    )
+
+
+def render_case(case):
+    """
+    Renders a case, returning its normalised SVG document and layout, and
+    the commands that start the second segment of its connection paths
+    """
+    canvas = build_system_canvas(**case.get_system())
+    svg_text = XML_HEADER + canvas.drawing.tostring()
+    commands = set(path.split()[1][0] for _, _, _, _, path in canvas.layout.connections)
+    return normalize_svg(svg_text), normalize_layout(canvas.layout), commands
+
+
+def get_layout_differences(golden, actual):
+    """
+    Describes which ports, apps, boxes and connections were added, removed
+    or moved between two normalised layouts
+
+    >>> from switch_config_render.layout import Layout
+    >>> golden, actual = Layout(), Layout()
+    >>> golden.add_port("et1", "front_panel", (10, 10, 20, 20))
+    >>> actual.add_port("et1", "front_panel", (30, 10, 20, 20))
+    >>> actual.add_app("fpga.app", (0, 0, 5, 5))
+    >>> for line in get_layout_differences(normalize_layout(golden), normalize_layout(actual)):
+    ...     print(line)
+    port et1 moved from (10, 10, 20, 20) to (30, 10, 20, 20)
+    app fpga.app was added at (0, 0, 5, 5)
+    """
+    golden = json.loads(golden)
+    actual = json.loads(actual)
+
+    differences = []
+    if (golden["width"], golden["height"]) != (actual["width"], actual["height"]):
+        differences.append(
+            "drawing resized from {}x{} to {}x{}".format(
+                golden["width"], golden["height"], actual["width"], actual["height"]
+            )
+        )
+
+    def rect(item):
+        return "({x}, {y}, {width}, {height})".format(**item)
+
+    for kind, key in (("box", "boxes"), ("port", "ports"), ("app", "apps")):
+        golden_items = {item["id"]: rect(item) for item in golden[key]}
+        actual_items = {item["id"]: rect(item) for item in actual[key]}
+        for item_id in sorted(set(golden_items) | set(actual_items)):
+            before = golden_items.get(item_id)
+            after = actual_items.get(item_id)
+            if before is None:
+                differences.append(
+                    "{} {} was added at {}".format(kind, item_id, after)
+                )
+            elif after is None:
+                differences.append(
+                    "{} {} was removed from {}".format(kind, item_id, before)
+                )
+            elif before != after:
+                differences.append(
+                    "{} {} moved from {} to {}".format(kind, item_id, before, after)
+                )
+
+    def connections(layout):
+        return {
+            (conn["kind"], conn["src"], conn["dst"]): conn["path"]
+            for conn in layout["connections"]
+        }
+
+    golden_connections = connections(golden)
+    actual_connections = connections(actual)
+    for key in sorted(set(golden_connections) | set(actual_connections)):
+        before = golden_connections.get(key)
+        after = actual_connections.get(key)
+        if before != after:
+            change = "rerouted"
+            if before is None:
+                change = "was added"
+            elif after is None:
+                change = "was removed"
+            differences.append("{} {} -> {} {}".format(key[0], key[1], key[2], change))
+
+    return differences
+
+
+def get_svg_differences(golden, actual):
+    diff = difflib.unified_diff(
+        golden.splitlines(), actual.splitlines(), "golden", "actual", lineterm=""
+    )
+    lines = list(diff)
+    if len(lines) > _MAX_REPORTED_LINES:
+        omitted = len(lines) - _MAX_REPORTED_LINES
+        lines = lines[:_MAX_REPORTED_LINES] + ["... {} more lines".format(omitted)]
+    return lines
+
+
+def measure_case(case, repeat=3):
+    """
+    Returns the fastest wall time in seconds of `repeat` renders of the
+    case, and the peak memory in bytes traced during a separate render, or
+    None where tracemalloc is not available
+    """
+    system = case.get_system()
+    gc.collect()
+    timer = timeit.Timer(lambda: build_system_canvas(**system).drawing.tostring())
+    seconds = min(timer.repeat(repeat=repeat, number=1))
+
+    peak = None
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        try:
+            build_system_canvas(**system).drawing.tostring()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def read_golden(filename):
+    with gzip.open(filename, "rb") as fileobj:
+        return fileobj.read().decode("utf-8")
+
+
+def write_golden(filename, text):
+    # A fixed mtime keeps the goldens identical for identical output
+    with open(filename, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as fileobj:
+            fileobj.write(text.encode("utf-8"))
+
+
+def run_regression(
+    golden_dir=GOLDEN_DIR,
+    update=False,
+    tiers=None,
+    check_budgets=True,
+    tolerance=1.0,
+    out=None,
+):
+    """
+    Checks every corpus case of the given `tiers`, or of all tiers, against
+    its goldens and budgets, reporting to `out`. Budgets are multiplied by
+    `tolerance`. With `update`, the goldens are rewritten instead of
+    compared. Returns the number of failed cases. The budgets depend on the
+    speed of the machine, so the test below only compares the goldens; the
+    `regression` command of the CLI checks the budgets too.
+
+    >>> run_regression(tiers=["small"], check_budgets=False, out=io.StringIO())
+    0
+    """
+    out = out or sys.stdout
+    failures = 0
+    for case in get_corpus():
+        if tiers is not None and case.tier not in tiers:
+            continue
+
+        problems = []
+        svg_text, layout_text, commands = render_case(case)
+        missing = [command for command in case.path_commands if command not in commands]
+        if missing:
+            problems.append(
+                "no connection paths with {} commands".format(", ".join(missing))
+            )
+        svg_filename = os.path.join(golden_dir, case.name + ".svg.gz")
+        layout_filename = os.path.join(golden_dir, case.name + ".layout.json.gz")
+
+        if update:
+            if not os.path.isdir(golden_dir):
+                os.makedirs(golden_dir)
+            write_golden(svg_filename, svg_text)
+            write_golden(layout_filename, layout_text)
+        elif not os.path.exists(svg_filename) or not os.path.exists(layout_filename):
+            problems.append("no goldens, run with --update to create them")
+        else:
+            golden_layout = read_golden(layout_filename)
+            if golden_layout != layout_text:
+                problems += get_layout_differences(golden_layout, layout_text)
+            golden_svg = read_golden(svg_filename)
+            if golden_svg != svg_text:
+                problems.append("SVG document differs:")
+                problems += get_svg_differences(golden_svg, svg_text)
+
+        if check_budgets:
+            max_seconds, max_mib = TIER_BUDGETS[case.tier]
+            seconds, peak = measure_case(case)
+            if seconds > max_seconds * tolerance:
+                problems.append(
+                    "took {:.3f}s, over the {} budget of {:.3f}s".format(
+                        seconds, case.tier, max_seconds * tolerance
+                    )
+                )
+            if peak is not None and peak > max_mib * tolerance * 1024 * 1024:
+                problems.append(
+                    "peaked at {:.1f}MiB, over the {} budget of {:.1f}MiB".format(
+                        peak / 1024.0 / 1024.0, case.tier, max_mib * tolerance
+                    )
+                )
+
+        status = "updated" if update else "ok"
+        if problems:
+            failures += 1
+            status = "FAILED"
+        out.write(u"{} [{}]: {}\n".format(case.name, case.tier, status))
+        for problem in problems:
+            out.write(u"    {}\n".format(problem))
+
+    return failures
@@ -0,0 +1,695 @@
+import collections
+import itertools
+import json
+import xml.etree.ElementTree as etree
+
+from switch_config_render.canvas import get_palette_colour
+from switch_config_render.generate_svg import (
+    _COLLECTION_SPACING,
+    _INTERFACE_V_CLEARANCE,
+    _INTERFACE_WIDTH,
+    _LEGEND_WIDTH,
+    build_system_canvas,
+    get_app_link,
+    get_interface_text,
+)
+from switch_config_render.template import XML_HEADER
+from switch_config_render.utils import get_connection_types
+
+_INTERFACE_TEXT_PARAMS = ("alias", "description")
+_INTERFACE_TYPE_PARAMS = ("receives", "drives")
+_UNSUPPORTED_OPTIONS = ("fanout_threshold", "bundle_tolerance", "degradation")
+
+
+def get_connection_element_id(dst):
+    return "xc_" + dst
+
+
+def get_app_link_element_id(app_name, port):
+    return "al_{}_{}".format(app_name, port)
+
+
+class LiveScene(object):
+    """
+    A rendered system that follows changes to its cross-connects and
+    interfaces. Every change updates the SVG document in place and marks
+    the elements it touched as dirty; `flush` then returns the minimal
+    patches that bring a client's copy of the document up to date:
+
+    * `{"op": "add", "parent": <id>, "id": <id>, "markup": <svg>}`
+    * `{"op": "remove", "id": <id>}`
+    * `{"op": "replace", "id": <id>, "markup": <svg>}`
+    * `{"op": "set", "id": <id>, "attributes": {<name>: <value>}}`
+
+    Changes to the same element between two flushes are merged, so the
+    work per change only depends on the number of elements it touches.
+    Cross-connects get the id `xc_<dst>`, where `dst` is the first
+    endpoint in sorted order of bidirectional connections, as in a fresh
+    render, and the links between apps and their ports the id
+    `al_<app>_<port>`. Links that change direction are replaced in place;
+    elements that are removed and added again are sent as a remove and an
+    add, so that clients append them to the end of their parent too. The arguments are the same as
+    for `build_system_canvas`, without fan-out, bundling and degradation,
+    and are copied rather than modified.
+
+    Removed connections leave None in the element list of the connections
+    group and in the layout of `canvas` until they are compacted, which
+    happens once they make up half of the group, or on `compact` and
+    `svg_text`. Connection types that are no longer used are dropped from
+    the legend on `flush`.
+
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> scene = LiveScene(**get_synthetic_system(8))
+    >>> scene.remove_connection("et1")
+    >>> scene.add_connection("et1", "ap2")
+    >>> scene.update_interface("et2", alias="uplink")
+    >>> [(patch["op"], patch["id"]) for patch in scene.flush()]
+    [('remove', 'xc_ap1'), ('add', 'xc_ap1'), ('add', 'xc_et1'), ('replace', 'et2_desc')]
+    >>> scene.retype_connection("et1", ["mirror"])
+    >>> [(patch["op"], patch["id"]) for patch in scene.flush()]
+    [('set', 'xc_et1'), ('replace', 'legend')]
+    >>> scene.retype_connection("et1")
+    >>> [(patch["op"], patch["id"], patch.get("attributes")) for patch in scene.flush()]
+    [('set', 'xc_et1', {'stroke': 'black'}), ('replace', 'legend', None)]
+    >>> scene.flush()
+    []
+    >>> "mirror" in scene.svg_text()
+    False
+    >>> list(scene.canvas.element_groups.values()).count("legend")
+    1
+
+    Removing one direction of a bidirectional connection redraws the
+    other direction, and the removed paths are compacted along the way:
+
+    >>> for dst in ("ap3", "ap4", "ap5", "ap6", "ap7", "ap8", "et1"):
+    ...     scene.remove_connection(dst)
+    >>> sorted(conn[0] for conn in scene.canvas.layout.connections
+    ...        if conn is not None and conn[2] == "cross_connect")
+    ['ap1', 'ap2', 'et3', 'et4', 'et5', 'et6', 'et7', 'et8']
+    >>> scene.svg_text().count(' id="xc_')
+    8
+    >>> None in scene.canvas.layout.connections
+    False
+    """
+
+    __slots__ = (
+        "canvas",
+        "interfaces",
+        "connections",
+        "dominant_type",
+        "type_overrides",
+        "legend",
+        "_paths",
+        "_sources",
+        "_app_links",
+        "_elements",
+        "_positions",
+        "_removed",
+        "_type_counts",
+        "_legend_dirty",
+        "_dirty",
+    )
+
+    def __init__(
+        self,
+        interfaces,
+        connections,
+        fpga_apps,
+        app_shapes,
+        dominant_type=None,
+        onchip_connections=None,
+        **kwargs
+    ):
+        for option in _UNSUPPORTED_OPTIONS:
+            if kwargs.get(option):
+                raise ValueError("{} is not supported by live scenes".format(option))
+
+        self.interfaces = {itf: dict(params) for itf, params in interfaces.items()}
+        self.connections = dict(connections)
+        self.dominant_type = dominant_type
+        self.type_overrides = {}
+        self.canvas = build_system_canvas(
+            self.interfaces,
+            self.connections,
+            fpga_apps,
+            app_shapes,
+            dominant_type=dominant_type,
+            onchip_connections=onchip_connections,
+            **kwargs
+        )
+
+        # Maps the destinations of the cross-connects onto their path and
+        # layout entry; both endpoints of bidirectional connections map onto
+        # the same entry. `_sources` maps sources onto their destinations
+        self._paths = {}
+        self._sources = {}
+        # Maps ports onto the `(element_id, app)` of their app links
+        self._app_links = {}
+        self._elements = {}
+        # Maps element ids onto the index of the element in its parent, and
+        # cross-connect ids also onto the index of their layout entry
+        self._positions = {}
+        self._removed = 0
+        # The number of connections of every type, to keep the legend
+        # limited to the types in use
+        self._type_counts = {}
+        self._legend_dirty = False
+        self._dirty = collections.OrderedDict()
+
+        canvas = self.canvas
+        entries = [
+            (idx, conn)
+            for idx, conn in enumerate(canvas.layout.connections)
+            if conn[2] == "cross_connect"
+        ]
+        paths = [
+            (idx, element)
+            for idx, element in enumerate(canvas.get_connections_svg_group().elements)
+            if canvas.element_groups.get(id(element)) == "cross_connects"
+        ]
+        for (entry_idx, entry), (path_idx, path) in zip(entries, paths):
+            self._track_connection(entry[0], entry[1], path, entry, path_idx, entry_idx)
+
+        links = [
+            (idx, conn)
+            for idx, conn in enumerate(canvas.layout.connections)
+            if conn[2] == "app_link"
+        ]
+        link_paths = [
+            (idx, element)
+            for idx, element in enumerate(canvas.get_connections_svg_group().elements)
+            if str(canvas.element_groups.get(id(element))).startswith("app_links:")
+        ]
+        for (entry_idx, entry), (path_idx, path) in zip(links, link_paths):
+            port, app = entry[:2] if entry[0] in self.interfaces else entry[1::-1]
+            path["id"] = get_app_link_element_id(app, port)
+            self._elements[path["id"]] = path
+            self._positions[path["id"]] = (path_idx, entry_idx)
+            self._app_links.setdefault(port, []).append((path["id"], app))
+        for conn in canvas.layout.connections:
+            self._use_types(conn[3])
+
+        self.legend = None
+        for idx, element in enumerate(canvas.drawing.elements):
+            element_id = element.attribs.get("id") if hasattr(element, "attribs") else None
+            if element_id == "legend":
+                self.legend = element
+            elif element_id is None or not element_id.endswith("_desc"):
+                continue
+            self._elements[element_id] = element
+            self._positions[element_id] = idx
+
+    def _track_connection(self, dst, src, path, entry, path_idx, entry_idx):
+        path["id"] = get_connection_element_id(dst)
+        self._elements[path["id"]] = path
+        self._positions[path["id"]] = (path_idx, entry_idx)
+        self._paths[dst] = (path, entry)
+        self._sources.setdefault(src, set()).add(dst)
+        if self.connections.get(src) == dst:
+            self._paths[src] = (path, entry)
+            self._sources.setdefault(dst, set()).add(src)
+
+    def _mark(self, element_id, op, attributes=()):
+        """
+        Records a change to an element, merging it with the changes since
+        the last flush
+        """
+        previous = self._dirty.get(element_id)
+        if previous is None:
+            state = (op, set(attributes))
+        elif op == "remove":
+            # Elements added since the last flush were never seen by clients
+            state = None if previous[0] == "add" else ("remove", set())
+        elif op == "add":
+            # The server appended the element to its parent again, so the
+            # client has to do the same rather than replace it in place
+            state = ("readd", set())
+        elif previous[0] in ("add", "readd", "replace"):
+            state = previous
+        elif op == "set":
+            state = ("set", previous[1] | set(attributes))
+        else:
+            state = (op, set())
+
+        # Additions are kept in the order the elements were appended in
+        if state is None or op in ("add", "remove"):
+            self._dirty.pop(element_id, None)
+        if state is not None:
+            self._dirty[element_id] = state
+
+    def _get_types(self, dst, src, bidir):
+        if dst in self.type_overrides:
+            return self.type_overrides[dst]
+        return get_connection_types(
+            self.interfaces, dst, src, bidir=bidir, dominant_type=self.dominant_type
+        )
+
+    def _get_stroke(self, types):
+        if not types:
+            return "black"
+
+        colours = self.canvas.connection_colours
+        if types not in colours:
+            # New types add a line to the legend, in the first colour that
+            # is not taken, as dropped types free their colour
+            used = set(colours.values())
+            colours[types] = next(
+                colour
+                for colour in (get_palette_colour(idx) for idx in itertools.count())
+                if colour not in used
+            )
+            self._legend_dirty = True
+        return colours[types]
+
+    def _use_types(self, types):
+        if types:
+            self._type_counts[types] = self._type_counts.get(types, 0) + 1
+
+    def _release_types(self, types):
+        if types:
+            self._type_counts[types] -= 1
+            if not self._type_counts[types]:
+                del self._type_counts[types]
+                self._legend_dirty = True
+
+    def _update_legend(self):
+        colours = self.canvas.connection_colours
+        for types in [types for types in colours if types not in self._type_counts]:
+            del colours[types]
+        if self._legend_dirty:
+            self._legend_dirty = False
+            self._render_legend()
+
+    def _render_legend(self):
+        canvas = self.canvas
+        elements = canvas.drawing.elements
+        legend = canvas.render_legend(
+            canvas.layout.width - _LEGEND_WIDTH, _COLLECTION_SPACING, _LEGEND_WIDTH
+        )
+        if self.legend is None:
+            self._positions["legend"] = len(elements) - 1
+        else:
+            # Put the new legend in the place of the old one
+            elements.pop()
+            elements[self._positions["legend"]] = legend
+            del canvas.element_groups[id(self.legend)]
+
+        self.legend = legend
+        self._elements["legend"] = legend
+        self._mark("legend", "replace")
+
+    def _render_connection(self, dst, src):
+        bidir = self.connections.get(src) == dst
+        if bidir and src < dst:
+            dst, src = src, dst
+        types = self._get_types(dst, src, bidir)
+        self._get_stroke(types)
+        path = self.canvas.render_connection(
+            dst, src, bidir=bidir, onchip=False, types=types
+        )
+        self._use_types(types)
+
+        self._track_connection(
+            dst,
+            src,
+            path,
+            self.canvas.layout.connections[-1],
+            len(self.canvas.connections.elements) - 1,
+            len(self.canvas.layout.connections) - 1,
+        )
+        self._mark(path["id"], "add")
+
+    def _remove_path(self, dst):
+        path, entry = self._paths.pop(dst)
+        src = entry[1] if entry[0] == dst else entry[0]
+        if self._paths.get(src, (None,))[0] is path:
+            del self._paths[src]
+            self._sources.get(dst, set()).discard(src)
+        self._sources.get(src, set()).discard(dst)
+
+        path_idx, entry_idx = self._positions.pop(path["id"])
+        self.canvas.connections.elements[path_idx] = None
+        self.canvas.layout.connections[entry_idx] = None
+        self._removed += 1
+        self._release_types(entry[3])
+        del self.canvas.element_groups[id(path)]
+        del self._elements[path["id"]]
+        self._mark(path["id"], "remove")
+
+        if 2 * self._removed > len(self.canvas.connections.elements):
+            self.compact()
+
+    def compact(self):
+        """
+        Drops the removed connections from the connections group and the
+        layout of the canvas, in time linear in their size
+        """
+        if not self._removed:
+            return
+
+        canvas = self.canvas
+        group = canvas.connections
+        group.elements = [element for element in group.elements if element is not None]
+        layout = canvas.layout
+        layout.connections = [conn for conn in layout.connections if conn is not None]
+        self._removed = 0
+
+        path_indices = {}
+        for idx, element in enumerate(group.elements):
+            element_id = element.attribs.get("id")
+            if element_id in self._positions:
+                path_indices[element_id] = idx
+        for idx, conn in enumerate(layout.connections):
+            if conn[2] == "cross_connect":
+                element_id = get_connection_element_id(conn[0])
+            elif conn[2] == "app_link":
+                port, app = conn[:2] if conn[0] in self.interfaces else conn[1::-1]
+                element_id = get_app_link_element_id(app, port)
+            else:
+                continue
+            self._positions[element_id] = (path_indices[element_id], idx)
+
+    def _check_interface(self, itf):
+        if itf not in self.canvas.x_connect_dst_endpoints:
+            raise ValueError("unknown interface {}".format(itf))
+
+    def add_connection(self, dst, src):
+        """Connects `dst` to `src`, replacing the current source of `dst`"""
+        self._check_interface(dst)
+        self._check_interface(src)
+        if dst == src:
+            raise ValueError("cannot connect {} to itself".format(dst))
+        if dst in self.connections:
+            self.remove_connection(dst)
+
+        self.connections[dst] = src
+        if self.connections.get(src) == dst:
+            # The reverse connection becomes bidirectional
+            self._remove_path(src)
+            self._render_connection(src, dst)
+        else:
+            self._render_connection(dst, src)
+
+    def remove_connection(self, dst):
+        """Disconnects `dst` from its source"""
+        if dst not in self.connections:
+            raise ValueError("{} is not connected".format(dst))
+
+        src = self.connections[dst]
+        bidir = self.connections.get(src) == dst
+        self._remove_path(dst)
+        del self.connections[dst]
+        self.type_overrides.pop(dst, None)
+        if bidir:
+            self._render_connection(src, dst)
+
+    def retype_connection(self, dst, types=None):
+        """
+        Overrides the types of the connection to `dst`, and of its reverse
+        if it is bidirectional. None reverts to the types of the interfaces.
+        """
+        if dst not in self._paths:
+            raise ValueError("{} is not connected".format(dst))
+
+        path, entry = self._paths[dst]
+        if types is None:
+            self.type_overrides.pop(entry[0], None)
+        else:
+            self.type_overrides[entry[0]] = tuple(types)
+        self._update_types(entry[0])
+
+    def _update_types(self, dst):
+        path, entry = self._paths[dst]
+        bidir = self.connections.get(entry[1]) == entry[0]
+        types = self._get_types(entry[0], entry[1], bidir)
+        if types == entry[3]:
+            return
+
+        stroke = self._get_stroke(types)
+        self._use_types(types)
+        self._release_types(entry[3])
+        new_entry = entry[:3] + (types,) + entry[4:]
+        self.canvas.layout.connections[self._positions[path["id"]][1]] = new_entry
+        for endpoint in (entry[0], entry[1]):
+            if self._paths.get(endpoint, (None,))[0] is path:
+                self._paths[endpoint] = (path, new_entry)
+
+        if path["stroke"] != stroke:
+            path["stroke"] = stroke
+            self._mark(path["id"], "set", ["stroke"])
+
+    def update_interface(self, itf, **params):
+        """
+        Updates the `alias`, `description`, `receives` and `drives` params
+        of an interface. A param set to None is removed. Changed types
+        recolour the connections of the interface, and redraw the links to
+        its apps whose direction changed.
+        """
+        if itf not in self.interfaces:
+            raise ValueError("unknown interface {}".format(itf))
+        for name in params:
+            if name not in _INTERFACE_TEXT_PARAMS + _INTERFACE_TYPE_PARAMS:
+                raise ValueError("unknown interface param {}".format(name))
+
+        itf_params = self.interfaces[itf]
+        links = [
+            (element_id, app, get_app_link(itf, app, itf_params))
+            for element_id, app in self._app_links.get(itf, ())
+        ]
+        for name, value in params.items():
+            if value is None:
+                itf_params.pop(name, None)
+            else:
+                itf_params[name] = value
+
+        if any(name in params for name in _INTERFACE_TEXT_PARAMS):
+            self._render_interface_text(itf)
+
+        if any(name in params for name in _INTERFACE_TYPE_PARAMS):
+            dsts = set(self._sources.get(itf, ()))
+            if itf in self._paths:
+                dsts.add(itf)
+            for dst in sorted(dsts):
+                if dst in self._paths:
+                    self._update_types(dst)
+
+            for element_id, app, link in links:
+                if get_app_link(itf, app, itf_params) != link:
+                    self._render_app_link(element_id, app, itf)
+
+    def _render_app_link(self, element_id, app, port):
+        canvas = self.canvas
+        old = self._elements[element_id]
+        group = canvas.element_groups.pop(id(old))
+        dst, src, bidir, nodir = get_app_link(port, app, self.interfaces[port])
+        new = canvas.render_connection(
+            dst, src, bidir=bidir, onchip=True, nodir=nodir, group=group
+        )
+        new["id"] = element_id
+
+        # Put the new link in the place of the old one
+        path_idx, entry_idx = self._positions[element_id]
+        elements = canvas.connections.elements
+        elements[path_idx] = elements.pop()
+        connections = canvas.layout.connections
+        connections[entry_idx] = connections.pop()
+
+        self._elements[element_id] = new
+        self._mark(element_id, "replace")
+
+    def _render_interface_text(self, itf):
+        element_id = itf + "_desc"
+        old = self._elements.get(element_id)
+        if old is None:
+            # The render left out the interface text
+            return
+
+        collection_id, rect = self.canvas.layout.ports[itf]
+        front_panel = collection_id == "front_panel_interfaces"
+        middle_x = rect[0] + _INTERFACE_WIDTH / 2
+        y = rect[1] - _INTERFACE_V_CLEARANCE
+        new = get_interface_text(
+            self.canvas, itf, self.interfaces[itf], middle_x, y, front_panel
+        )
+
+        self.canvas.drawing.elements[self._positions[element_id]] = new
+        group = self.canvas.element_groups.pop(id(old))
+        self.canvas.element_groups[id(new)] = group
+        self._elements[element_id] = new
+        self._mark(element_id, "replace")
+
+    def flush(self):
+        """Returns the patches for all the changes since the last flush"""
+        self._update_legend()
+        patches = []
+        for element_id, (op, attributes) in self._dirty.items():
+            if op == "readd":
+                patches.append({"op": "remove", "id": element_id})
+                op = "add"
+            patch = {"op": op, "id": element_id}
+            if op == "add":
+                patch["parent"] = "connections"
+            if op in ("add", "replace"):
+                patch["markup"] = etree.tostring(
+                    self._elements[element_id].get_xml(), encoding="unicode"
+                )
+            elif op == "set":
+                element = self._elements[element_id]
+                patch["attributes"] = {
+                    name: str(element[name]) for name in sorted(attributes)
+                }
+            patches.append(patch)
+        self._dirty.clear()
+        return patches
+
+    def svg_text(self):
+        self._update_legend()
+        self.compact()
+        return XML_HEADER + self.canvas.drawing.tostring()
+
+
+def apply_svg_patches(root, patches):
+    """
+    Applies the patches of `LiveScene.flush` to `root`, the
+    `xml.etree.ElementTree` element of a client's copy of the document, the
+    way clients are expected to.
+
+    Random changes give a client the same document as the scene, and the
+    scene the same connections and interface texts as a fresh render:
+
+    >>> import random
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> def get_links(root):
+    ...     # The connections in drawing order, with their legend entry
+    ...     legend = {"black": ()}
+    ...     for element in next(e for e in root.iter() if e.get("id") == "legend"):
+    ...         if element.get("stroke"):
+    ...             stroke = element.get("stroke")
+    ...             legend[stroke] = ()
+    ...         else:
+    ...             legend[stroke] += (element.text,)
+    ...     return [
+    ...         (legend.get(e.get("stroke")), e.get("d"), e.get("marker-start"),
+    ...          e.get("marker-end"), e.text)
+    ...         for e in next(e for e in root.iter() if e.get("id") == "connections")]
+    >>> def get_texts(root):
+    ...     return [("".join(e.itertext()), e.get("x"), e.get("y")) for e in root.iter()
+    ...             if (e.get("id") or "").endswith("_desc")]
+    >>> system = get_synthetic_system(16)
+    >>> scene = LiveScene(**system)
+    >>> client = etree.fromstring(scene.svg_text().encode("utf-8"))
+    >>> rng = random.Random(42)
+    >>> itfs = sorted(scene.interfaces)
+    >>> for _ in range(400):
+    ...     op = rng.randrange(4)
+    ...     if op == 0:
+    ...         dst = rng.choice(sorted(scene.connections))
+    ...         scene.add_connection(dst, rng.choice([i for i in itfs if i != dst]))
+    ...     elif op == 1:
+    ...         # Moves a connection, keeping their number and so the layout
+    ...         free = [itf for itf in itfs if itf not in scene.connections]
+    ...         if free:
+    ...             scene.remove_connection(rng.choice(sorted(scene.connections)))
+    ...             dst = rng.choice(free)
+    ...             scene.add_connection(dst, rng.choice([i for i in itfs if i != dst]))
+    ...     elif op == 2:
+    ...         scene.update_interface(
+    ...             rng.choice(itfs), alias=rng.choice([None, "uplink", "mirror"]))
+    ...     else:
+    ...         scene.update_interface(rng.choice(itfs), **{
+    ...             rng.choice(["receives", "drives"]):
+    ...             rng.choice([None, "type_a", "type_b", ["type_a", "tap"]])})
+    ...     if rng.random() < 0.25:
+    ...         apply_svg_patches(client, scene.flush())
+    >>> apply_svg_patches(client, scene.flush())
+    >>> server = etree.fromstring(scene.svg_text().encode("utf-8"))
+    >>> get_links(client) == get_links(server), get_texts(client) == get_texts(server)
+    (True, True)
+    >>> fresh = build_system_canvas(
+    ...     **dict(system, interfaces=scene.interfaces, connections=scene.connections))
+    >>> fresh = etree.fromstring(fresh.drawing.tostring().encode("utf-8"))
+    >>> sorted(get_links(fresh), key=repr) == sorted(get_links(server), key=repr)
+    True
+    >>> get_texts(fresh) == get_texts(server)
+    True
+    """
+    for patch in patches:
+        parents = {}
+        for parent in root.iter():
+            for idx, child in enumerate(parent):
+                if child.get("id") is not None:
+                    parents[child.get("id")] = (parent, idx)
+
+        op = patch["op"]
+        if op == "add":
+            parent = parents[patch["parent"]][0][parents[patch["parent"]][1]]
+            parent.append(etree.fromstring(patch["markup"]))
+            continue
+
+        parent, idx = parents[patch["id"]]
+        if op == "remove":
+            del parent[idx]
+        elif op == "replace":
+            parent[idx] = etree.fromstring(patch["markup"])
+        elif op == "set":
+            for name, value in patch["attributes"].items():
+                parent[idx].set(name, value)
+        else:
+            raise ValueError("unknown op {}".format(op))
+
+
+def apply_scene_event(scene, event):
+    """
+    Applies a JSON event to the scene. Events have an `op` of
+    `add_connection` (`dst`, `src`), `remove_connection` (`dst`),
+    `retype_connection` (`dst`, optional `types`) or `update_interface`
+    (`itf` and any of the interface params).
+    """
+    if not isinstance(event, dict) or "op" not in event:
+        raise ValueError('missing field "op"')
+
+    op = event["op"]
+    args = dict((key, value) for key, value in event.items() if key != "op")
+    if op == "add_connection":
+        scene.add_connection(args["dst"], args["src"])
+    elif op == "remove_connection":
+        scene.remove_connection(args["dst"])
+    elif op == "retype_connection":
+        scene.retype_connection(args["dst"], args.get("types"))
+    elif op == "update_interface":
+        itf = args.pop("itf")
+        scene.update_interface(itf, **args)
+    else:
+        raise ValueError("unknown op {}".format(op))
+
+
+def run_scene_events(scene, instream, outstream):
+    """
+    Reads one JSON event per line from `instream` until it is closed and
+    writes one JSON line with the resulting `patches`, or an `error`, per
+    event to `outstream`.
+
+    >>> import io
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> scene = LiveScene(**get_synthetic_system(8))
+    >>> events = io.StringIO(u'{"op": "remove_connection", "dst": "ap3"}\\n'
+    ...                      u'{"op": "remove_connection", "dst": "et9"}\\n')
+    >>> patches = io.StringIO()
+    >>> run_scene_events(scene, events, patches)
+    >>> print(patches.getvalue().strip())
+    {"patches": [{"op": "remove", "id": "xc_ap3"}, {"op": "add", "id": "xc_et3", "parent": "connections", "markup": "<path d=\\"M800.0,1220.0 C800.0,920.0 1090.0,600.0 1090.0,300.0\\" fill=\\"none\\" id=\\"xc_et3\\" marker-end=\\"url(#end_arrow)\\" stroke=\\"#F2DB0C\\" stroke-width=\\"6\\" />"}]}
+    {"error": "ValueError: et9 is not connected"}
+    """
+    for line in iter(instream.readline, ""):
+        if not line.strip():
+            continue
+
+        try:
+            apply_scene_event(scene, json.loads(line))
+        except (KeyError, ValueError, TypeError) as e:
+            result = {"error": "{}: {}".format(type(e).__name__, e)}
+        else:
+            result = {"patches": scene.flush()}
+
+        outstream.write(json.dumps(result) + "\n")
+        outstream.flush()
@@ -0,0 +1,402 @@
+import re
+
+from svgwrite.utils import strlist
+
+# Cells are a little larger than an interface box, so that most ports and
+# apps fall into one to four cells
+DEFAULT_CELL_SIZE = 500
+
+# Number of line segments a Bézier curve is split into for hit-testing
+_CURVE_SEGMENTS = 16
+
+_PATH_TOKEN = re.compile(r"[A-Za-z]|-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?")
+
+# The number of arguments of every path command
+_PATH_ARGUMENTS = {"M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "Q": 4, "A": 7, "Z": 0}
+
+# The size of the arrowhead markers, in stroke widths (see `DocumentTemplate`)
+_MARKER_SIZE = 6
+
+# The advance of a character and the ascent of text, relative to the font
+# size. Text extents are estimated, as the fonts are chosen by the viewer.
+_CHAR_WIDTH = 0.6
+_ASCENT = 0.8
+
+
+def get_bezier_points(points):
+    """
+    Gets `_CURVE_SEGMENTS - 1` points along the quadratic or cubic Bézier
+    curve with the control `points`, excluding its ends
+    """
+    degree = len(points) - 1
+    coefficients = [1, 2, 1] if degree == 2 else [1, 3, 3, 1]
+    curve = []
+    for step in range(1, _CURVE_SEGMENTS):
+        t = float(step) / _CURVE_SEGMENTS
+        weights = [
+            coefficient * (1 - t) ** (degree - idx) * t ** idx
+            for idx, coefficient in enumerate(coefficients)
+        ]
+        curve.append(
+            (
+                sum(w * point[0] for w, point in zip(weights, points)),
+                sum(w * point[1] for w, point in zip(weights, points)),
+            )
+        )
+    return curve
+
+
+def get_path_polylines(d):
+    """
+    Gets the polylines that approximate the path data `d` of a connection,
+    as lists of `(x, y)` points. Supports the absolute and relative `M`,
+    `L`, `H`, `V`, `C`, `Q`, `A` and `Z` commands. Arcs are replaced by a
+    straight line, which is exact enough for the small corner arcs of
+    square connections.
+
+    >>> get_path_polylines("M0,0 v10.0 a5,5 0 0 0 5,5 h20.0 L25.0,0")
+    [[(0.0, 0.0), (0.0, 10.0), (5.0, 15.0), (25.0, 15.0), (25.0, 0.0)]]
+    >>> get_path_polylines("M10,0 V50 M0,50 H20 M0,50 V80")
+    [[(10.0, 0.0), (10.0, 50.0)], [(0.0, 50.0), (20.0, 50.0)], [(0.0, 50.0), (0.0, 80.0)]]
+    >>> [len(polyline) for polyline in get_path_polylines("M0,0 C0,10 20,10 20,0 Q20,10 30,10")]
+    [33]
+    """
+    tokens = _PATH_TOKEN.findall(d)
+    polylines = []
+    x = y = 0.0
+    idx = 0
+    command = None
+    while idx < len(tokens):
+        if tokens[idx].isalpha():
+            command = tokens[idx]
+            idx += 1
+        absolute = command.upper()
+        relative = command != absolute
+        count = _PATH_ARGUMENTS[absolute]
+        args = [float(token) for token in tokens[idx : idx + count]]
+        idx += count
+
+        if absolute == "Z":
+            x, y = polylines[-1][0]
+            polylines[-1].append((x, y))
+            if idx < len(tokens) and not tokens[idx].isalpha():
+                raise ValueError("unexpected arguments after Z in {!r}".format(d))
+            continue
+
+        if absolute == "H":
+            points = [(args[0] + (x if relative else 0), y)]
+        elif absolute == "V":
+            points = [(x, args[0] + (y if relative else 0))]
+        elif absolute == "A":
+            points = [(args[5], args[6])]
+        else:
+            points = list(zip(args[::2], args[1::2]))
+        if relative and absolute not in ("H", "V"):
+            points = [(px + x, py + y) for px, py in points]
+
+        if absolute == "M":
+            polylines.append(points)
+            # Further coordinate pairs of a moveto are linetos
+            command = "l" if relative else "L"
+        elif absolute in ("C", "Q"):
+            polylines[-1] += get_bezier_points([(x, y)] + points)
+            polylines[-1].append(points[-1])
+        else:
+            polylines[-1].append(points[-1])
+        x, y = points[-1]
+    return polylines
+
+
+def get_polylines_bounds(polylines):
+    xs = [x for polyline in polylines for x, _ in polyline]
+    ys = [y for polyline in polylines for _, y in polyline]
+    return (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+
+
+def get_rects_bounds(rects):
+    """Gets the bounding box of `(x, y, width, height)` rects, or None if there are none"""
+    rects = [rect for rect in rects if rect is not None]
+    if not rects:
+        return None
+    min_x = min(rect[0] for rect in rects)
+    min_y = min(rect[1] for rect in rects)
+    max_x = max(rect[0] + rect[2] for rect in rects)
+    max_y = max(rect[1] + rect[3] for rect in rects)
+    return (min_x, min_y, max_x - min_x, max_y - min_y)
+
+
+def get_text_bounds(element, font_size):
+    x = float(str(element.attribs["x"]).split()[0])
+    y = float(str(element.attribs["y"]).split()[0])
+    width = len(element.text or "") * font_size * _CHAR_WIDTH
+    anchor = element.attribs.get("text-anchor")
+    if anchor == "middle":
+        x -= width / 2.0
+    elif anchor == "end":
+        x -= width
+    top = y - font_size * _ASCENT
+    if element.attribs.get("alignment-baseline") == "middle":
+        top = y - font_size / 2.0
+    return (x, top, width, float(font_size))
+
+
+def get_element_bounds(element, stroke_width=0, font_size=0):
+    """
+    Gets the `(x, y, width, height)` bounding box of the rects, lines,
+    paths and text of an svgwrite element and its children, including their
+    strokes and arrowheads, or None if it draws none. `stroke_width` and
+    `font_size` are inherited from the parent elements.
+
+    >>> import svgwrite
+    >>> drawing = svgwrite.Drawing()
+    >>> group = drawing.g(stroke_width=2)
+    >>> _ = group.add(drawing.rect(insert=(10, 10), size=(100, 50)))
+    >>> _ = group.add(drawing.path("M0,200 V300 H50", stroke_width=4))
+    >>> _ = group.add(drawing.text("abcd", insert=(300, 100), font_size=10, text_anchor="end"))
+    >>> get_element_bounds(group)
+    (-2.0, 9.0, 302.0, 293.0)
+    """
+    attribs = getattr(element, "attribs", None)
+    if attribs is None:
+        # Prebuilt template elements, e.g. the background
+        return None
+    stroke_width = float(attribs.get("stroke-width", stroke_width))
+    font_size = float(attribs.get("font-size", font_size))
+
+    pad = stroke_width / 2.0
+    if attribs.get("marker-start") or attribs.get("marker-end"):
+        pad = max(pad, _MARKER_SIZE * stroke_width)
+
+    name = element.elementname
+    rect = None
+    if name == "rect":
+        rect = tuple(float(attribs[key]) for key in ("x", "y", "width", "height"))
+    elif name == "line":
+        rect = get_polylines_bounds(
+            [[(float(attribs["x1"]), float(attribs["y1"])),
+              (float(attribs["x2"]), float(attribs["y2"]))]]
+        )
+    elif name == "path":
+        rect = get_polylines_bounds(get_path_polylines(strlist(element.commands, " ")))
+    elif name == "text":
+        return get_text_bounds(element, font_size)
+
+    if rect is not None:
+        return (rect[0] - pad, rect[1] - pad, rect[2] + 2 * pad, rect[3] + 2 * pad)
+    return get_rects_bounds(
+        get_element_bounds(child, stroke_width, font_size)
+        for child in element.elements
+    )
+
+
+def get_segment_distance(point, start, end):
+    """Gets the distance between `point` and the line segment `start`-`end`"""
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    length = dx * dx + dy * dy
+    t = 0.0
+    if length:
+        t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length
+        t = min(max(t, 0.0), 1.0)
+    nearest_x = start[0] + t * dx - point[0]
+    nearest_y = start[1] + t * dy - point[1]
+    return (nearest_x * nearest_x + nearest_y * nearest_y) ** 0.5
+
+
+def segment_intersects_rect(start, end, rect):
+    """
+    Clips the line segment `start`-`end` against `rect` (Liang-Barsky) and
+    returns whether any part of it is left
+    """
+    x, y, width, height = rect
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    t0, t1 = 0.0, 1.0
+    for p, q in (
+        (-dx, start[0] - x),
+        (dx, x + width - start[0]),
+        (-dy, start[1] - y),
+        (dy, y + height - start[1]),
+    ):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = float(q) / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+def rects_intersect(a, b):
+    return (
+        a[0] <= b[0] + b[2]
+        and b[0] <= a[0] + a[2]
+        and a[1] <= b[1] + b[3]
+        and b[1] <= a[1] + a[3]
+    )
+
+
+class SpatialIndex(object):
+    """
+    A uniform grid over the bounding boxes of the boxes, ports, apps and
+    connections of a layout, for hit-testing without scanning the SVG
+    document. Items are `(kind, id)` pairs, where connections are
+    identified as `<src>-><dst>`. Queries only visit the grid cells they
+    overlap, and connections are matched against their path rather than
+    their bounding box. Results are in drawing order.
+
+    >>> from switch_config_render.layout import Layout
+    >>> layout = Layout()
+    >>> layout.width, layout.height = 2000, 1000
+    >>> layout.add_box("front_panel_interfaces", (0, 0, 2000, 400))
+    >>> layout.add_port("et1", "front_panel_interfaces", (100, 100, 200, 150))
+    >>> layout.add_app("fpga.mux", (1000, 700, 300, 200))
+    >>> layout.add_connection("et1", "fpga.mux", "cross_connect", None,
+    ...                       "M1150.0,700.0 C1150.0,400.0 200.0,550.0 200.0,250.0")
+    >>> index = build_spatial_index(layout)
+    >>> index.query_point(150, 150)
+    [('box', 'front_panel_interfaces'), ('port', 'et1')]
+    >>> index.query_point(1150, 680, tolerance=25)
+    [('connection', 'fpga.mux->et1')]
+    >>> index.query_point(300, 800, tolerance=25)
+    []
+    >>> index.query_rect((900, 600, 200, 200))
+    [('app', 'fpga.mux'), ('connection', 'fpga.mux->et1')]
+    >>> SpatialIndex.from_dict(index.to_dict()).query_point(1100, 800)
+    [('app', 'fpga.mux')]
+
+    Fanout buses and bundles are indexed like any other connection:
+
+    >>> from switch_config_render.generate_svg import build_system_canvas
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> system = get_synthetic_system(8)
+    >>> system["connections"] = {"ap1": "et1", "ap5": "et1", "ap3": "et3", "ap4": "et4"}
+    >>> for itf in ("et3", "et4", "ap3", "ap4"):
+    ...     system["interfaces"][itf].update(receives="type_a", drives="type_a")
+    >>> canvas = build_system_canvas(fanout_threshold=2, bundle_tolerance=300, **system)
+    >>> sorted(set(path.split()[1][0] for _, _, _, _, path in canvas.layout.connections))
+    ['C', 'Q', 'V']
+    >>> index = build_spatial_index(canvas.layout)
+    >>> [item for item in index.query_rect((0, 0, canvas.layout.width, 1000))
+    ...  if item[0] == "connection"]
+    [('connection', 'et1->ap1'), ('connection', 'et1->ap5'), ('connection', 'et3->ap3'), ('connection', 'et4->ap4')]
+    """
+
+    __slots__ = ("cell_size", "items", "cells")
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        # `(kind, id, rect, polylines)` per item, where only connections
+        # have polylines
+        self.items = []
+        self.cells = {}
+
+    def get_cell_range(self, rect):
+        x, y, width, height = rect
+        size = self.cell_size
+        return (
+            int(x // size),
+            int(y // size),
+            int((x + width) // size),
+            int((y + height) // size),
+        )
+
+    def add(self, kind, item_id, rect, polylines=None):
+        idx = len(self.items)
+        self.items.append((kind, item_id, rect, polylines))
+        min_col, min_row, max_col, max_row = self.get_cell_range(rect)
+        for col in range(min_col, max_col + 1):
+            for row in range(min_row, max_row + 1):
+                self.cells.setdefault((col, row), []).append(idx)
+
+    def add_connection(self, item_id, d):
+        polylines = get_path_polylines(d)
+        self.add("connection", item_id, get_polylines_bounds(polylines), polylines)
+
+    def get_candidates(self, rect):
+        min_col, min_row, max_col, max_row = self.get_cell_range(rect)
+        candidates = set()
+        for col in range(min_col, max_col + 1):
+            for row in range(min_row, max_row + 1):
+                candidates.update(self.cells.get((col, row), ()))
+        return sorted(candidates)
+
+    def query_point(self, x, y, tolerance=0):
+        """
+        Gets the items at `(x, y)`. Connections match within `tolerance`
+        of their path, e.g. half their stroke width.
+        """
+        query = (x - tolerance, y - tolerance, 2 * tolerance, 2 * tolerance)
+        matches = []
+        for idx in self.get_candidates(query):
+            kind, item_id, rect, polylines = self.items[idx]
+            if polylines is None:
+                if rect[0] <= x <= rect[0] + rect[2] and rect[1] <= y <= rect[1] + rect[3]:
+                    matches.append((kind, item_id))
+            elif rects_intersect(rect, query) and any(
+                get_segment_distance((x, y), start, end) <= tolerance
+                for polyline in polylines
+                for start, end in zip(polyline, polyline[1:])
+            ):
+                matches.append((kind, item_id))
+        return matches
+
+    def query_rect(self, rect):
+        """Gets the items that overlap the `(x, y, width, height)` rect"""
+        matches = []
+        for idx in self.get_candidates(rect):
+            kind, item_id, item_rect, polylines = self.items[idx]
+            if not rects_intersect(item_rect, rect):
+                continue
+            if polylines is None or any(
+                segment_intersects_rect(start, end, rect)
+                for polyline in polylines
+                for start, end in zip(polyline, polyline[1:])
+            ):
+                matches.append((kind, item_id))
+        return matches
+
+    def to_dict(self):
+        """
+        Returns a JSON serialisable description of the index, to be stored
+        next to the rendered diagram. The grid itself is rebuilt on load.
+        """
+        return {
+            "cell_size": self.cell_size,
+            "items": [
+                {"kind": kind, "id": item_id, "rect": list(rect), "polylines": polylines}
+                for kind, item_id, rect, polylines in self.items
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(data["cell_size"])
+        for item in data["items"]:
+            polylines = item["polylines"]
+            if polylines is not None:
+                polylines = [[tuple(point) for point in polyline] for polyline in polylines]
+            index.add(item["kind"], item["id"], tuple(item["rect"]), polylines)
+        return index
+
+
+def build_spatial_index(layout, cell_size=DEFAULT_CELL_SIZE):
+    """
+    Indexes the boxes, ports, apps and connections of a layout, in the
+    order in which they are drawn
+    """
+    index = SpatialIndex(cell_size)
+    for box_id, rect in layout.boxes.items():
+        index.add("box", box_id, rect)
+    for itf, (_, rect) in layout.ports.items():
+        index.add("port", itf, rect)
+    for app, rect in layout.apps.items():
+        index.add("app", app, rect)
+    for dst, src, _, _, path in layout.connections:
+        index.add_connection("{}->{}".format(src, dst), path)
+    return index
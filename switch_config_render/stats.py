@@ -0,0 +1,87 @@
+import json
+import xml.etree.ElementTree as etree
+
+
+class RenderStats(object):
+    """
+    Element counts and serialised sizes of a rendered SVG document, per
+    logical group. The groups are:
+
+    * `background` and `defs`: the background and the arrowhead markers
+    * `front_panel`: the front panel box and its interfaces
+    * `fpga:<fpga>`: an FPGA box and its application interfaces
+    * `app:<fpga>.<app>`: an application drawn on an FPGA
+    * `cross_connects`: the connections between interfaces
+    * `app_links:<fpga>`: the connections between interfaces and apps
+    * `onchip_links:<fpga>`: the on-chip connections within an FPGA
+    * `interchip_links`: the on-chip connections between FPGAs
+    * `legend`: the connection type legend
+
+    Element counts include all nested elements. `total_bytes` is the size
+    of the whole document, which also includes the XML header and the
+    enclosing elements that are not part of any group.
+    """
+
+    __slots__ = ("groups", "total_elements", "total_bytes")
+
+    def __init__(self):
+        self.groups = {}
+        self.total_elements = 0
+        self.total_bytes = 0
+
+    def add(self, group, elements, size):
+        group_stats = self.groups.setdefault(group, {"elements": 0, "bytes": 0})
+        group_stats["elements"] += elements
+        group_stats["bytes"] += size
+
+    def to_dict(self):
+        return {
+            "groups": self.groups,
+            "total_elements": self.total_elements,
+            "total_bytes": self.total_bytes,
+        }
+
+    def write_json(self, filename):
+        with open(filename, "w") as fileobj:
+            json.dump(self.to_dict(), fileobj, indent=2, sort_keys=True)
+
+
+def count_elements(element):
+    return 1 + sum(count_elements(child) for child in getattr(element, "elements", []))
+
+
+def collect_render_stats(canvas, document):
+    """
+    Collects the `RenderStats` of the canvas. `document` is the serialised
+    SVG document of the canvas.
+
+    >>> import io
+    >>> from switch_config_render.generate_svg import build_system_canvas
+    >>> from switch_config_render._examples.synthetic import get_synthetic_system
+    >>> canvas = build_system_canvas(**get_synthetic_system(8))
+    >>> document = canvas.drawing.tostring()
+    >>> stats = collect_render_stats(canvas, document)
+    >>> sorted(stats.groups)[:6]
+    ['app:fpga_0.app_0', 'app:fpga_1.app_0', 'app_links:fpga_0', 'app_links:fpga_1', 'background', 'cross_connects']
+    >>> stats.groups["cross_connects"]["elements"]
+    8
+    >>> sum(group["bytes"] for group in stats.groups.values()) < stats.total_bytes
+    True
+    """
+    stats = RenderStats()
+
+    def add(element, default_group):
+        group = canvas.element_groups.get(id(element), default_group)
+        size = len(etree.tostring(element.get_xml(), encoding="utf-8"))
+        stats.add(group, count_elements(element), size)
+
+    for element in canvas.drawing.elements:
+        if element is canvas.connections:
+            for connection in element.elements:
+                add(connection, "cross_connects")
+        else:
+            add(element, "other")
+
+    stats.total_elements = count_elements(canvas.drawing)
+    stats.total_bytes = len(document.encode("utf-8"))
+    return stats
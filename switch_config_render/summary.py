@@ -0,0 +1,83 @@
+from switch_config_render.utils import get_connection_types
+
+
+class SystemSummary(object):
+    """
+    Counts describing a system without laying it out. `connection_types`
+    maps the types of the connections onto the number of connections of
+    those types.
+    """
+
+    __slots__ = (
+        "front_panel_ports",
+        "app_ports",
+        "fpgas",
+        "apps",
+        "connections",
+        "connection_types",
+    )
+
+    def __init__(self):
+        self.front_panel_ports = 0
+        self.app_ports = 0
+        self.fpgas = 0
+        self.apps = 0
+        self.connections = 0
+        self.connection_types = {}
+
+    def to_dict(self):
+        return {
+            "front_panel_ports": self.front_panel_ports,
+            "app_ports": self.app_ports,
+            "fpgas": self.fpgas,
+            "apps": self.apps,
+            "connections": self.connections,
+            "connection_types": [
+                {"types": list(types), "count": count}
+                for types, count in sorted(self.connection_types.items())
+            ],
+        }
+
+
+def summarize_system(interfaces, connections, fpga_apps, dominant_type=None):
+    """
+    Summarises a system in one linear pass over its interfaces, apps and
+    connections. Connections with an endpoint missing from `interfaces`
+    are counted with empty types.
+
+    >>> interfaces = {
+    ...     'et1': {'receives': 'a', 'drives': 'a'},
+    ...     'et2': {'receives': 'a'},
+    ...     'ap1': {'receives': 'a', 'drives': 'a'},
+    ... }
+    >>> summary = summarize_system(
+    ...     interfaces,
+    ...     {'ap1': 'et1', 'et1': 'ap1', 'et2': 'ap1', 'et3': 'ap1'},
+    ...     {'fpga': {'app': {'type': 'mux', 'ports': ['ap1']}}})
+    >>> summary.front_panel_ports, summary.app_ports, summary.apps
+    (2, 1, 1)
+    >>> sorted(summary.connection_types.items())
+    [((), 2), (('a',), 2)]
+    """
+    summary = SystemSummary()
+
+    for itf in interfaces:
+        if itf.startswith("et"):
+            summary.front_panel_ports += 1
+        elif itf.startswith("ap"):
+            summary.app_ports += 1
+
+    summary.fpgas = len(fpga_apps)
+    for apps in fpga_apps.values():
+        summary.apps += len(apps)
+
+    for dst, src in connections.items():
+        types = ()
+        if dst in interfaces and src in interfaces:
+            types = get_connection_types(
+                interfaces, dst, src, bidir=False, dominant_type=dominant_type
+            )
+        summary.connections += 1
+        summary.connection_types[types] = summary.connection_types.get(types, 0) + 1
+
+    return summary
@@ -0,0 +1,147 @@
+import hashlib
+import xml.etree.ElementTree as etree
+
+import svgwrite
+
+from switch_config_render.budget import DEGRADATION_NONE
+
+XML_HEADER = '<?xml version="1.0" encoding="utf-8" ?>\n'
+
+
+class PrebuiltElement(object):
+    """
+    Wraps an SVG element that never changes once built, so that its XML is
+    only built and validated once, no matter how many drawings it is added
+    to. The wrapped element must not be modified afterwards.
+    """
+
+    __slots__ = ("elementname", "elements", "xml")
+
+    def __init__(self, element):
+        self.elementname = element.elementname
+        self.elements = element.elements
+        self.xml = element.get_xml()
+
+    def get_xml(self):
+        return self.xml
+
+
+class DocumentTemplate(object):
+    """
+    The parts of a rendered document that do not depend on the system: the
+    arrowhead markers, an optional CSS `style` block and the background.
+    They are built once and shared by every drawing started from the
+    template, so starting a new drawing or `Canvas` takes constant time.
+
+    A template is never modified after it is built, so it can be shared
+    between threads. `fingerprint` is a SHA-256 digest of the XML of its
+    parts, which content hashes include (see `switch_config_render.digest`).
+
+    >>> template = DocumentTemplate(style="text { font-family: monospace }")
+    >>> canvas = template.new_canvas(100, 50)
+    >>> canvas.drawing.tostring() == template.new_canvas(100, 50).drawing.tostring()
+    True
+    >>> [element.elementname for element in canvas.drawing.defs.elements]
+    ['marker', 'marker', 'style']
+    >>> canvas.drawing.elements[1] is template.new_drawing(200, 100).elements[1]
+    True
+    >>> template.fingerprint == DocumentTemplate(style="text { font-family: monospace }").fingerprint
+    True
+    >>> template.fingerprint == DEFAULT_TEMPLATE.fingerprint
+    False
+    """
+
+    __slots__ = ("end_marker", "start_marker", "defs", "background", "fingerprint")
+
+    def __init__(self, style=None, background="white"):
+        factory = svgwrite.Drawing(debug=True)
+
+        # The markers are given fixed ids, as svgwrite would otherwise number
+        # them from a process-wide counter
+        self.end_marker = factory.marker(
+            id="end_arrow", insert=(5, 3), size=(6, 6), orient="auto"
+        )
+        self.end_marker.add(
+            factory.path(["M1,1", "L1,5", "L5,3", "L1,1"], fill="black")
+        )
+        self.start_marker = factory.marker(
+            id="start_arrow", insert=(1, 3), size=(6, 6), orient="auto"
+        )
+        self.start_marker.add(
+            factory.path(["M1,3", "L5,5", "L5,1", "L1,3"], fill="black")
+        )
+
+        defs = [self.end_marker, self.start_marker]
+        if style is not None:
+            defs.append(factory.style(style))
+        self.defs = tuple(PrebuiltElement(element) for element in defs)
+
+        self.background = None
+        if background is not None:
+            self.background = PrebuiltElement(
+                factory.rect(
+                    insert=(0, 0),
+                    size=("100%", "100%"),
+                    rx=None,
+                    ry=None,
+                    fill=background,
+                )
+            )
+
+        parts = self.defs + ((self.background,) if self.background else ())
+        self.fingerprint = hashlib.sha256(
+            b"".join(etree.tostring(part.xml) for part in parts)
+        ).hexdigest()
+
+    def add_defs(self, drawing):
+        for element in self.defs:
+            drawing.defs.add(element)
+
+    def new_drawing(self, width, height, **extra):
+        """
+        Starts a drawing of `width` by `height` points, at 10 points per
+        millimeter, with the background of the template. `extra` holds
+        additional attributes of the SVG element.
+        """
+        drawing = svgwrite.Drawing(
+            debug=True,
+            size=("{}mm".format(str(width / 10)), "{}mm".format(str(height / 10))),
+            viewBox=("0 0 {} {}".format(width, height)),
+            **extra
+        )
+        if self.background is not None:
+            drawing.add(self.background)
+        return drawing
+
+    def new_canvas(
+        self,
+        width,
+        height,
+        degradation=DEGRADATION_NONE,
+        deadline=None,
+        timer=None,
+        **extra
+    ):
+        """
+        Starts a `Canvas` on a new drawing (see `new_drawing`), with the
+        layout size set
+        """
+        # Imported here, as the canvas module uses the default template
+        from switch_config_render.canvas import Canvas
+
+        drawing = self.new_drawing(width, height, **extra)
+        canvas = Canvas(
+            drawing,
+            degradation=degradation,
+            deadline=deadline,
+            template=self,
+            timer=timer,
+        )
+        if self.background is not None:
+            canvas.element_groups[id(self.background)] = "background"
+        canvas.layout.width = width
+        canvas.layout.height = height
+        return canvas
+
+
+DEFAULT_TEMPLATE = DocumentTemplate()
@@ -1,4 +1,14 @@
 
+def format_point(point):
+    """
+    Formats a point for use in SVG path data
+
+    >>> format_point((1, 2.5))
+    '1,2.5'
+    """
+    return "{},{}".format(str(point[0]), str(point[1]))
+
+
 def get_idx(prefix, itf):
     """
     Gets the index of an interface string
@@ -21,7 +31,7 @@ def get_sorted_itfs(itfs, prefix):
     ['ap12', 'ap21']
     """
     itfs = [itf for itf in itfs if itf.startswith(prefix)]
-    return sorted(itfs, key=lambda x: get_idx(prefix, x))
+    return sorted(itfs, key=lambda x: (get_idx(prefix, x), x))
 
 
 def get_average_itf_idx(itfs, prefix):
@@ -84,3 +94,59 @@ def get_connection_types(itfs, dst, src, bidir, dominant_type=None):
         return (dominant_type,)
 
     return tuple(sorted(driving_types & receiving_types))
+
+
+def split_clusters(items, key, tolerance):
+    """
+    Splits `items` into clusters of items whose `key` lies within
+    `tolerance` of the smallest key of their cluster, walking the items in
+    order of their key
+
+    >>> split_clusters([5, 190, 210, 420, 400], lambda x: x, 200)
+    [[5, 190], [210, 400], [420]]
+    """
+    clusters = []
+    start = None
+    for item in sorted(items, key=key):
+        if start is None or key(item) - start > tolerance:
+            clusters.append([])
+            start = key(item)
+        clusters[-1].append(item)
+    return clusters
+
+
+def get_corridor_bundles(connections, tolerance):
+    """
+    Groups connections that run between similar x-ranges and have the same
+    types, so that they can share a corridor. `connections` is a list of
+    `(types, src_x, dst_x, connection)` tuples. Connections fall into the
+    same bundle if their types match and both their source and their
+    destination x coordinates lie within `tolerance` of each other. Returns
+    the bundles as lists of connections, ordered by types and position.
+
+    Connections are clustered by sorting them, so bundling is O(n log n) in
+    the number of connections.
+
+    >>> get_corridor_bundles([
+    ...     (('a',), 110, 900, 'x'),
+    ...     (('a',), 150, 990, 'y'),
+    ...     (('b',), 120, 950, 'z'),
+    ...     (('a',), 120, 1500, 'w'),
+    ...     (('a',), 190, 1050, 'v'),
+    ... ], tolerance=200)
+    [['x', 'y', 'v'], ['w'], ['z']]
+    """
+    by_types = {}
+    for types, src_x, dst_x, connection in connections:
+        by_types.setdefault(types, []).append((src_x, dst_x, connection))
+
+    bundles = []
+    for types in sorted(by_types):
+        type_bundles = []
+        for src_cluster in split_clusters(
+            by_types[types], lambda conn: conn[0], tolerance
+        ):
+            type_bundles += split_clusters(src_cluster, lambda conn: conn[1], tolerance)
+        type_bundles.sort(key=lambda bundle: (bundle[0][0], bundle[0][1]))
+        bundles += [[conn[2] for conn in bundle] for bundle in type_bundles]
+    return bundles